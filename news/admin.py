@@ -1,7 +1,30 @@
 from django.contrib import admin
-from .models import Category, Post, PostCategory, Subscription
+
+from . import services
+from .forms import PostAdminForm
+from .models import Category, CensoredWord, Counter, DigestRun, OutboxMessage, Post, PostCategory, Subscription
 
 admin.site.register(Category)
-admin.site.register(Post)
 admin.site.register(PostCategory)
-admin.site.register(Subscription)
\ No newline at end of file
+admin.site.register(Subscription)
+admin.site.register(DigestRun)
+admin.site.register(CensoredWord)
+admin.site.register(Counter)
+admin.site.register(OutboxMessage)
+
+
+@admin.register(Post)
+class PostAdmin(admin.ModelAdmin):
+    form = PostAdminForm
+
+    def save_model(self, request, obj, form, change):
+        categories = form.cleaned_data['categories']
+        if change:
+            services.update_post(obj, categories)
+        else:
+            services.publish([(obj, categories)], author=obj.author or request.user)
+
+    def save_related(self, request, form, formsets, change):
+        # Категории уже сохранены services с сигналами счетчиков и лент; save_m2m их обошел бы
+        for formset in formsets:
+            self.save_formset(request, form, formset, change=change)
@@ -0,0 +1,107 @@
+# news/async_views.py
+"""Асинхронные версии публичных страниц для развертывания через ASGI.
+
+Данные загружаются async ORM и async API кеша прямо в цикле событий,
+в поток через sync_to_async уходят только рендеринг шаблона (теги cache,
+фильтр censor и контекстные процессоры синхронные) и запрос к индексу
+полнотекстового поиска. Шаблоны и ключи кеша страниц общие с news.views.
+Подключаются в news/urls.py при NEWS_ASYNC_VIEWS = True.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render
+from django.views.decorators.cache import cache_control
+
+from . import counters
+from .cache import (
+    LIST_VERSION, RANKING_VERSION, acondition, alist_etag, alist_last_modified, anonymous_page_cache, apost_etag,
+    apost_last_modified, arequest_user, post_version,
+)
+from .forms import NewsSearchForm
+from .models import Category, Counter, Post, Subscription
+from .pageviews import count_views
+from .pagination import CursorPaginator, RankedPaginator
+from .search import get_backend as get_search_backend
+from .views import post_cards, related_posts
+
+arender = sync_to_async(render)
+
+
+@cache_control(no_cache=True)
+@acondition(etag_func=alist_etag, last_modified_func=alist_last_modified)
+@anonymous_page_cache(lambda request: [LIST_VERSION, RANKING_VERSION])
+async def news_list(request):
+    count = await Counter.objects.filter(key=counters.POSTS_TOTAL).values_list('value', flat=True).afirst()
+    paginator = CursorPaginator(post_cards(), 10, count=count or 0)
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+    return await arender(request, 'news/news_list.html', {
+        'page_obj': page_obj,
+        'cache_timeout': settings.NEWS_CACHE_TIMEOUT,
+    })
+
+
+@count_views(lambda request, news_id: news_id)
+@cache_control(no_cache=True)
+@acondition(etag_func=apost_etag, last_modified_func=apost_last_modified)
+@anonymous_page_cache(lambda request, news_id: [post_version(news_id)])
+async def news_detail(request, news_id):
+    try:
+        news = await Post.objects.select_related('author').aget(id=news_id)
+    except Post.DoesNotExist:
+        raise Http404('Публикация не найдена')
+    return await arender(request, 'news/news_detail.html', {
+        'news': news,
+        'related_posts': [item async for item in related_posts(news_id)],
+        'cache_timeout': settings.NEWS_CACHE_TIMEOUT,
+    })
+
+
+async def news_search(request):
+    form = NewsSearchForm(request.GET or None)
+    news_items = post_cards().order_by('-pub_date')
+    ranked_ids = None
+
+    if form.is_valid():
+        title = form.cleaned_data.get('title')
+        author = form.cleaned_data.get('author')
+        date_after = form.cleaned_data.get('date_after')
+
+        if author:
+            news_items = news_items.filter(author__username__icontains=author)
+        if date_after:
+            news_items = news_items.filter(pub_date__gte=date_after)
+        if title:
+            ranked_ids = await sync_to_async(get_search_backend().search)(
+                title, limit=settings.NEWS_SEARCH_MAX_RESULTS, posts=news_items if author or date_after else None,
+            )
+
+    if ranked_ids is not None:
+        paginator = RankedPaginator(ranked_ids, 10, fetch=post_cards().ain_bulk)
+    else:
+        paginator = CursorPaginator(news_items, 10, with_count=settings.NEWS_PAGINATOR_EXACT_COUNT)
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+
+    return await arender(request, 'news/news_search.html', {
+        'form': form,
+        'page_obj': page_obj,
+        'search_performed': bool(request.GET)
+    })
+
+
+async def category_list(request):
+    """Список всех категорий с информацией о подписках"""
+    categories = [category async for category in Category.objects.all()]
+
+    user_subscriptions = []
+    user = await arequest_user(request)
+    if user.is_authenticated:
+        user_subscriptions = [
+            category_id async for category_id
+            in Subscription.objects.filter(user=user).values_list('category_id', flat=True)
+        ]
+
+    return await arender(request, 'news/category_list.html', {
+        'categories': categories,
+        'user_subscriptions': user_subscriptions,
+    })
@@ -0,0 +1,235 @@
+# news/benchmarks.py
+"""Микро-бенчмарки представлений, задач и фильтров.
+
+Каждый сценарий - функция без аргументов, которую измеряют несколько раз
+подряд. Результаты сохраняются в JSON (см. команду benchmark), чтобы
+сравнивать прогоны между коммитами и ловить регрессии по медиане.
+"""
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+
+from celery import current_app
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import compression
+from .censor import get_engine
+from .models import Post, Subscription
+from .tasks import send_new_post_notification, send_weekly_digest
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rollback():
+    """Выполняет блок в транзакции и откатывает все изменения"""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+@contextmanager
+def benchmark_environment():
+    """Письма в память, задачи Celery синхронно, тестовый хост разрешен"""
+    eager = current_app.conf.task_always_eager
+    current_app.conf.task_always_eager = True
+    try:
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            ALLOWED_HOSTS=['*'],
+        ):
+            yield
+    finally:
+        current_app.conf.task_always_eager = eager
+
+
+def _get(client, url, params=None):
+    def run():
+        response = client.get(url, params or {})
+        if response.status_code != 200:
+            raise RuntimeError(f'{url}: статус {response.status_code}')
+    return run
+
+
+def build_cases(search_query='новость'):
+    """Сценарии на данных текущей базы: {имя: функция}"""
+    post = Post.objects.order_by('-pub_date', '-id').first()
+    if post is None:
+        raise ValueError('В базе нет публикаций, сначала выполните seed_data')
+    # Для уведомления берем публикацию с наибольшим числом подписчиков среди последних
+    recent_ids = list(Post.objects.order_by('-pub_date').values_list('id', flat=True)[:100])
+    notified_post = (
+        Post.objects.filter(id__in=recent_ids)
+        .annotate(subscribers=Count('postcategory__category__subscription'))
+        .order_by('-subscribers')
+        .first()
+    )
+    subscriber = Subscription.objects.select_related('user').first()
+
+    anonymous = Client()
+    cases = {
+        'news_list': _get(anonymous, reverse('news_list')),
+        'news_detail': _get(anonymous, reverse('news_detail', args=[post.id])),
+        'news_search': _get(anonymous, reverse('news_search'), {'title': search_query}),
+    }
+    if subscriber:
+        member = Client()
+        member.force_login(subscriber.user)
+        cases['category_list'] = _get(member, reverse('category_list'))
+
+    texts = list(Post.objects.order_by('-pub_date').values_list('content', flat=True)[:100])
+    engine = get_engine()
+    cases['censor_filter'] = lambda: [engine.censor(text) for text in texts]
+
+    def notification():
+        with rollback():
+            send_new_post_notification(notified_post.id)
+
+    def digest():
+        with rollback():
+            send_weekly_digest()
+
+    cases['task_new_post_notification'] = notification
+    cases['task_weekly_digest'] = digest
+    return cases
+
+
+def measure(func, iterations, warmup=1, warm_cache=False):
+    """Возвращает время выполнения каждой итерации в миллисекундах"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        if not warm_cache:
+            cache.clear()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        'iterations': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'p95': p95,
+        'mean': statistics.fmean(ordered),
+    }
+
+
+def run(names=None, iterations=20, warmup=1, warm_cache=False, search_query='новость'):
+    """Запускает сценарии и возвращает результаты для сохранения в JSON"""
+    results = {}
+    with benchmark_environment():
+        cases = build_cases(search_query)
+        for name, func in cases.items():
+            if names and name not in names:
+                continue
+            results[name] = summarize(measure(func, iterations, warmup, warm_cache))
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'iterations': iterations,
+            'warm_cache': warm_cache,
+            'posts': Post.objects.count(),
+        },
+        'results': results,
+    }
+
+
+def _cpu_ms(func, iterations):
+    """Медиана процессорного времени одного вызова в миллисекундах"""
+    timings = []
+    for _ in range(iterations):
+        started = time.process_time()
+        func()
+        timings.append((time.process_time() - started) * 1000)
+    return statistics.median(timings)
+
+
+def compression_report(iterations=50):
+    """Байты на ответ и процессорное время сжатия для news_list и news_detail
+
+    Для каждой страницы и варианта ответа: размер тела, доля от исходного
+    HTML, процессорное время на ответ (минификация и сжатие на лету) и
+    на заполнение кеша (сжатие с уровнями STORED_LEVELS один раз, попадания
+    в кеш отдают готовый вариант и ничего не сжимают).
+    """
+    post = Post.objects.order_by('-pub_date', '-id').first()
+    if post is None:
+        raise ValueError('В базе нет публикаций, сначала выполните seed_data')
+    pages = {'news_list': reverse('news_list'), 'news_detail': reverse('news_detail', args=[post.id])}
+    client = Client()
+    rows = []
+    with benchmark_environment():
+        for page, url in pages.items():
+            cache.clear()
+            with override_settings(NEWS_HTML_MINIFY=False):
+                raw = client.get(url).content
+            html = raw.decode()
+            minified = compression.minify_html(html).encode()
+            minify_ms = _cpu_ms(lambda: compression.minify_html(html), iterations)
+
+            def row(mode, body, cpu_ms, fill_ms):
+                return {
+                    'page': page, 'mode': mode, 'bytes': len(body), 'ratio': len(body) / len(raw),
+                    'cpu_ms': cpu_ms, 'fill_ms': fill_ms,
+                }
+
+            rows.append(row('identity', raw, 0.0, 0.0))
+            rows.append(row('minify', minified, minify_ms, minify_ms))
+            for encoding in compression.encodings():
+                dynamic_ms = _cpu_ms(lambda: compression.compress(minified, encoding), iterations)
+                stored_level = compression.STORED_LEVELS[encoding]
+                stored_ms = _cpu_ms(lambda: compression.compress(minified, encoding, stored_level), iterations)
+                rows.append(row(
+                    f'{encoding}-{compression.DYNAMIC_LEVELS[encoding]}', compression.compress(minified, encoding),
+                    minify_ms + dynamic_ms, minify_ms + dynamic_ms,
+                ))
+                # Ответ из кеша: сжатие оплачено при заполнении, на ответ - только выбор варианта
+                rows.append(row(
+                    f'{encoding}-{stored_level} (кеш)', compression.compress(minified, encoding, stored_level),
+                    0.0, minify_ms + stored_ms,
+                ))
+    return rows
+
+
+def compare(results, baseline, threshold=0.2, metric='median'):
+    """Сценарии, которые стали медленнее базового прогона больше чем на threshold
+
+    Возвращает список (имя, базовое значение, новое значение, изменение).
+    """
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous.get(metric):
+            continue
+        change = current[metric] / previous[metric] - 1
+        if change > threshold:
+            regressions.append((name, previous[metric], current[metric], change))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
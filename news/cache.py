@@ -0,0 +1,317 @@
+# news/cache.py
+"""Кеширование публичных страниц.
+
+Версии хранятся в кеше под ключами version:<имя>: version:list для всех
+списков публикаций и version:post:<id> для отдельной публикации. Ключи
+закешированных страниц включают текущие версии, поэтому при изменении
+публикации сигналы увеличивают только ее версию и версию списков, а старые
+записи просто перестают использоваться и вытесняются по таймауту.
+Фрагменты шаблонов (карточка и текст публикации) удаляются точечно.
+
+Отсутствующая версия (ключ вытеснен или кеш перезапущен) создается заново
+из текущего времени в наносекундах, а не с единицы: номера, под которыми
+закешированы старые страницы, не повторяются, и устаревшие записи не
+оживают.
+
+Сброс видят все процессы только при общем кеше (Redis через
+REDIS_CACHE_URL или файловый через CACHE_DIR). LocMemCache по умолчанию -
+отдельный кеш в каждом процессе: изменение публикации сбрасывает страницы
+только процесса, который ее сохранил, остальные отдают свои копии до
+истечения NEWS_CACHE_TIMEOUT. Он годится для разработки и одного процесса.
+
+Для условных GET-запросов рядом с версиями хранится время последнего
+изменения: modified:list обновляется сигналами, а modified:post:<id> - это
+закешированное Post.updated_at, которое сбрасывается при изменении поста.
+
+Функции с префиксом a - асинхронные варианты для представлений из
+news.async_views: они используют async API кеша и ORM.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .compression import prepare
+from .groups import get_group_names
+from .metrics import record_cache
+
+LIST_VERSION = 'list'
+# Рейтинг «Самое читаемое» выводится в списке публикаций (pageviews.flush)
+RANKING_VERSION = 'ranking'
+FRAGMENTS = ('post_card', 'post_body')
+
+
+def post_version(post_id):
+    return f'post:{post_id}'
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _new_version():
+    # Больше любой версии, выданной до вытеснения: прежние версии начинались
+    # с более раннего времени и росли на единицу
+    return time.time_ns()
+
+
+def get_versions(names):
+    """Возвращает текущие версии для списка имен одним обращением к кешу"""
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+async def aget_versions(names):
+    keys = [_version_key(name) for name in names]
+    found = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump_versions(names):
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.set(_version_key(name), _new_version(), None)
+
+
+def invalidate_post(post_id):
+    """Сбрасывает кеш страницы и фрагментов публикации и всех списков"""
+    cache.delete_many([
+        *(make_template_fragment_key(name, [post_id]) for name in FRAGMENTS),
+        _modified_key(post_version(post_id)),
+    ])
+    cache.set(_modified_key(LIST_VERSION), timezone.now(), None)
+    bump_versions([post_version(post_id), LIST_VERSION])
+
+
+def invalidate_lists():
+    """Сбрасывает кеш списков после массового добавления публикаций"""
+    cache.set(_modified_key(LIST_VERSION), timezone.now(), None)
+    bump_versions([LIST_VERSION])
+
+
+def invalidate_rankings():
+    """Сбрасывает кеш страниц с блоком «Самое читаемое» после пересчета рейтинга"""
+    cache.set(_modified_key(LIST_VERSION), timezone.now(), None)
+    bump_versions([RANKING_VERSION])
+
+
+def _modified_key(name):
+    return f'modified:{name}'
+
+
+def get_list_last_modified():
+    """Время последнего изменения любой публикации"""
+    return cache.get_or_set(_modified_key(LIST_VERSION), timezone.now, None)
+
+
+def get_post_last_modified(post_id):
+    """Post.updated_at из кеша; None, если публикации нет"""
+    from .models import Post
+
+    key = _modified_key(post_version(post_id))
+    updated_at = cache.get(key)
+    if updated_at is None:
+        updated_at = Post.objects.filter(pk=post_id).values_list('updated_at', flat=True).first()
+        if updated_at is not None:
+            cache.set(key, updated_at, None)
+    return updated_at
+
+
+async def aget_list_last_modified():
+    key = _modified_key(LIST_VERSION)
+    modified = await cache.aget(key)
+    if modified is None:
+        modified = timezone.now()
+        if not await cache.aadd(key, modified, None):
+            modified = await cache.aget(key)
+    return modified
+
+
+async def aget_post_last_modified(post_id):
+    from .models import Post
+
+    key = _modified_key(post_version(post_id))
+    updated_at = await cache.aget(key)
+    if updated_at is None:
+        updated_at = await Post.objects.filter(pk=post_id).values_list('updated_at', flat=True).afirst()
+        if updated_at is not None:
+            await cache.aset(key, updated_at, None)
+    return updated_at
+
+
+async def arequest_user(request):
+    """Пользователь запроса через async API
+
+    Загруженный пользователь записывается в request.user, чтобы шаблоны,
+    которые рендерятся в потоке, не загружали его повторно.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+def _user_marker(request, group_names=None):
+    """Часть ETag, зависящая от пользователя: id и группы (от них зависят кнопки автора)"""
+    if not request.user.is_authenticated:
+        return 'a'
+    if group_names is None:
+        group_names = get_group_names(request.user)
+    return f'u{request.user.pk}-{hashlib.md5(",".join(sorted(group_names)).encode()).hexdigest()[:8]}'
+
+
+async def _auser_marker(request):
+    if not request.user.is_authenticated:
+        return 'a'
+    return _user_marker(request, await sync_to_async(get_group_names)(request.user))
+
+
+def list_etag(request):
+    version, ranking = get_versions([LIST_VERSION, RANKING_VERSION])
+    return f'list-{version}-{ranking}-{_user_marker(request)}'
+
+
+def list_last_modified(request):
+    # Для авторизованных страница зависит от пользователя, сравниваем только ETag
+    if request.user.is_authenticated:
+        return None
+    return get_list_last_modified()
+
+
+def post_etag(request, news_id):
+    if get_post_last_modified(news_id) is None:
+        return None
+    version, = get_versions([post_version(news_id)])
+    return f'post-{news_id}-{version}-{_user_marker(request)}'
+
+
+def post_last_modified(request, news_id):
+    if request.user.is_authenticated:
+        return None
+    return get_post_last_modified(news_id)
+
+
+async def alist_etag(request):
+    await arequest_user(request)
+    version, ranking = await aget_versions([LIST_VERSION, RANKING_VERSION])
+    return f'list-{version}-{ranking}-{await _auser_marker(request)}'
+
+
+async def alist_last_modified(request):
+    if (await arequest_user(request)).is_authenticated:
+        return None
+    return await aget_list_last_modified()
+
+
+async def apost_etag(request, news_id):
+    await arequest_user(request)
+    if await aget_post_last_modified(news_id) is None:
+        return None
+    version, = await aget_versions([post_version(news_id)])
+    return f'post-{news_id}-{version}-{await _auser_marker(request)}'
+
+
+async def apost_last_modified(request, news_id):
+    if (await arequest_user(request)).is_authenticated:
+        return None
+    return await aget_post_last_modified(news_id)
+
+
+def acondition(etag_func=None, last_modified_func=None):
+    """Аналог django.views.decorators.http.condition для async-представлений
+
+    Стандартный декоратор вызывает etag_func и last_modified_func
+    синхронно, а им нужны кеш и ORM, поэтому здесь они - корутины.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            last_modified = None
+            if last_modified_func:
+                modified = await last_modified_func(request, *args, **kwargs)
+                if modified:
+                    last_modified = int(modified.timestamp())
+            etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            etag = quote_etag(etag) if etag is not None else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def anonymous_page_cache(version_names):
+    """Кеширует целиком ответы GET для анонимных пользователей
+
+    version_names(request, *args, **kwargs) возвращает имена версий,
+    от которых зависит страница. В кеш попадает уже минифицированный ответ
+    с готовыми сжатыми вариантами (compression.prepare).
+    """
+    def page_key(request, view, versions):
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f'page:{view.__name__}:{"-".join(map(str, versions))}:{path_hash}'
+
+    def cacheable(response):
+        return response.status_code == 200 and not response.streaming and not response.cookies
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or (await arequest_user(request)).is_authenticated:
+                    return await view(request, *args, **kwargs)
+
+                key = page_key(request, view, await aget_versions(version_names(request, *args, **kwargs)))
+                response = await cache.aget(key)
+                record_cache(response is not None)
+                if response is not None:
+                    return response
+
+                response = await view(request, *args, **kwargs)
+                if cacheable(response):
+                    await cache.aset(key, prepare(response), settings.NEWS_CACHE_TIMEOUT)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, view, get_versions(version_names(request, *args, **kwargs)))
+            response = cache.get(key)
+            record_cache(response is not None)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            if cacheable(response):
+                cache.set(key, prepare(response), settings.NEWS_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,168 @@
+# news/censor.py
+"""Движок фильтра censor.
+
+Словарь запрещенных слов компилируется один раз в регулярное выражение,
+построенное по префиксному дереву (trie). Такое выражение проверяет
+позицию в тексте за время, пропорциональное длине слова, а не размеру
+словаря, и весь текст обрабатывается одним проходом.
+
+Словарь собирается из настройки CENSORED_WORDS (или списка по умолчанию)
+и модели CensoredWord и пересобирается только после изменения списка.
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+DEFAULT_CENSORED_WORDS = [
+    'редиска',
+    'плохое',
+    'запрещенное',
+]
+
+VERSION_CACHE_KEY = 'censor:version'
+
+_WORD_RE = re.compile(r'\S+')
+
+
+def _build_trie(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            if node.get('') is True:
+                # Более короткое слово уже является префиксом - хвост не нужен
+                break
+            node = node.setdefault(char, {})
+        else:
+            node.clear()
+            node[''] = True
+    return trie
+
+
+def _trie_to_regex(node):
+    if node.get('') is True:
+        return ''
+
+    branches = [re.escape(char) + _trie_to_regex(child) for char, child in sorted(node.items())]
+    if len(branches) == 1:
+        return branches[0]
+    # Одиночные символы-окончания объединяем в класс [абв]
+    single = [branch for branch in branches if len(branch) == 1]
+    if len(single) == len(branches):
+        return '[' + ''.join(single) + ']'
+    return '(?:' + '|'.join(branches) + ')'
+
+
+def compile_words(words):
+    """Компилирует словарь в одно регулярное выражение (None для пустого словаря)"""
+    # Слова с пробелами никогда не совпадут с отдельным словом текста
+    words = {word.lower() for word in words if word and not any(char.isspace() for char in word)}
+    if not words:
+        return None
+    return re.compile(_trie_to_regex(_build_trie(words)))
+
+
+class CensorEngine:
+    """Скомпилированный словарь и функция замены слов звездочками"""
+
+    def __init__(self, words, version=None):
+        self.words = frozenset(words)
+        self.version = version
+        self.pattern = compile_words(self.words)
+
+    def censor(self, value):
+        if self.pattern is None:
+            return ' '.join(value.split())
+
+        lowered = value.lower()
+        if len(lowered) != len(value):
+            # Редкий случай: lower() меняет длину строки, проверяем по словам
+            search = self.pattern.search
+            return ' '.join(
+                '*' * len(word) if search(word.lower()) else word
+                for word in value.split()
+            )
+
+        matches = iter(match.start() for match in self.pattern.finditer(lowered))
+        next_match = next(matches, None)
+        if next_match is None:
+            return ' '.join(value.split())
+
+        result = []
+        for word in _WORD_RE.finditer(value):
+            start, end = word.span()
+            while next_match is not None and next_match < start:
+                next_match = next(matches, None)
+            if next_match is not None and next_match < end:
+                result.append('*' * (end - start))
+            else:
+                result.append(word.group())
+        return ' '.join(result)
+
+
+def legacy_censor(value, words):
+    """Исходный алгоритм фильтра: O(слов в тексте x слов в словаре)"""
+    result = []
+    for word in value.split():
+        lower_word = word.lower()
+        if any(censored in lower_word for censored in words):
+            result.append('*' * len(word))
+        else:
+            result.append(word)
+    return ' '.join(result)
+
+
+def load_words():
+    """Собирает словарь из настроек и базы данных"""
+    from .models import CensoredWord
+
+    words = set(getattr(settings, 'CENSORED_WORDS', DEFAULT_CENSORED_WORDS))
+    try:
+        words.update(CensoredWord.objects.values_list('word', flat=True))
+    except DatabaseError:
+        # Таблица еще не создана (до применения миграций)
+        pass
+    return words
+
+
+_engine = None
+_next_check = 0.0
+_lock = threading.Lock()
+
+
+def get_engine():
+    """Возвращает скомпилированный движок, пересобирая его после изменения словаря
+
+    Версия словаря хранится в кеше и проверяется не чаще раза в
+    CENSOR_RELOAD_INTERVAL секунд, чтобы изменения из админки доходили
+    до всех процессов.
+    """
+    global _engine, _next_check
+
+    now = time.monotonic()
+    engine = _engine
+    if engine is not None and now < _next_check:
+        return engine
+
+    with _lock:
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        if _engine is None or _engine.version != version:
+            _engine = CensorEngine(load_words(), version=version)
+        _next_check = now + getattr(settings, 'CENSOR_RELOAD_INTERVAL', 30)
+        return _engine
+
+
+def invalidate():
+    """Сбрасывает скомпилированный словарь во всех процессах"""
+    global _engine
+
+    with _lock:
+        _engine = None
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(VERSION_CACHE_KEY, 1, None)
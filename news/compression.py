@@ -0,0 +1,194 @@
+# news/compression.py
+"""Минификация HTML и сжатие ответов.
+
+CompressionMiddleware убирает из HTML отступы шаблонов и сжимает текстовые
+ответы в br (пакет brotli из requirements.txt) или gzip по Accept-Encoding.
+Потоковые ответы (выгрузки) сжимаются по частям со сбросом буфера после
+каждой части, поэтому клиент получает данные по мере генерации.
+
+Страницы из кеша (cache.anonymous_page_cache) не сжимаются на каждом
+попадании: перед сохранением в кеш prepare минифицирует ответ и кладет в
+него готовые варианты с максимальным сжатием, middleware только выбирает
+нужный. То же делают ленты (news/feeds.py).
+"""
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .staticfiles import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # brotli указан в requirements.txt; без него ответы сжимаются только gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript', 'application/json', 'application/xml', 'application/rss+xml',
+    'application/atom+xml', 'application/feed+json', 'application/x-ndjson', 'image/svg+xml',
+}
+# Уровни сжатия на лету и для ответов, которые сжимаются один раз и хранятся в кеше
+DYNAMIC_LEVELS = {'br': 5, 'gzip': 6}
+STORED_LEVELS = {'br': 9, 'gzip': 9}
+
+# Содержимое этих тегов не трогается: пробелы в нем значимы
+_PROTECTED = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.S | re.I)
+# Условные комментарии IE сохраняются
+_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+# Только ASCII-пробелы: \s задел бы неразрывный пробел из текста публикаций
+_NEWLINE_RUN = re.compile(r'[ \t\r\f]*\n[ \t\r\n\f]*')
+_SPACE_RUN = re.compile(r'[ \t\f]{2,}')
+
+
+def _collapse(text):
+    return _SPACE_RUN.sub(' ', _NEWLINE_RUN.sub('\n', _COMMENT.sub('', text)))
+
+
+def minify_html(html):
+    """Схлопывает пробелы и отступы между тегами, сохраняя вид страницы
+
+    Последовательность пробелов с переводом строки становится одним
+    переводом строки, остальные - одним пробелом; для браузера это то же
+    самое. pre, textarea, script и style остаются как есть.
+    """
+    parts = []
+    position = 0
+    for match in _PROTECTED.finditer(html):
+        parts.append(_collapse(html[position:match.start()]))
+        parts.append(match.group())
+        position = match.end()
+    parts.append(_collapse(html[position:]))
+    return ''.join(parts)
+
+
+def encodings():
+    """Поддерживаемые кодировки в порядке предпочтения"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=DYNAMIC_LEVELS['br'] if level is None else level)
+    return gzip.compress(data, DYNAMIC_LEVELS['gzip'] if level is None else level, mtime=0)
+
+
+def precompress(data):
+    """Варианты для хранения в кеше: {кодировка: байты}, только выгодные"""
+    if len(data) < settings.NEWS_COMPRESSION_MIN_SIZE:
+        return {}
+    variants = {encoding: compress(data, encoding, STORED_LEVELS[encoding]) for encoding in encodings()}
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def _media_type(response):
+    return response.get('Content-Type', '').partition(';')[0].strip().lower()
+
+
+def _minify_response(response):
+    if settings.NEWS_HTML_MINIFY and _media_type(response) == 'text/html':
+        charset = response.charset
+        response.content = minify_html(response.content.decode(charset)).encode(charset)
+
+
+def prepare(response):
+    """Минифицирует ответ и готовит сжатые варианты перед сохранением в кеш"""
+    if response.streaming or hasattr(response, 'precompressed'):
+        return response
+    _minify_response(response)
+    response.precompressed = precompress(response.content) if compressible(response) else {}
+    return response
+
+
+def compressible(response):
+    media_type = _media_type(response)
+    return (
+        (media_type.startswith('text/') or media_type in COMPRESSIBLE_TYPES)
+        and not response.has_header('Content-Encoding')
+        and response.status_code not in (204, 304)
+    )
+
+
+def choose(accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def _stream_compressor(encoding):
+    """Функции (сжать часть со сбросом буфера, завершить поток)"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=DYNAMIC_LEVELS['br'])
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    # wbits=31 - формат gzip с заголовком и контрольной суммой
+    compressor = zlib.compressobj(DYNAMIC_LEVELS['gzip'], zlib.DEFLATED, 31)
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    process, finish = _stream_compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_stream(chunks, encoding):
+    process, finish = _stream_compressor(encoding)
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Минифицирует HTML и сжимает текстовые ответы
+
+    Ставится над middleware, меняющими тело ответа, но после
+    PrecompressedStaticMiddleware: статика уже сжата при collectstatic.
+    """
+
+    def process_response(self, request, response):
+        if not compressible(response):
+            return response
+        if response.streaming:
+            encoding = choose(request.headers.get('Accept-Encoding', ''))
+            if encoding is None:
+                return response
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            precompressed = getattr(response, 'precompressed', None)
+            if precompressed is None:
+                _minify_response(response)
+            if len(response.content) < settings.NEWS_COMPRESSION_MIN_SIZE:
+                return response
+            patch_vary_headers(response, ('Accept-Encoding',))
+            encoding = choose(request.headers.get('Accept-Encoding', ''))
+            if encoding is None:
+                return response
+            if precompressed is not None:
+                body = precompressed.get(encoding)
+            else:
+                body = compress(response.content, encoding)
+            if body is None or len(body) >= len(response.content):
+                return response
+            response.content = body
+            response['Content-Length'] = str(len(body))
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # Тело зависит от кодировки, поэтому сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
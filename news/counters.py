@@ -0,0 +1,88 @@
+# news/counters.py
+"""Денормализованные счетчики.
+
+Category.post_count и Category.subscriber_count, а также общее количество
+публикаций (Counter с ключом POSTS_TOTAL) обновляются атомарными UPDATE ...
+SET x = x + n из сигналов PostCategory, Subscription и Post. Пути массовой
+вставки (bulk_create) сигналы не вызывают и должны вызывать функции этого
+модуля сами. Расхождения исправляет команда reconcile_counters.
+"""
+from collections import Counter as Tally
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Category, Counter, Post, PostCategory, Subscription
+
+POSTS_TOTAL = 'posts_total'
+
+
+def get_value(key):
+    """Текущее значение счетчика (0, если счетчика еще нет)"""
+    return Counter.objects.filter(key=key).values_list('value', flat=True).first() or 0
+
+
+def increment(key, delta=1):
+    if not delta:
+        return
+    if not Counter.objects.filter(key=key).update(value=F('value') + delta):
+        Counter.objects.get_or_create(key=key)
+        Counter.objects.filter(key=key).update(value=F('value') + delta)
+
+
+def _change_categories(field, category_ids, delta):
+    # Категории с одинаковым изменением обновляются одним запросом
+    by_delta = {}
+    for category_id, count in Tally(category_ids).items():
+        by_delta.setdefault(count * delta, []).append(category_id)
+    for change, ids in by_delta.items():
+        # Строки, вставленные в обход сигналов, не должны уводить счетчик ниже нуля
+        Category.objects.filter(pk__in=ids).update(**{field: Greatest(F(field) + change, 0)})
+
+
+def change_post_counts(category_ids, delta=1):
+    """Изменяет post_count категорий; id может повторяться для нескольких публикаций"""
+    _change_categories('post_count', category_ids, delta)
+
+
+def change_subscriber_counts(category_ids, delta=1):
+    _change_categories('subscriber_count', category_ids, delta)
+
+
+def _count_by_category(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(category=OuterRef('pk'))
+            .values('category')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def reconcile():
+    """Пересчитывает все счетчики по фактическим данным
+
+    Возвращает словарь с количеством исправленных значений.
+    """
+    drift = Category.objects.annotate(
+        real_posts=_count_by_category(PostCategory),
+        real_subscribers=_count_by_category(Subscription),
+    )
+    fixed = {
+        'post_count': drift.exclude(post_count=F('real_posts')).count(),
+        'subscriber_count': drift.exclude(subscriber_count=F('real_subscribers')).count(),
+    }
+    if fixed['post_count'] or fixed['subscriber_count']:
+        Category.objects.update(
+            post_count=_count_by_category(PostCategory),
+            subscriber_count=_count_by_category(Subscription),
+        )
+
+    total = Post.objects.count()
+    counter, _ = Counter.objects.get_or_create(key=POSTS_TOTAL)
+    fixed[POSTS_TOTAL] = int(counter.value != total)
+    if counter.value != total:
+        Counter.objects.filter(pk=counter.pk).update(value=total)
+    return fixed
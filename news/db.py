@@ -0,0 +1,74 @@
+# news/db.py
+"""Настройка SQLite для одновременной работы сайта и воркеров Celery.
+
+При открытии соединения выполняются PRAGMA из NEWS_SQLITE_PRAGMAS: журнал
+WAL позволяет читать во время записи, busy_timeout заставляет ждать
+освобождения блокировки вместо немедленной ошибки. Если блокировка все же
+не дождалась, операции записи повторяются декоратором retry_on_db_lock.
+"""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection as default_connection
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',  # в режиме WAL надежно при сбое процесса, fsync только на checkpoint
+    'busy_timeout': 5000,  # мс
+    'cache_size': -20000,  # отрицательное значение - размер в КиБ (20 МБ)
+    'mmap_size': 134217728,  # 128 МБ
+    'temp_store': 'memory',
+    'foreign_keys': 'on',
+}
+
+
+def get_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'NEWS_SQLITE_PRAGMAS', {})}
+
+
+def configure_sqlite(connection):
+    """Применяет PRAGMA к новому соединению SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_pragmas()
+    if connection.is_in_memory_db():
+        # Для базы в памяти WAL и mmap не имеют смысла
+        pragmas = {name: value for name, value in pragmas.items() if name not in ('journal_mode', 'mmap_size')}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_database_locked(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_db_lock(attempts=None, delay=None, using=None):
+    """Повторяет функцию при ошибке 'database is locked'
+
+    Пауза между попытками растет экспоненциально со случайной добавкой.
+    Внутри открытой транзакции повтор бессмысленен (она уже откатится),
+    поэтому ошибка пробрасывается сразу: декорировать нужно внешний
+    уровень записи, который сам открывает transaction.atomic().
+    """
+    attempts = attempts or getattr(settings, 'NEWS_DB_LOCK_RETRIES', 3)
+    delay = delay if delay is not None else getattr(settings, 'NEWS_DB_LOCK_RETRY_DELAY', 0.05)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from django.db import connections
+
+            connection = connections[using] if using else default_connection
+            for attempt in range(1, attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as error:
+                    if attempt == attempts or not is_database_locked(error) or connection.in_atomic_block:
+                        raise
+                    time.sleep(delay * 2 ** (attempt - 1) * (1 + random.random()))
+        return wrapper
+    return decorator
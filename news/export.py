@@ -0,0 +1,178 @@
+# news/export.py
+"""Потоковая выгрузка публикаций и подписок в NDJSON или CSV.
+
+Строки читаются пачками по ключу (keyset), поэтому каждый запрос к базе
+короткий, а память не зависит от размера таблицы. Публикации обходятся
+по индексу (pub_date, id), так что выгрузка с since начинается сразу с
+нужного места; категории пачки загружаются одним запросом. Выходные
+байты при необходимости сжимаются gzip на лету.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time as datetime_time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Post, PostCategory, Subscription
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def parse_since(value):
+    """Дата или дата-время ISO 8601; наивное время считается в часовом поясе сайта"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Неверная дата: {value!r}')
+        moment = datetime.combine(day, datetime_time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _post_rows(since, batch_size):
+    queryset = Post.objects.order_by('pub_date', 'id').values(
+        'id', 'title', 'content', 'post_type', 'pub_date', 'updated_at', 'author_id', 'author__username',
+    )
+    if since:
+        queryset = queryset.filter(pub_date__gte=since)
+
+    last = None
+    while True:
+        batch = queryset
+        if last:
+            batch = batch.filter(Q(pub_date__gt=last[0]) | Q(pub_date=last[0], id__gt=last[1]))
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+
+        categories = {}
+        links = (
+            PostCategory.objects.filter(post_id__in=[row['id'] for row in batch])
+            .order_by('category__name')
+            .values_list('post_id', 'category__name')
+        )
+        for post_id, name in links:
+            categories.setdefault(post_id, []).append(name)
+
+        for row in batch:
+            yield {
+                'id': row['id'],
+                'title': row['title'],
+                'content': row['content'],
+                'post_type': row['post_type'],
+                'pub_date': row['pub_date'].isoformat(),
+                'updated_at': row['updated_at'].isoformat(),
+                'author_id': row['author_id'],
+                'author': row['author__username'],
+                'categories': categories.get(row['id'], []),
+            }
+        last = (batch[-1]['pub_date'], batch[-1]['id'])
+
+
+def _subscription_rows(since, batch_size):
+    queryset = Subscription.objects.order_by('id').values(
+        'id', 'user_id', 'user__username', 'category_id', 'category__name', 'subscribed_at',
+    )
+    if since:
+        queryset = queryset.filter(subscribed_at__gte=since)
+
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        for row in batch:
+            yield {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'username': row['user__username'],
+                'category_id': row['category_id'],
+                'category': row['category__name'],
+                'subscribed_at': row['subscribed_at'].isoformat(),
+            }
+        last_id = batch[-1]['id']
+
+
+DATASETS = {
+    'posts': (
+        _post_rows,
+        ['id', 'title', 'content', 'post_type', 'pub_date', 'updated_at', 'author_id', 'author', 'categories'],
+    ),
+    'subscriptions': (
+        _subscription_rows,
+        ['id', 'user_id', 'username', 'category_id', 'category', 'subscribed_at'],
+    ),
+}
+
+
+def _ndjson(rows, columns):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False).encode() + b'\n'
+
+
+def _csv(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(columns)
+    yield flush()
+    for row in rows:
+        if isinstance(row.get('categories'), list):
+            row['categories'] = ';'.join(row['categories'])
+        writer.writerow([row[column] for column in columns])
+        yield flush()
+
+
+def _gzip(chunks, level=6):
+    # wbits=31 - формат gzip с заголовком и контрольной суммой
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _buffered(chunks, size=64 * 1024):
+    """Склеивает мелкие куски строк, чтобы не отдавать серверу по строке"""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream(dataset, fmt='ndjson', since=None, compress=False, batch_size=None):
+    """Генератор байтов выгрузки"""
+    rows, columns = DATASETS[dataset]
+    serialize = _ndjson if fmt == 'ndjson' else _csv
+    batch_size = batch_size or getattr(settings, 'NEWS_EXPORT_BATCH_SIZE', 2000)
+    chunks = _buffered(serialize(rows(since, batch_size), columns))
+    return _gzip(chunks) if compress else chunks
+
+
+def filename(dataset, fmt, compress=False):
+    return f'{dataset}.{fmt}' + ('.gz' if compress else '')
@@ -0,0 +1,220 @@
+# news/feeds.py
+"""Готовые ленты RSS, Atom и JSON Feed.
+
+Лента (все публикации или одна категория) сериализуется заранее и хранится
+в кеше под ключом feed:<область>:<формат> вместе с ETag, временем изменения
+и сжатыми вариантами (compression.precompress), поэтому запрос читателя
+лент стоит одно чтение из кеша и ничего не сжимает заново. Сигналы
+Post и PostCategory после фиксации транзакции пересобирают только
+затронутые области: общую ленту и ленты категорий публикации. Если запись
+вытеснена из кеша или истек NEWS_CACHE_TIMEOUT, лента собирается при
+первом запросе.
+
+Last-Modified - не время последней публикации ленты (оно уменьшается, если
+публикацию удалили), а отдельная отметка изменения области в кеше. Она
+только растет: каждое изменение области сдвигает ее хотя бы на секунду.
+"""
+import hashlib
+import json
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+
+from .censor import get_engine
+from .compression import precompress
+from .models import Category, Post, PostCategory
+
+ALL = 'all'
+FORMATS = {
+    'rss': Rss201rev2Feed,
+    'atom': Atom1Feed,
+    'json': None,
+}
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/feed+json; charset=utf-8',
+}
+# Несуществующая категория кешируется, чтобы опрос по неверной ссылке не шел в базу
+MISSING = 'missing'
+
+_pending = threading.local()
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def _key(scope, fmt):
+    return f'feed:{scope}:{fmt}'
+
+
+def _changed_key(scope):
+    return f'feed:{scope}:changed'
+
+
+def touch(scopes):
+    """Отмечает изменение областей: их Last-Modified становится больше прежнего"""
+    now = timezone.now()
+    keys = [_changed_key(scope) for scope in scopes]
+    previous = cache.get_many(keys)
+    # Last-Modified передается с точностью до секунды
+    cache.set_many({
+        key: max(now, previous[key] + timedelta(seconds=1)) if key in previous else now for key in keys
+    }, None)
+
+
+def _absolute(path):
+    return settings.NEWS_SITE_URL.rstrip('/') + path
+
+
+def _feed_path(scope, fmt):
+    if scope == ALL:
+        return reverse('feed', args=[fmt])
+    return reverse('category_feed', args=[int(scope.split(':', 1)[1]), fmt])
+
+
+def _load(scope):
+    """Заголовок ленты и последние публикации области; None, если категории нет"""
+    posts = Post.objects.select_related('author').order_by('-pub_date', '-id')
+    title = 'Новостной портал'
+    if scope != ALL:
+        category_id = int(scope.split(':', 1)[1])
+        name = Category.objects.filter(pk=category_id).values_list('name', flat=True).first()
+        if name is None:
+            return None
+        title = f'{title}: {name}'
+        posts = posts.filter(postcategory__category_id=category_id)
+    return title, list(posts[:settings.NEWS_FEED_SIZE])
+
+
+def _serialize(fmt, scope, title, posts):
+    censor = get_engine().censor
+    link = _absolute(reverse('news_list'))
+    feed_url = _absolute(_feed_path(scope, fmt))
+    items = [
+        {
+            'id': _absolute(reverse('news_detail', args=[post.id])),
+            'title': censor(post.title),
+            'content': censor(post.content),
+            'author': post.author.username if post.author else None,
+            'published': post.pub_date,
+            'updated': post.updated_at,
+        }
+        for post in posts
+    ]
+
+    if fmt == 'json':
+        return json.dumps({
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': title,
+            'home_page_url': link,
+            'feed_url': feed_url,
+            'language': 'ru',
+            'items': [
+                {
+                    'id': item['id'],
+                    'url': item['id'],
+                    'title': item['title'],
+                    'content_text': item['content'],
+                    'date_published': item['published'].isoformat(),
+                    'date_modified': item['updated'].isoformat(),
+                    **({'authors': [{'name': item['author']}]} if item['author'] else {}),
+                }
+                for item in items
+            ],
+        }, ensure_ascii=False).encode()
+
+    feed = FORMATS[fmt](title=title, link=link, description=title, language='ru', feed_url=feed_url)
+    for item in items:
+        feed.add_item(
+            title=item['title'],
+            link=item['id'],
+            description=item['content'],
+            unique_id=item['id'],
+            author_name=item['author'],
+            pubdate=item['published'],
+            updateddate=item['updated'],
+        )
+    return feed.writeString('utf-8').encode()
+
+
+def build(scope):
+    """Собирает все форматы ленты области и сохраняет их в кеш"""
+    loaded = _load(scope)
+    if loaded is None:
+        cache.set_many({_key(scope, fmt): MISSING for fmt in FORMATS}, settings.NEWS_CACHE_TIMEOUT)
+        return {}
+    title, posts = loaded
+    last_modified = cache.get_or_set(_changed_key(scope), timezone.now, None)
+    entries = {}
+    for fmt in FORMATS:
+        body = _serialize(fmt, scope, title, posts)
+        entries[_key(scope, fmt)] = {
+            'body': body,
+            'etag': f'"{hashlib.md5(body).hexdigest()}"',
+            'last_modified': last_modified,
+            'content_type': CONTENT_TYPES[fmt],
+            'encoded': precompress(body),
+        }
+    # Срок как у страниц: с кешем в памяти процесса (LocMemCache) пересборку
+    # видит только записавший процесс, остальные отдают старую ленту не дольше таймаута
+    cache.set_many(entries, settings.NEWS_CACHE_TIMEOUT)
+    return entries
+
+
+def get(scope, fmt):
+    """Готовая лента: словарь с body, etag, last_modified, content_type или None"""
+    entry = cache.get(_key(scope, fmt))
+    if entry is None:
+        entry = build(scope).get(_key(scope, fmt))
+    return None if entry == MISSING else entry
+
+
+def regenerate(scopes):
+    touch(scopes)
+    for scope in scopes:
+        build(scope)
+
+
+def _flush():
+    scopes, _pending.scopes = getattr(_pending, 'scopes', set()), set()
+    regenerate(sorted(scopes))
+
+
+def schedule(scopes):
+    """Пересобирает ленты после фиксации транзакции, каждую область один раз
+
+    Все колбэки транзакции разбирают общий набор: первый пересобирает
+    накопленные области, остальные находят его пустым.
+    """
+    if not hasattr(_pending, 'scopes'):
+        _pending.scopes = set()
+    _pending.scopes.update(scopes)
+    transaction.on_commit(_flush)
+
+
+def invalidate(scopes):
+    """Удаляет ленты после фиксации транзакции; соберутся при первом запросе
+
+    Для массового импорта: пересобирать ленты после каждой пачки дороже,
+    чем один раз при следующем опросе.
+    """
+    keys = [_key(scope, fmt) for scope in scopes for fmt in FORMATS]
+
+    def delete():
+        touch(scopes)
+        cache.delete_many(keys)
+
+    transaction.on_commit(delete)
+
+
+def post_scopes(post_id):
+    category_ids = PostCategory.objects.filter(post_id=post_id).values_list('category_id', flat=True)
+    return [ALL, *(category_scope(category_id) for category_id in category_ids)]
@@ -5,9 +5,9 @@ from django.contrib.auth.forms import UserChangeForm
 
 class NewsSearchForm(forms.Form):
     title = forms.CharField(
-        label='Название',
+        label='Название или текст',
         required=False,
-        widget=forms.TextInput(attrs={'placeholder': 'Поиск по названию'})
+        widget=forms.TextInput(attrs={'placeholder': 'Поиск по названию и тексту'})
     )
     author = forms.CharField(
         label='Автор',
@@ -37,6 +37,29 @@ class PostForm(forms.ModelForm):
             'post_type': forms.Select(attrs={'class': 'form-control'}),
         }
 
+class PostAdminForm(PostForm):
+    """Форма админки: категории сохраняет services, а не save_m2m"""
+
+    class Meta(PostForm.Meta):
+        fields = PostForm.Meta.fields + ['author', 'pub_date']
+        widgets = {}
+
+class PublishPostForm(forms.ModelForm):
+    """Одна публикация пакетной публикации
+
+    Категории проверяются по списку choices, загруженному один раз на
+    весь пакет, а не запросом на каждую форму.
+    """
+    categories = forms.TypedMultipleChoiceField(coerce=int, label="Категории")
+
+    def __init__(self, *args, category_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['categories'].choices = category_choices
+
+    class Meta:
+        model = Post
+        fields = ['title', 'content', 'post_type']
+
 class UserEditForm(UserChangeForm):
     class Meta:
         model = User
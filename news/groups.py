@@ -0,0 +1,54 @@
+# news/groups.py
+"""Кеш названий групп пользователя.
+
+Группы загружаются одним запросом и запоминаются на объекте пользователя,
+то есть живут до конца запроса. При NEWS_SESSION_GROUP_CACHE = True
+middleware UserGroupsMiddleware дополнительно хранит их в сессии вместе с
+версией из кеша; версия меняется при любом изменении членства.
+
+Версия - случайная строка, а не счетчик: после вытеснения ключа из кеша
+новая версия не совпадет ни с одной сохраненной в сессиях, и группы
+загрузятся из базы заново. Изменение видят все процессы только с общим
+кешем (Redis, файловый), поэтому с LocMemCache хранение в сессии по
+умолчанию выключено.
+"""
+import uuid
+
+from django.core.cache import cache
+
+GROUPS_ATTR = '_news_group_names'
+SESSION_KEY = '_news_group_names'
+
+
+def version_key(user_id):
+    return f'user_groups_version:{user_id}'
+
+
+def get_group_names(user):
+    """Возвращает frozenset названий групп пользователя"""
+    if not user.is_authenticated:
+        return frozenset()
+
+    names = getattr(user, GROUPS_ATTR, None)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        setattr(user, GROUPS_ATTR, names)
+    return names
+
+
+def invalidate_group_names(user=None, user_ids=()):
+    """Сбрасывает кеш групп на объекте и во всех сессиях пользователей"""
+    if user is not None:
+        user.__dict__.pop(GROUPS_ATTR, None)
+        user_ids = [*user_ids, user.pk]
+    cache.set_many({version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+def get_version(user_id):
+    """Текущая версия групп пользователя; отсутствующая создается заново"""
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
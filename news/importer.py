@@ -0,0 +1,222 @@
+# news/importer.py
+"""Массовый импорт публикаций из JSONL или CSV.
+
+Файл читается построчно пачками фиксированного размера, поэтому память не
+растет с размером файла. Для каждой пачки авторы и категории разрешаются
+одним запросом по новым именам (найденные id запоминаются), недостающие
+категории создаются, а Post и PostCategory вставляются bulk_create в одной
+транзакции. Вместо post_save отправляется сигнал posts_bulk_created.
+
+Поля строки: title, content, post_type (news/article), pub_date (ISO 8601),
+author (username), categories (список в JSONL, через ";" в CSV). Строка с
+неверным полем (нет заголовка, невозможная дата, categories не список)
+пропускается: она считается в stats['skipped'], а номер строки файла и
+причина попадают в errors. Строка JSONL, которая не разбирается как
+объект JSON, - ошибка формата файла (ImportDataError), импорт
+останавливается на ней.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import reset_queries, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db import retry_on_db_lock
+from .models import Category, Post, PostCategory
+from .signals import posts_bulk_created
+from .tasks import id_ranges
+
+POST_TYPES = {value for value, _ in Post.POST_TYPES}
+# Номер строки файла, который read_rows добавляет в словарь строки
+LINE = '_line'
+# Сколько пропущенных строк с причиной хранится в PostImporter.errors
+MAX_ERRORS = 100
+
+
+class ImportDataError(ValueError):
+    pass
+
+
+def read_rows(file, fmt):
+    """Итератор словарей из открытого текстового файла"""
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            row['categories'] = [name for name in (row.get('categories') or '').split(';') if name.strip()]
+            row[LINE] = reader.line_num
+            yield row
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            raise ImportDataError(f'Строка {number}: {error}')
+        if not isinstance(row, dict):
+            raise ImportDataError(f'Строка {number}: ожидается объект JSON, а не {type(row).__name__}')
+        row[LINE] = number
+        yield row
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ImportDataError(f'{field} должно быть строкой')
+    return value
+
+
+def clean_row(row, now):
+    """Проверяет строку и приводит поля к типам модели; ImportDataError с причиной, если строка неверна"""
+    if not isinstance(row, dict):
+        raise ImportDataError(f'ожидается объект, а не {type(row).__name__}')
+    title = _text(row, 'title').strip()
+    content = _text(row, 'content')
+    if not title or not content:
+        raise ImportDataError('нет заголовка или текста')
+    post_type = _text(row, 'post_type') or 'news'
+    if post_type not in POST_TYPES:
+        raise ImportDataError(f'неизвестный post_type {post_type!r}')
+
+    pub_date = _text(row, 'pub_date')
+    if pub_date:
+        try:
+            # Правильный по форме, но невозможный момент (2024-13-45) дает ValueError
+            parsed = parse_datetime(pub_date)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ImportDataError(f'неверная дата pub_date {pub_date!r}')
+        pub_date = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+    else:
+        pub_date = now
+
+    categories = row.get('categories') or []
+    if not isinstance(categories, list) or not all(isinstance(name, str) for name in categories):
+        raise ImportDataError('categories должно быть списком названий')
+    return {
+        'title': title[:200],
+        'content': content,
+        'post_type': post_type,
+        'pub_date': pub_date,
+        'author': _text(row, 'author') or None,
+        'categories': [name.strip() for name in categories if name.strip()],
+    }
+
+
+class PostImporter:
+    """Импорт пачками; stats хранит количество обработанных строк"""
+
+    def __init__(self, batch_size=1000, create_categories=True):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.authors = {}
+        self.categories = {}
+        # Отрезки id импортированных публикаций для рассылки (tasks.id_ranges)
+        self.ranges = []
+        # Первые MAX_ERRORS пропущенных строк: (номер строки, причина)
+        self.errors = []
+        self.rows_read = 0
+        self.stats = {'posts': 0, 'links': 0, 'skipped': 0, 'unknown_authors': 0, 'unknown_categories': 0}
+
+    def run(self, rows, progress=None):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            # При DEBUG=True Django копит все запросы в connection.queries
+            reset_queries()
+            if progress:
+                progress(self.stats)
+        return self.stats
+
+    def _resolve_authors(self, usernames):
+        missing = {name for name in usernames if name and name not in self.authors}
+        if missing:
+            found = dict(User.objects.filter(username__in=missing).values_list('username', 'id'))
+            for name in missing:
+                self.authors[name] = found.get(name)
+
+    def _resolve_categories(self, names):
+        missing = {name for name in names if name not in self.categories}
+        if not missing:
+            return
+        found = dict(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        new = missing - found.keys()
+        if new and self.create_categories:
+            Category.objects.bulk_create([Category(name=name) for name in new], ignore_conflicts=True)
+            found.update(Category.objects.filter(name__in=new).values_list('name', 'id'))
+        for name in missing:
+            self.categories[name] = found.get(name)
+
+    def _build_post(self, row, stats):
+        author_id = self.authors.get(row['author'])
+        if row['author'] and author_id is None:
+            stats['unknown_authors'] += 1
+        return Post(
+            title=row['title'], content=row['content'], post_type=row['post_type'], pub_date=row['pub_date'],
+            author_id=author_id,
+        )
+
+    @retry_on_db_lock()
+    def import_batch(self, batch):
+        # Категории, созданные в откатившейся транзакции, нельзя оставлять в кеше имен
+        known_categories = dict(self.categories)
+        try:
+            stats, post_ids, errors = self._import_batch(batch)
+        except Exception:
+            self.categories = known_categories
+            raise
+        for key, value in stats.items():
+            self.stats[key] += value
+        self.ranges = id_ranges(post_ids, self.ranges)
+        self.errors.extend(errors[:MAX_ERRORS - len(self.errors)])
+        self.rows_read += len(batch)
+
+    def _import_batch(self, batch):
+        now = timezone.now()
+        stats = dict.fromkeys(self.stats, 0)
+        rows, errors = [], []
+        for number, row in enumerate(batch, self.rows_read + 1):
+            try:
+                rows.append(clean_row(row, now))
+            except ImportDataError as error:
+                stats['skipped'] += 1
+                # Строки не из read_rows нумеруются по порядку
+                errors.append((row.get(LINE, number) if isinstance(row, dict) else number, str(error)))
+
+        with transaction.atomic():
+            self._resolve_authors(row['author'] for row in rows)
+            self._resolve_categories(name for row in rows for name in row['categories'])
+
+            posts = [self._build_post(row, stats) for row in rows]
+            if not posts:
+                return stats, [], errors
+
+            posts = Post.objects.bulk_create(posts)
+            links = []
+            for post, row in zip(posts, rows):
+                category_ids = set()
+                for name in row['categories']:
+                    category_id = self.categories.get(name)
+                    if category_id is None:
+                        stats['unknown_categories'] += 1
+                    else:
+                        category_ids.add(category_id)
+                links.extend(PostCategory(post_id=post.id, category_id=category_id) for category_id in category_ids)
+            PostCategory.objects.bulk_create(links)
+
+            posts_bulk_created.send(
+                sender=Post, posts=posts, category_ids=[link.category_id for link in links],
+            )
+
+        stats['posts'] = len(posts)
+        stats['links'] = len(links)
+        return stats, [post.id for post in posts], errors
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время представлений, задач Celery и фильтра censor, сравнивает с базовым прогоном'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*', help='Имена сценариев (по умолчанию все)')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--warm-cache', action='store_true', help='Не очищать кеш перед итерацией')
+        parser.add_argument('--query', default='новость', help='Поисковый запрос для news_search')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON базового прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимое замедление медианы (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        try:
+            report = benchmarks.run(
+                names=options['cases'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                warm_cache=options['warm_cache'],
+                search_query=options['query'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        self.stdout.write(f'{"сценарий":<30}{"min":>10}{"median":>10}{"p95":>10}{"mean":>10}  (мс)')
+        for name, stats in report['results'].items():
+            self.stdout.write(
+                f'{name:<30}{stats["min"]:>10.2f}{stats["median"]:>10.2f}{stats["p95"]:>10.2f}{stats["mean"]:>10.2f}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = benchmarks.compare(report, baseline, options['threshold'])
+            if regressions:
+                lines = [
+                    f'{name}: {before:.2f} -> {after:.2f} мс (+{change:.0%})'
+                    for name, before, after, change in regressions
+                ]
+                raise CommandError('Регрессия производительности:\n' + '\n'.join(lines))
+            self.stdout.write(self.style.SUCCESS(
+                f'Регрессий нет (порог {options["threshold"]:.0%}, базовый коммит {baseline.get("meta", {}).get("commit")})'
+            ))
@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from news.censor import CensorEngine, legacy_censor
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def random_word(rng, min_length=3, max_length=12):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(min_length, max_length)))
+
+
+class Command(BaseCommand):
+    help = 'Микро-бенчмарк фильтра censor: исходный алгоритм против скомпилированного словаря'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=10000, help='Размер словаря')
+        parser.add_argument('--texts', type=int, default=200, help='Количество текстов')
+        parser.add_argument('--text-length', type=int, default=40, help='Слов в одном тексте')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-legacy', action='store_true', help='Не запускать исходный алгоритм')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        dictionary = {random_word(rng, 5, 10) for _ in range(options['words'])}
+        dictionary_list = sorted(dictionary)
+
+        # Примерно каждое двадцатое слово текста содержит запрещенное слово
+        texts = []
+        for _ in range(options['texts']):
+            words = []
+            for _ in range(options['text_length']):
+                word = random_word(rng)
+                if rng.random() < 0.05:
+                    word = word[:2] + rng.choice(dictionary_list).capitalize()
+                words.append(word)
+            texts.append(' '.join(words))
+        total_chars = sum(len(text) for text in texts)
+
+        started = time.perf_counter()
+        engine = CensorEngine(dictionary)
+        compile_time = time.perf_counter() - started
+        self.stdout.write(f'Словарь: {len(dictionary)} слов, компиляция {compile_time * 1000:.1f} мс')
+
+        started = time.perf_counter()
+        engine_results = [engine.censor(text) for text in texts]
+        engine_time = time.perf_counter() - started
+        self.report('Скомпилированный словарь', len(texts), total_chars, engine_time)
+
+        if options['skip_legacy']:
+            return
+
+        started = time.perf_counter()
+        legacy_results = [legacy_censor(text, dictionary_list) for text in texts]
+        legacy_time = time.perf_counter() - started
+        self.report('Исходный алгоритм', len(texts), total_chars, legacy_time)
+
+        if engine_results != legacy_results:
+            self.stdout.write(self.style.ERROR('Результаты алгоритмов различаются!'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты совпадают, ускорение x{legacy_time / engine_time:.1f}'
+        ))
+
+    def report(self, name, count, chars, elapsed):
+        self.stdout.write(
+            f'{name}: {count / elapsed:.0f} текстов/с, '
+            f'{chars / elapsed / 1024 / 1024:.2f} МБ/с ({elapsed * 1000:.1f} мс)'
+        )
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Размер ответа и стоимость минификации и сжатия br/gzip для news_list и news_detail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        try:
+            rows = benchmarks.compression_report(options['iterations'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f'{"страница":<14}{"вариант":<18}{"байт":>9}{"доля":>8}{"CPU/ответ":>12}{"CPU/кеш":>10}  (мс)'
+        )
+        for row in rows:
+            self.stdout.write(
+                f'{row["page"]:<14}{row["mode"]:<18}{row["bytes"]:>9}{row["ratio"]:>8.1%}'
+                f'{row["cpu_ms"]:>12.2f}{row["fill_ms"]:>10.2f}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(rows, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
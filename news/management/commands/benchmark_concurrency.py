@@ -0,0 +1,126 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from news.db import is_database_locked
+from news.views import post_cards
+
+SCRATCH_TABLE = 'news_bench_concurrency'
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность чтения списка публикаций во время массовой записи: '
+            'запускается без записи и с пишущим потоком, результаты сравниваются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Число читающих потоков')
+        parser.add_argument('--duration', type=float, default=5.0, help='Длительность каждой фазы, с')
+        parser.add_argument('--rows', type=int, default=500, help='Строк в одной транзакции записи')
+        parser.add_argument('--journal-mode', choices=['wal', 'delete'],
+                            help='Переключить журнал перед замером (по умолчанию как настроено)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            raise CommandError('Замер имеет смысл только для файловой базы SQLite')
+
+        if options['journal_mode']:
+            # Новые соединения потоков применяют PRAGMA из настроек, поэтому режим задается через них
+            pragmas = {**getattr(settings, 'NEWS_SQLITE_PRAGMAS', {}), 'journal_mode': options['journal_mode']}
+            with override_settings(NEWS_SQLITE_PRAGMAS=pragmas):
+                connection.close()
+                return self.measure(options)
+        return self.measure(options)
+
+    def measure(self, options):
+        # Запись идет во временную таблицу: SQLite блокирует файл целиком,
+        # поэтому конкуренция та же, что при записи публикаций, а данные сайта не меняются
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {SCRATCH_TABLE} (id INTEGER PRIMARY KEY, payload TEXT)')
+        connection.close()
+        self.stdout.write(f'Журнал: {journal_mode}, читателей: {options["readers"]}')
+
+        try:
+            idle = self.run_phase(options, with_writer=False)
+            busy = self.run_phase(options, with_writer=True)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {SCRATCH_TABLE}')
+
+        self.report('Без записи', idle, options['duration'])
+        self.report('С записью', busy, options['duration'])
+        if idle['reads']:
+            self.stdout.write(f'Чтение во время записи: {busy["reads"] / idle["reads"]:.0%} от пропускной способности без записи')
+
+    def run_phase(self, options, with_writer):
+        stats = {'reads': 0, 'read_errors': 0, 'writes': 0, 'write_errors': 0, 'latencies': []}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def reader():
+            reads, errors, latencies = 0, 0, []
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        list(post_cards().order_by('-pub_date', '-id')[:10])
+                    except OperationalError as error:
+                        if not is_database_locked(error):
+                            raise
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    reads += 1
+            finally:
+                connections.close_all()
+            with lock:
+                stats['reads'] += reads
+                stats['read_errors'] += errors
+                stats['latencies'] += latencies
+
+        def writer():
+            payload = 'x' * 200
+            try:
+                while not stop.is_set():
+                    try:
+                        with connection.cursor() as cursor:
+                            cursor.execute('BEGIN IMMEDIATE')
+                            cursor.executemany(
+                                f'INSERT INTO {SCRATCH_TABLE} (payload) VALUES (%s)',
+                                [(payload,)] * options['rows'],
+                            )
+                            cursor.execute('COMMIT')
+                        stats['writes'] += options['rows']
+                    except OperationalError as error:
+                        if not is_database_locked(error):
+                            raise
+                        stats['write_errors'] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        if with_writer:
+            threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def report(self, title, stats, duration):
+        latencies = sorted(stats['latencies'])
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+        line = (
+            f'{title}: {stats["reads"] / duration:.0f} чтений/с, p95 {p95:.1f} мс, '
+            f'ошибок блокировки при чтении {stats["read_errors"]}'
+        )
+        if stats['writes'] or stats['write_errors']:
+            line += f'; записано {stats["writes"] / duration:.0f} строк/с, ошибок записи {stats["write_errors"]}'
+        self.stdout.write(line)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.query_plans import check
+
+
+class Command(BaseCommand):
+    help = 'Выполняет EXPLAIN QUERY PLAN для горячих запросов и сообщает о полных просмотрах таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plan', action='store_true', help='Печатать план каждого запроса')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Завершиться с ошибкой, если найден полный просмотр')
+
+    def handle(self, *args, **options):
+        reports = check()
+        for report in reports:
+            if report.ok:
+                self.stdout.write(self.style.SUCCESS(f'OK    {report.query.name}'))
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f'SCAN  {report.query.name}: {", ".join(report.full_scans)}'
+                ))
+            for sort in report.temp_sorts:
+                self.stdout.write(self.style.WARNING(f'      временное B-дерево: {sort}'))
+            if options['verbose_plan'] or not report.ok:
+                for line in report.plan:
+                    self.stdout.write(f'      {line}')
+
+        failed = [report.query.name for report in reports if not report.ok]
+        if failed and options['fail_on_scan']:
+            raise CommandError(f'Полный просмотр таблиц в запросах: {", ".join(failed)}')
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news import export
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка публикаций или подписок в NDJSON/CSV без блокировки базы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(export.DATASETS))
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--since', help='Только строки не раньше даты (ISO 8601) по pub_date/subscribed_at')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать на лету')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--output', '-o', default='-', help='Файл (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_since(options['since'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        chunks = export.stream(
+            options['dataset'], options['format'], since, options['gzip'], options['batch_size'],
+        )
+        written = 0
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(options['output'], 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                written += len(chunk)
+        self.stderr.write(f'Записано {written} байт в {options["output"]}')
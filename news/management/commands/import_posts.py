@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news.importer import ImportDataError, PostImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт публикаций из JSONL или CSV (категории по названию, авторы по username)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='По умолчанию по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одной транзакции')
+        parser.add_argument('--no-create-categories', action='store_true',
+                            help='Не создавать категории, которых нет в базе')
+        parser.add_argument('--notify', action='store_true',
+                            help='После импорта одной задачей разослать подписчикам уведомления')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        importer = PostImporter(options['batch_size'], create_categories=not options['no_create_categories'])
+        started = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'Импортировано {stats["posts"]} ({stats["posts"] / elapsed:.0f} строк/с)')
+
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as file:
+                stats = importer.run(read_rows(file, fmt), progress=progress)
+        except (OSError, ImportDataError) as error:
+            raise CommandError(error)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {stats["posts"]} публикаций, {stats["links"]} связей с категориями за {elapsed:.1f} с '
+            f'({stats["posts"] / elapsed if elapsed else 0:.0f} строк/с)'
+        ))
+        if stats['skipped'] or stats['unknown_authors'] or stats['unknown_categories']:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено строк: {stats["skipped"]}, неизвестных авторов: {stats["unknown_authors"]}, '
+                f'неизвестных категорий: {stats["unknown_categories"]}'
+            ))
+            for line, reason in importer.errors:
+                self.stdout.write(self.style.WARNING(f'Строка {line}: {reason}'))
+
+        if options['notify'] and importer.ranges:
+            from news.tasks import send_bulk_post_notification
+            send_bulk_post_notification.delay(importer.ranges)
+            self.stdout.write(f'Рассылка по {stats["posts"]} импортированным публикациям поставлена в очередь')
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import statistics
+import time
+from itertools import cycle
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Target:
+    def __init__(self, spec):
+        name, _, url = spec.rpartition('=')
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError(f'Ожидается имя=http://хост:порт, получено {spec!r}')
+        self.name = name or parts.netloc
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+
+
+async def read_response(reader):
+    """Читает ответ HTTP/1.1, возвращает (статус, можно ли переиспользовать соединение)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Соединение закрыто сервером')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def worker(target, paths, deadline, results):
+    reader = writer = None
+    for path in paths:
+        if time.perf_counter() >= deadline:
+            break
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(target.host, target.port)
+            request = (
+                f'GET {target.prefix}{path} HTTP/1.1\r\n'
+                f'Host: {target.host}:{target.port}\r\n'
+                'Connection: keep-alive\r\n\r\n'
+            )
+            writer.write(request.encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            results['errors'] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        results['latencies'].append(time.perf_counter() - started)
+        if status >= 400:
+            results['errors'] += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(target, paths, concurrency, duration):
+    results = {'latencies': [], 'errors': 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    # У каждого клиента свой порядок путей, чтобы запросы не шли волнами
+    await asyncio.gather(*(
+        worker(target, cycle(paths[index % len(paths):] + paths[:index % len(paths)]), deadline, results)
+        for index in range(concurrency)
+    ))
+    return results, time.perf_counter() - started
+
+
+def percentile(ordered, share):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запущенных серверов: запросы в секунду и задержки p50/p99. '
+            'Например, WSGI (gunicorn) против ASGI (uvicorn) на одних и тех же страницах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='имя=http://хост:порт, например wsgi=http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Путь страницы (можно несколько раз), по умолчанию публичные страницы')
+        parser.add_argument('--concurrency', type=int, default=100, help='Одновременных клиентов')
+        parser.add_argument('--duration', type=float, default=10.0, help='Секунд на каждый сервер')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        targets = [Target(spec) for spec in options['targets']]
+        paths = options['paths'] or ['/', '/search/?title=%D0%BD%D0%BE%D0%B2%D0%BE%D1%81%D1%82%D1%8C', '/categories/']
+
+        report = {}
+        for target in targets:
+            results, elapsed = asyncio.run(run_load(target, paths, options['concurrency'], options['duration']))
+            latencies = sorted(results['latencies'])
+            report[target.name] = {
+                'requests': len(latencies),
+                'errors': results['errors'],
+                'rps': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+                'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            }
+
+        self.stdout.write(f'{"сервер":<12}{"запросов/с":>12}{"p50, мс":>10}{"p99, мс":>10}{"ошибок":>9}')
+        for name, stats in report.items():
+            self.stdout.write(
+                f'{name:<12}{stats["rps"]:>12.1f}{stats["p50_ms"]:>10.1f}{stats["p99_ms"]:>10.1f}{stats["errors"]:>9}'
+            )
+        if len(report) > 1:
+            (base_name, base), *others = report.items()
+            for name, stats in others:
+                if base['rps']:
+                    self.stdout.write(f'{name} / {base_name}: x{stats["rps"] / base["rps"]:.2f} по запросам в секунду')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'concurrency': options['concurrency'], 'paths': paths, 'results': report},
+                          file, ensure_ascii=False, indent=2)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from news import outbox
+from news.models import OutboxMessage
+
+
+class Command(BaseCommand):
+    help = 'Состояние очереди писем; отправка очереди, повтор неудачных и очистка отправленных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dispatch', action='store_true', help='Отправить готовые письма в этом процессе')
+        parser.add_argument('--limit', type=int, help='Не больше писем за запуск --dispatch')
+        parser.add_argument('--rate', type=float, help='Писем в секунду (по умолчанию NEWS_OUTBOX_RATE)')
+        parser.add_argument('--pool-size', type=int, help='Потоков с SMTP-соединением')
+        parser.add_argument('--retry-failed', action='store_true', help='Вернуть письма со статусом failed в очередь')
+        parser.add_argument('--purge', type=int, metavar='DAYS', help='Удалить отправленные письма старше DAYS дней')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            count = OutboxMessage.objects.filter(status=OutboxMessage.FAILED).update(
+                status=OutboxMessage.PENDING, attempts=0, next_attempt_at=timezone.now(),
+            )
+            self.stdout.write(f'Возвращено в очередь: {count}')
+
+        if options['dispatch']:
+            dispatcher = outbox.Dispatcher(pool_size=options['pool_size'], rate=options['rate'])
+            started = time.perf_counter()
+            stats = outbox.run_exclusive(dispatcher, options['limit'])
+            elapsed = time.perf_counter() - started
+            if stats is None:
+                raise CommandError('Очередь уже отправляет другой диспетчер (аренда OutboxLease)')
+            self.stdout.write(self.style.SUCCESS(
+                f'Отправлено {stats["sent"]} за {elapsed:.1f} с '
+                f'({stats["sent"] / elapsed if elapsed else 0:.1f} писем/с), '
+                f'отложено на повтор {stats["retried"]}, ошибок {stats["failed"]}'
+            ))
+
+        if options['purge'] is not None:
+            self.stdout.write(f'Удалено отправленных писем: {outbox.purge(options["purge"])}')
+
+        stats = outbox.stats()
+        self.stdout.write(
+            f'В очереди {stats[OutboxMessage.PENDING]}, отправляется {stats[OutboxMessage.SENDING]}, '
+            f'отправлено {stats[OutboxMessage.SENT]}, ошибок {stats[OutboxMessage.FAILED]}; '
+            f'самое старое письмо ждет {stats["oldest_pending_seconds"]:.0f} с, всего отправлено {stats["sent_total"]}'
+        )
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news import related
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие публикации (TF-IDF) для всех публикаций и сохраняет словарь для обновлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=related.BATCH_SIZE, help='Публикаций в одной пачке')
+
+    def handle(self, *args, **options):
+        if not related.available():
+            raise CommandError('Нужны numpy и scipy: pip install numpy scipy')
+        started = time.perf_counter()
+        posts, terms = related.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие публикации пересчитаны: {posts} публикаций, {terms} слов в словаре за {elapsed:.1f} с'
+        ))
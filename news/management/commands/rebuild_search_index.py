@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс публикаций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Публикаций в одной пачке')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        started = time.perf_counter()
+        total = backend.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс {backend.__class__.__name__} пересобран: {total} публикаций за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики категорий и публикаций'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = counters.reconcile()
+
+        if not any(fixed.values()):
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+            return
+        for name, count in fixed.items():
+            if count:
+                self.stdout.write(self.style.WARNING(f'{name}: исправлено значений - {count}'))
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
@@ -0,0 +1,130 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from news import counters
+from news.cache import LIST_VERSION, bump_versions
+from news.models import Category, Post, PostCategory, Subscription
+from news.search import get_backend as get_search_backend
+
+WORDS = (
+    'новость экономика политика спорт культура наука технологии город страна мир '
+    'президент команда матч выставка исследование рынок компания проект закон погода '
+    'фестиваль сезон открытие результат решение развитие событие история интервью обзор'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, категориями, подписками и публикациями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=float, default=3.0,
+                            help='Среднее количество подписок на пользователя')
+        parser.add_argument('--authors', type=float, default=0.05, help='Доля авторов среди пользователей')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней распределить публикации')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        categories = self.create_categories(options['categories'])
+        # Популярность категорий и активность авторов распределены по закону Ципфа
+        category_weights = [1 / rank for rank in range(1, len(categories) + 1)]
+        users = self.create_users(options['users'])
+        authors = self.create_authors(users, options['authors'])
+        self.create_subscriptions(users, categories, category_weights, options['subscriptions'])
+        self.create_posts(options['posts'], authors, categories, category_weights, options['days'])
+
+        self.stdout.write('Пересчет счетчиков и поискового индекса...')
+        counters.reconcile()
+        get_search_backend().rebuild(batch_size=self.batch_size)
+        bump_versions([LIST_VERSION])
+
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def create_categories(self, count):
+        existing = Category.objects.count()
+        Category.objects.bulk_create(
+            [Category(name=f'Категория {existing + i}') for i in range(count)],
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f'Категорий: {count}')
+        return list(Category.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, count):
+        # Один хеш на всех: make_password для каждого пользователя занял бы минуты
+        password = make_password(None)
+        start = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        created = []
+        for offset in range(0, count, self.batch_size):
+            batch = [
+                User(username=f'seed{start + i}', email=f'seed{start + i}@example.com', password=password)
+                for i in range(offset, min(offset + self.batch_size, count))
+            ]
+            created.extend(user.id for user in User.objects.bulk_create(batch))
+        self.stdout.write(f'Пользователей: {len(created)}')
+        return created
+
+    def create_authors(self, user_ids, share):
+        authors = self.rng.sample(user_ids, max(1, int(len(user_ids) * share))) if user_ids else []
+        group, _ = Group.objects.get_or_create(name='authors')
+        User.groups.through.objects.bulk_create(
+            [User.groups.through(user_id=user_id, group_id=group.id) for user_id in authors],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f'Авторов: {len(authors)}')
+        return authors or [None]
+
+    def create_subscriptions(self, user_ids, categories, weights, average):
+        now = timezone.now()
+        batch = []
+        total = 0
+        for user_id in user_ids:
+            count = min(len(categories), int(self.rng.expovariate(1 / average)) + 1) if average else 0
+            chosen = set(self.rng.choices(categories, weights, k=count))
+            batch.extend(Subscription(user_id=user_id, category_id=category_id, subscribed_at=now) for category_id in chosen)
+            if len(batch) >= self.batch_size:
+                total += len(Subscription.objects.bulk_create(batch, ignore_conflicts=True))
+                batch = []
+        total += len(Subscription.objects.bulk_create(batch, ignore_conflicts=True))
+        self.stdout.write(f'Подписок: {total}')
+
+    def create_posts(self, count, authors, categories, category_weights, days):
+        now = timezone.now()
+        author_weights = [1 / rank for rank in range(1, len(authors) + 1)]
+        created = 0
+        while created < count:
+            size = min(self.batch_size, count - created)
+            posts = []
+            for _ in range(size):
+                title = ' '.join(self.rng.choices(WORDS, k=self.rng.randint(3, 8))).capitalize()
+                content = ' '.join(self.rng.choices(WORDS, k=self.rng.randint(50, 400)))
+                posts.append(Post(
+                    title=title,
+                    content=content,
+                    post_type=self.rng.choice(('news', 'article')),
+                    author_id=self.rng.choices(authors, author_weights)[0],
+                    pub_date=now - timedelta(seconds=self.rng.randint(0, days * 86400)),
+                ))
+            with transaction.atomic():
+                posts = Post.objects.bulk_create(posts)
+                links = []
+                for post in posts:
+                    chosen = {self.rng.choices(categories, category_weights)[0] for _ in range(self.rng.randint(1, 3))}
+                    links.extend(PostCategory(post_id=post.id, category_id=category_id) for category_id in chosen)
+                PostCategory.objects.bulk_create(links)
+            created += size
+            self.stdout.write(f'Публикаций: {created}/{count}')
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import signal
+import time
+from contextlib import suppress
+
+from django.core.management.base import BaseCommand
+
+
+class SinkProtocol(asyncio.Protocol):
+    """Минимальный SMTP-сервер: принимает письма и никуда их не отправляет"""
+
+    def __init__(self, command):
+        self.command = command
+        self.buffer = b''
+        self.in_data = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.command.connections += 1
+        self.reply('220 localhost smtp_sink')
+
+    def reply(self, line):
+        self.transport.write(line.encode() + b'\r\n')
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            if self.in_data:
+                end = self.buffer.find(b'\r\n.\r\n')
+                if end < 0:
+                    return
+                self.buffer = self.buffer[end + 5:]
+                self.in_data = False
+                self.message_received()
+                continue
+            line, separator, rest = self.buffer.partition(b'\r\n')
+            if not separator:
+                return
+            self.buffer = rest
+            self.handle_line(line.decode('latin-1'))
+
+    def handle_line(self, line):
+        verb = line[:4].upper()
+        if verb == 'EHLO':
+            self.transport.write(b'250-localhost\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n')
+        elif verb == 'DATA':
+            self.in_data = True
+            self.reply('354 End data with <CR><LF>.<CR><LF>')
+        elif verb == 'QUIT':
+            self.reply('221 Bye')
+            self.transport.close()
+        elif verb in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+            self.reply('250 OK')
+        else:
+            self.reply('502 Command not implemented')
+
+    def message_received(self):
+        if random.random() < self.command.fail_rate:
+            self.command.failed += 1
+            self.reply('451 Temporary failure, try again later')
+            return
+        if self.command.delay:
+            # Задержка ответа имитирует медленный сервер, не блокируя другие соединения
+            asyncio.get_running_loop().call_later(self.command.delay, self.accept)
+        else:
+            self.accept()
+
+    def accept(self):
+        self.command.received += 1
+        if not self.transport.is_closing():
+            self.reply('250 Message accepted')
+
+
+class Command(BaseCommand):
+    help = ('Локальная заглушка SMTP для проверки рассылок: принимает письма, считает их, '
+            'может отвечать временной ошибкой и с задержкой')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='Доля писем с ответом 451')
+        parser.add_argument('--delay', type=float, default=0.0, help='Секунд до ответа на каждое письмо')
+
+    def handle(self, *args, **options):
+        self.fail_rate = options['fail_rate']
+        self.delay = options['delay']
+        self.received = self.failed = self.connections = 0
+        asyncio.run(self.serve(options['host'], options['port']))
+        self.stdout.write(f'Принято {self.received}, отклонено {self.failed}, соединений {self.connections}')
+
+    async def serve(self, host, port):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            # Без обработчика фоновый процесс не получает KeyboardInterrupt и не выводит итог
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(signum, stop.set)
+
+        server = await loop.create_server(lambda: SinkProtocol(self), host, port)
+        self.stdout.write(f'SMTP-заглушка слушает {host}:{port}, Ctrl+C для остановки')
+        self.stdout.flush()
+        async with server:
+            last, started = 0, time.perf_counter()
+            while not stop.is_set():
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), 5)
+                if self.received != last:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'Принято {self.received} ({(self.received - last) / elapsed:.1f} писем/с)')
+                    self.stdout.flush()
+                last, started = self.received, time.perf_counter()
@@ -0,0 +1,270 @@
+# news/metrics.py
+"""Метрики производительности запросов.
+
+Для каждого запроса в contextvar собираются число и время SQL-запросов,
+время рендеринга шаблонов и попадания в кеш страниц. Middleware отдает их
+в заголовке Server-Timing и складывает в гистограммы по имени URL, которые
+view metrics выводит в текстовом формате Prometheus вместе с глубиной
+очереди писем (news/outbox.py).
+
+Гистограммы хранятся в памяти процесса: при нескольких воркерах каждый
+отдает свои значения, суммирует их Prometheus. Сбор метрик - это несколько
+вызовов perf_counter и сложений на запрос, поэтому его можно не отключать.
+"""
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+
+# Границы корзин гистограмм: секунды для времени, штуки для запросов
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar('news_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'template_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса"""
+    return _current.get()
+
+
+def query_timer(execute, sql, params, many, context):
+    """execute_wrapper соединения: считает запросы текущего запроса"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_timer(connection):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Стандартный бэкенд шаблонов Django с замером времени рендеринга"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Гистограммы и счетчики по имени URL"""
+
+    histograms = (
+        ('news_request_duration_seconds', 'Время обработки запроса', DURATION_BUCKETS),
+        ('news_request_db_seconds', 'Время SQL-запросов', DURATION_BUCKETS),
+        ('news_request_template_seconds', 'Время рендеринга шаблонов', DURATION_BUCKETS),
+        ('news_request_db_queries', 'Число SQL-запросов', QUERY_BUCKETS),
+    )
+    counters = (
+        ('news_page_cache_hits_total', 'Попадания в кеш страниц'),
+        ('news_page_cache_misses_total', 'Промахи кеша страниц'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, duration, metrics):
+        values = (duration, metrics.db_time, metrics.template_time, metrics.queries)
+        with self._lock:
+            entry = self._views.get(view)
+            if entry is None:
+                entry = self._views[view] = (
+                    [Histogram(buckets) for _, _, buckets in self.histograms],
+                    [0] * len(self.counters),
+                )
+            for histogram, value in zip(entry[0], values):
+                histogram.observe(value)
+            entry[1][0] += metrics.cache_hits
+            entry[1][1] += metrics.cache_misses
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+            for index, (name, description, buckets) in enumerate(self.histograms):
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for view, (histograms, _) in views:
+                    histogram = histograms[index]
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+            for index, (name, description) in enumerate(self.counters):
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+                for view, (_, counts) in views:
+                    lines.append(f'{name}{{view="{view}"}} {counts[index]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def server_timing(duration, metrics):
+    return ', '.join((
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'tpl;dur={metrics.template_time * 1000:.1f}',
+        f'cache;desc="hit={metrics.cache_hits} miss={metrics.cache_misses}"',
+        f'total;dur={duration * 1000:.1f}',
+    ))
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса, добавляет заголовок Server-Timing
+
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать время остальных.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, metrics)
+
+    def finish(self, request, response, duration, metrics):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unresolved'
+        if view != 'metrics':
+            registry.observe(view, duration, metrics)
+        if getattr(settings, 'NEWS_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(duration, metrics)
+        return response
+
+
+def outbox_metrics():
+    """Глубина очереди писем и число отправленных; скорость - rate() от news_outbox_sent_total"""
+    from . import outbox
+
+    stats = outbox.stats()
+    lines = ['# HELP news_outbox_messages Писем в очереди по статусам', '# TYPE news_outbox_messages gauge']
+    for status, _ in outbox.OutboxMessage.STATUSES:
+        lines.append(f'news_outbox_messages{{status="{status}"}} {stats[status]}')
+    lines += [
+        '# HELP news_outbox_oldest_pending_seconds Возраст самого старого письма в очереди',
+        '# TYPE news_outbox_oldest_pending_seconds gauge',
+        f'news_outbox_oldest_pending_seconds {stats["oldest_pending_seconds"]:.1f}',
+        '# HELP news_outbox_sent_total Отправлено писем',
+        '# TYPE news_outbox_sent_total counter',
+        f'news_outbox_sent_total {stats["sent_total"]}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    if getattr(request, 'user', None) is not None and request.user.is_staff:
+        return True
+    token = getattr(settings, 'NEWS_METRICS_TOKEN', '')
+    if token:
+        return request.headers.get('Authorization') == f'Bearer {token}'
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.NEWS_METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    """Гистограммы в текстовом формате Prometheus
+
+    Доступны сотрудникам (is_staff) и, если задан NEWS_METRICS_TOKEN,
+    запросам с заголовком Authorization: Bearer <токен>. Без токена
+    вместо него проверяется адрес клиента по NEWS_METRICS_ALLOWED_IPS
+    (по умолчанию только localhost): выдача считает очередь писем в базе
+    и не должна быть доступна всем.
+    """
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render() + outbox_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from .groups import GROUPS_ATTR, SESSION_KEY, get_version
+
+
+class UserGroupsMiddleware(MiddlewareMixin):
+    """Хранит группы пользователя в сессии между запросами
+
+    Включается настройкой NEWS_SESSION_GROUP_CACHE. Без нее группы
+    кешируются только в пределах запроса (см. news.groups). Группы из
+    сессии используются, только если их версия совпадает с версией в кеше.
+    """
+
+    def process_request(self, request):
+        if not getattr(settings, 'NEWS_SESSION_GROUP_CACHE', False):
+            return
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return
+
+        stored = request.session.get(SESSION_KEY)
+        version = get_version(user.pk)
+        if stored and stored.get('version') == version:
+            setattr(user, GROUPS_ATTR, frozenset(stored['names']))
+        request._group_cache_version = version
+
+    def process_response(self, request, response):
+        version = getattr(request, '_group_cache_version', None)
+        if version is None:
+            return response
+
+        names = getattr(request.user, GROUPS_ATTR, None)
+        stored = request.session.get(SESSION_KEY)
+        if names is not None and (not stored or stored.get('version') != version):
+            request.session[SESSION_KEY] = {'version': version, 'names': sorted(names)}
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_category_postcategory_post_categories_subscription_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(verbose_name='Начало периода')),
+                ('period_end', models.DateTimeField(verbose_name='Конец периода')),
+                ('last_user_id', models.BigIntegerField(default=0, verbose_name='Последний обработанный пользователь')),
+                ('emails_sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено писем')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начало рассылки')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание рассылки')),
+            ],
+            options={
+                'verbose_name': 'Запуск рассылки',
+                'verbose_name_plural': 'Запуски рассылки',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
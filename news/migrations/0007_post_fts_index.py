@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:10
+
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS news_post_fts "
+        "USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO news_post_fts(rowid, title, content) "
+        "SELECT id, title, content FROM news_post"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS news_post_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_censoredword'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
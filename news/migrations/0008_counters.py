@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Category = apps.get_model('news', 'Category')
+    PostCategory = apps.get_model('news', 'PostCategory')
+    Subscription = apps.get_model('news', 'Subscription')
+    Post = apps.get_model('news', 'Post')
+    Counter = apps.get_model('news', 'Counter')
+
+    def count_by_category(model):
+        return Subquery(
+            model.objects.filter(category=OuterRef('pk'))
+            .values('category')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+
+    Category.objects.update(
+        post_count=Coalesce(count_by_category(PostCategory), 0),
+        subscriber_count=Coalesce(count_by_category(Subscription), 0),
+    )
+    Counter.objects.update_or_create(key='posts_total', defaults={'value': Post.objects.count()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_post_fts_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Ключ')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счетчик',
+                'verbose_name_plural': 'Счетчики',
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество публикаций'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
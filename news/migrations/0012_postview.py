@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Час')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_buckets', to='news.post', verbose_name='Публикация')),
+            ],
+            options={
+                'verbose_name': 'Просмотры за час',
+                'verbose_name_plural': 'Просмотры за час',
+                'indexes': [models.Index(fields=['hour'], name='news_postview_hour')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'hour'), name='news_postview_post_hour')],
+            },
+        ),
+    ]
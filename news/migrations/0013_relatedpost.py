@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0012_postview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Близость')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='news.post', verbose_name='Публикация')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='news.post', verbose_name='Похожая публикация')),
+            ],
+            options={
+                'verbose_name': 'Похожая публикация',
+                'verbose_name_plural': 'Похожие публикации',
+                'constraints': [models.UniqueConstraint(fields=('post', 'related'), name='news_relatedpost_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0013_relatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxLease',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Имя')),
+                ('token', models.CharField(max_length=32, verbose_name='Токен')),
+                ('expires_at', models.DateTimeField(verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Аренда диспетчера',
+                'verbose_name_plural': 'Аренды диспетчера',
+            },
+        ),
+    ]
@@ -10,6 +10,9 @@ from django import forms
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название категории")
     subscribers = models.ManyToManyField(User, through='Subscription', related_name='subscribed_categories')
+    # Денормализованные счетчики, обновляются сигналами (см. news/counters.py)
+    post_count = models.PositiveIntegerField(default=0, verbose_name="Количество публикаций")
+    subscriber_count = models.PositiveIntegerField(default=0, verbose_name="Количество подписчиков")
 
     def __str__(self):
         return self.name
@@ -26,6 +29,8 @@ class Subscription(models.Model):
 
     class Meta:
         unique_together = ('user', 'category')  # Одна подписка на категорию для пользователя
+        # Индекс unique_together начинается с user, для выборки подписчиков категории нужен обратный
+        indexes = [models.Index(fields=['category', 'user'], name='news_subscr_category_user')]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
 
@@ -41,6 +46,7 @@ class PostCategory(models.Model):
         return f"{self.post.title} - {self.category.name}"
 
     class Meta:
+        indexes = [models.Index(fields=['category', 'post'], name='news_postcat_category_post')]
         verbose_name = "Категория публикации"
         verbose_name_plural = "Категории публикаций"
 
@@ -54,6 +60,7 @@ class Post(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     content = models.TextField(verbose_name="Содержание")
     pub_date = models.DateTimeField(default=timezone.now, verbose_name="Дата публикации")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
     post_type = models.CharField(max_length=10, choices=POST_TYPES, default='news', verbose_name="Тип")
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -72,6 +79,153 @@ class Post(models.Model):
         verbose_name = "Публикация"
         verbose_name_plural = "Публикации"
         ordering = ['-pub_date']
+        indexes = [
+            # Списки и курсорная пагинация сортируют по (pub_date, id)
+            models.Index(fields=['pub_date', 'id'], name='news_post_pub_date_id'),
+            models.Index(fields=['post_type', 'pub_date'], name='news_post_type_pub_date'),
+        ]
+
+
+class Counter(models.Model):
+    """Именованный счетчик для чтения итоговых значений за O(1)"""
+    key = models.CharField(max_length=100, unique=True, verbose_name="Ключ")
+    value = models.BigIntegerField(default=0, verbose_name="Значение")
+
+    def __str__(self):
+        return f"{self.key}: {self.value}"
+
+    class Meta:
+        verbose_name = "Счетчик"
+        verbose_name_plural = "Счетчики"
+
+
+class PostView(models.Model):
+    """Просмотры публикации за час; заполняются пачками (см. news/pageviews.py)"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='view_buckets', verbose_name="Публикация")
+    hour = models.DateTimeField(verbose_name="Час")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
+
+    def __str__(self):
+        return f"{self.post_id} {self.hour:%Y-%m-%d %H}: {self.views}"
+
+    class Meta:
+        verbose_name = "Просмотры за час"
+        verbose_name_plural = "Просмотры за час"
+        constraints = [models.UniqueConstraint(fields=['post', 'hour'], name='news_postview_post_hour')]
+        # Рейтинг за 24 часа и 7 дней читает только корзины своего окна
+        indexes = [models.Index(fields=['hour'], name='news_postview_hour')]
+
+
+class RelatedPost(models.Model):
+    """Похожая публикация с косинусной близостью TF-IDF (см. news/related.py)"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links', verbose_name="Публикация")
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', verbose_name="Похожая публикация")
+    score = models.FloatField(verbose_name="Близость")
+
+    def __str__(self):
+        return f"{self.post_id} -> {self.related_id} ({self.score:.2f})"
+
+    class Meta:
+        verbose_name = "Похожая публикация"
+        verbose_name_plural = "Похожие публикации"
+        constraints = [models.UniqueConstraint(fields=['post', 'related'], name='news_relatedpost_pair')]
+
+
+class DigestRun(models.Model):
+    """Запуск еженедельной рассылки с контрольной точкой для возобновления"""
+    period_start = models.DateTimeField(verbose_name="Начало периода")
+    period_end = models.DateTimeField(verbose_name="Конец периода")
+    last_user_id = models.BigIntegerField(default=0, verbose_name="Последний обработанный пользователь")
+    emails_sent = models.PositiveIntegerField(default=0, verbose_name="Отправлено писем")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="Начало рассылки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание рассылки")
+
+    def __str__(self):
+        return f"Рассылка {self.period_start:%d.%m.%Y} - {self.period_end:%d.%m.%Y}"
+
+    class Meta:
+        verbose_name = "Запуск рассылки"
+        verbose_name_plural = "Запуски рассылки"
+        ordering = ['-started_at']
+
+
+class OutboxMessage(models.Model):
+    """Письмо в очереди на отправку (см. news/outbox.py)"""
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'В очереди'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    # Ключ идемпотентности: повторная постановка того же письма игнорируется
+    key = models.CharField(max_length=200, unique=True, verbose_name="Ключ")
+    to = models.EmailField(verbose_name="Получатель")
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст")
+    html_body = models.TextField(blank=True, verbose_name="HTML")
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    # Для pending - время следующей попытки, для sending - окончание аренды воркером
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    def __str__(self):
+        return f"{self.to}: {self.subject}"
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь писем"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='news_outbox_status_next')]
+
+
+class OutboxLease(models.Model):
+    """Аренда диспетчера outbox в базе: письма одновременно отправляет один процесс"""
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="Имя")
+    # Случайный токен владельца: снять аренду может только тот, кто ее взял
+    token = models.CharField(max_length=32, verbose_name="Токен")
+    expires_at = models.DateTimeField(verbose_name="Истекает")
+
+    def __str__(self):
+        return f"{self.name} до {self.expires_at:%d.%m.%Y %H:%M:%S}"
+
+    class Meta:
+        verbose_name = "Аренда диспетчера"
+        verbose_name_plural = "Аренды диспетчера"
+
+
+class PendingNotification(models.Model):
+    """Публикация, уведомление о которой ждет рассылки по окну автора (tasks.send_author_notifications)"""
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name='+', verbose_name="Публикация",
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создано")
+
+    def __str__(self):
+        return f"Уведомление о публикации {self.post_id}"
+
+    class Meta:
+        verbose_name = "Ожидающее уведомление"
+        verbose_name_plural = "Ожидающие уведомления"
+
+
+class CensoredWord(models.Model):
+    """Слово, которое заменяется звездочками фильтром censor"""
+    word = models.CharField(max_length=100, unique=True, verbose_name="Слово")
+
+    def __str__(self):
+        return self.word
+
+    class Meta:
+        verbose_name = "Запрещенное слово"
+        verbose_name_plural = "Запрещенные слова"
+        ordering = ['word']
 
 
 class PostForm(forms.ModelForm):
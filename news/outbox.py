@@ -0,0 +1,295 @@
+# news/outbox.py
+"""Очередь исходящих писем.
+
+Задачи рассылок не отправляют письма сами, а пачкой записывают их в
+OutboxMessage. Ключ идемпотентности уникален, поэтому повторно запущенная
+задача не создает дублей. Диспетчер забирает готовые письма (статус
+sending с арендой на случай падения воркера) и отправляет их через пул
+потоков, у каждого из которых одно постоянное SMTP-соединение. Общий
+ограничитель скорости держит не больше NEWS_OUTBOX_RATE писем в секунду.
+Неудачная отправка повторяется с экспоненциальной задержкой, после
+NEWS_OUTBOX_MAX_ATTEMPTS попыток письмо получает статус failed.
+
+Вся работа с базой идет в потоке диспетчера, потоки пула только говорят
+с SMTP-сервером.
+
+Одновременно работает один диспетчер: run_exclusive берет аренду
+OutboxLease в базе, а не в кеше, поэтому единственность и общий предел
+NEWS_OUTBOX_RATE держатся и с кешем в памяти процесса (LocMemCache), у
+которого у каждого воркера своя копия.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import counters
+from .models import OutboxLease, OutboxMessage
+
+SENT_TOTAL = 'outbox_sent_total'
+DISPATCH_LEASE = 'dispatch'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def message(key, to, subject, body, html_body=''):
+    """Несохраненное письмо для enqueue"""
+    return OutboxMessage(key=key, to=to, subject=subject, body=body, html_body=html_body)
+
+
+def enqueue(messages):
+    """Ставит письма в очередь одним INSERT, возвращает число новых писем
+
+    Письма с уже известным ключом отбрасываются заранее, поэтому результат
+    не учитывает повторы. ignore_conflicts остается на случай, если тот же
+    ключ одновременно вставляет другой воркер.
+    """
+    fresh = {}
+    for row in messages:
+        fresh.setdefault(row.key, row)
+    keys = list(fresh)
+    for start in range(0, len(keys), 500):
+        for key in OutboxMessage.objects.filter(key__in=keys[start:start + 500]).values_list('key', flat=True):
+            del fresh[key]
+    if fresh:
+        OutboxMessage.objects.bulk_create(list(fresh.values()), ignore_conflicts=True, batch_size=500)
+    return len(fresh)
+
+
+def claim(limit, lease=None):
+    """Забирает до limit готовых писем: статус sending и аренда на lease секунд
+
+    Письма, аренда которых истекла (воркер упал посреди отправки), снова
+    считаются готовыми. В SQLite транзакция берет блокировку записи сразу
+    (transaction_mode IMMEDIATE), в других базах строки блокируются
+    select_for_update(skip_locked=True), поэтому два диспетчера не получат
+    одно письмо.
+    """
+    lease = lease if lease is not None else _setting('NEWS_OUTBOX_LEASE', 300)
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutboxMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(status__in=[OutboxMessage.PENDING, OutboxMessage.SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:limit]
+        )
+        if rows:
+            OutboxMessage.objects.filter(id__in=[row.id for row in rows]).update(
+                status=OutboxMessage.SENDING, next_attempt_at=now + timedelta(seconds=lease),
+            )
+    return rows
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: base * 2^(attempts - 1), не больше часа"""
+    base = _setting('NEWS_OUTBOX_RETRY_DELAY', 30)
+    return min(base * 2 ** max(attempts - 1, 0), 3600)
+
+
+def _email(row):
+    domain = (settings.DEFAULT_FROM_EMAIL or 'localhost').rpartition('@')[2] or 'localhost'
+    email = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[row.to],
+        # Постоянный Message-ID: почтовый сервер распознает повтор, если письмо ушло дважды
+        headers={'Message-ID': f'<{hashlib.sha1(row.key.encode()).hexdigest()}@{domain}>'},
+    )
+    if row.html_body:
+        email.attach_alternative(row.html_body, 'text/html')
+    return email
+
+
+class RateLimiter:
+    """Токен-бакет, общий для потоков пула; rate=0 отключает ограничение"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Dispatcher:
+    """Отправляет очередь через пул потоков с постоянными SMTP-соединениями"""
+
+    def __init__(self, pool_size=None, rate=None, batch_size=None, max_attempts=None):
+        self.pool_size = pool_size or _setting('NEWS_OUTBOX_POOL_SIZE', 4)
+        self.batch_size = batch_size or _setting('NEWS_OUTBOX_BATCH_SIZE', 100)
+        self.max_attempts = max_attempts or _setting('NEWS_OUTBOX_MAX_ATTEMPTS', 5)
+        self.limiter = RateLimiter(_setting('NEWS_OUTBOX_RATE', 10) if rate is None else rate)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = get_connection(fail_silently=False)
+            connection.open()
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send(self, row):
+        """Выполняется в потоке пула: (id, текст ошибки или None)"""
+        self.limiter.acquire()
+        try:
+            self._connection().send_messages([_email(row)])
+        except Exception as error:
+            # После ошибки соединение может быть в неизвестном состоянии, откроем новое
+            self._drop_connection()
+            return row, f'{type(error).__name__}: {error}'
+        return row, None
+
+    def _record(self, results):
+        now = timezone.now()
+        sent_ids = [row.id for row, error in results if error is None]
+        failed = []
+        for row, error in results:
+            if error is None:
+                continue
+            row.attempts += 1
+            row.last_error = error[:1000]
+            if row.attempts >= self.max_attempts:
+                row.status = OutboxMessage.FAILED
+                self.stats['failed'] += 1
+            else:
+                row.status = OutboxMessage.PENDING
+                row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+                self.stats['retried'] += 1
+            failed.append(row)
+
+        if sent_ids:
+            OutboxMessage.objects.filter(id__in=sent_ids).update(status=OutboxMessage.SENT, sent_at=now)
+            counters.increment(SENT_TOTAL, len(sent_ids))
+            self.stats['sent'] += len(sent_ids)
+        if failed:
+            OutboxMessage.objects.bulk_update(failed, ['status', 'attempts', 'last_error', 'next_attempt_at'])
+
+    def run(self, limit=None, deadline=None):
+        """Отправляет готовые письма, пока очередь не опустеет или не наберется limit
+
+        deadline - момент по time.monotonic(), после которого новые пачки не
+        забираются; уже забранная пачка отправляется до конца.
+        """
+        processed = 0
+        with ThreadPoolExecutor(self.pool_size, thread_name_prefix='outbox') as pool:
+            try:
+                while limit is None or processed < limit:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+                    size = self.batch_size if limit is None else min(self.batch_size, limit - processed)
+                    rows = claim(size)
+                    if not rows:
+                        break
+                    self._record(list(pool.map(self._send, rows)))
+                    processed += len(rows)
+            finally:
+                with self._connections_lock:
+                    connections, self._connections = self._connections, []
+                for connection in connections:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+        return self.stats
+
+
+def acquire_lease(seconds, name=DISPATCH_LEASE):
+    """Берет аренду на seconds секунд; токен или None, если ее держит другой процесс"""
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=seconds)
+    # Каждый запрос атомарен сам по себе: истекшую аренду (владелец упал)
+    # забирает UPDATE, свободную - INSERT, который при занятом имени ничего не делает
+    if OutboxLease.objects.filter(name=name, expires_at__lte=now).update(token=token, expires_at=expires_at):
+        return token
+    OutboxLease.objects.bulk_create([OutboxLease(name=name, token=token, expires_at=expires_at)], ignore_conflicts=True)
+    return token if OutboxLease.objects.filter(name=name, token=token).exists() else None
+
+
+def release_lease(token, name=DISPATCH_LEASE):
+    """Снимает аренду, только если она все еще принадлежит token"""
+    OutboxLease.objects.filter(name=name, token=token).delete()
+
+
+def run_exclusive(dispatcher, limit=None, lease=None):
+    """Запускает dispatcher под арендой; None, если отправляет другой процесс
+
+    Новые пачки забираются только первую половину аренды: последняя успевает
+    уйти до ее истечения, и второй диспетчер не начнет работу параллельно.
+    В stats['deadline_reached'] - остановился ли запуск по сроку, то есть
+    остаток очереди нужно передать следующему запуску.
+    """
+    lease = lease or _setting('NEWS_OUTBOX_LEASE', 300)
+    token = acquire_lease(lease)
+    if token is None:
+        return None
+    deadline = time.monotonic() + lease / 2
+    try:
+        stats = dispatcher.run(limit, deadline=deadline)
+    finally:
+        release_lease(token)
+    stats['deadline_reached'] = time.monotonic() >= deadline
+    return stats
+
+
+def stats():
+    """Глубина очереди по статусам, возраст старейшего готового письма и всего отправлено"""
+    now = timezone.now()
+    result = {status: 0 for status, _ in OutboxMessage.STATUSES}
+    rows = OutboxMessage.objects.values('status').annotate(total=Count('id'), oldest=Min('created_at'))
+    oldest = None
+    for row in rows.order_by():
+        result[row['status']] = row['total']
+        if row['status'] == OutboxMessage.PENDING:
+            oldest = row['oldest']
+    result['oldest_pending_seconds'] = (now - oldest).total_seconds() if oldest else 0.0
+    result['sent_total'] = counters.get_value(SENT_TOTAL)
+    return result
+
+
+def purge(days):
+    """Удаляет отправленные письма старше days дней, возвращает количество"""
+    deleted, _ = OutboxMessage.objects.filter(
+        status=OutboxMessage.SENT, sent_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
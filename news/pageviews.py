@@ -0,0 +1,229 @@
+# news/pageviews.py
+"""Просмотры публикаций и рейтинг самых читаемых.
+
+Просмотр news_detail не пишет в базу: record увеличивает счетчик в памяти
+процесса под блокировкой (единицы микросекунд). Каждые NEWS_VIEWS_PUSH_SIZE
+просмотров или NEWS_VIEWS_PUSH_INTERVAL секунд накопленное уходит в кеш
+одной записью pageviews:batch:<номер>, номер выдает cache.incr. Задача
+flush_post_views (Celery beat, раз в минуту) забирает пачки, одним upsert
+складывает их в часовые корзины PostView и пересчитывает рейтинги за 24
+часа и 7 дней. Виджет most_read читает готовый рейтинг из кеша.
+
+Пачки веб-процессов должен видеть воркер Celery, поэтому нужен общий кеш
+(Redis, REDIS_CACHE_URL). С LocMemCache (NEWS_VIEWS_VIA_CACHE = False)
+пачка сразу складывается в PostView тем же upsert, а flush только
+пересчитывает рейтинги. Счет приблизительный: при аварийной остановке
+процесса теряется неотправленная часть буфера.
+"""
+import atexit
+import threading
+import time
+from collections import Counter as Tally
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import invalidate_rankings
+from .db import retry_on_db_lock
+from .models import Post, PostView
+
+SEQ_KEY = 'pageviews:seq'
+FLUSHED_KEY = 'pageviews:flushed'
+# Номер пачки выдается до ее записи: пачки чуть старше последнего сброса
+# перечитываются, если запись не успела к предыдущему сбросу
+GRACE = 100
+BATCH_TIMEOUT = 24 * 3600
+# Рейтинг пересчитывается каждым сбросом; если сбросы остановились, устаревший
+# рейтинг пропадает со страниц через час
+RANKING_TIMEOUT = 3600
+WINDOWS = {'24h': timedelta(hours=24), '7d': timedelta(days=7)}
+
+
+def _batch_key(seq):
+    return f'pageviews:batch:{seq}'
+
+
+def _ranking_key(window):
+    return f'pageviews:top:{window}'
+
+
+def _hour(index):
+    return datetime.fromtimestamp(index * 3600, tz=dt_timezone.utc)
+
+
+def push(hits):
+    """Отправляет {(post_id, номер часа): просмотры} в кеш одной пачкой
+
+    Если кеш у процессов свой, пачка сразу пишется в базу: воркер ее бы не увидел.
+    """
+    if not hits:
+        return
+    if not getattr(settings, 'NEWS_VIEWS_VIA_CACHE', True):
+        _save(hits)
+        return
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, None)
+        seq = cache.incr(SEQ_KEY)
+    cache.set(_batch_key(seq), [(post_id, hour, views) for (post_id, hour), views in hits.items()], BATCH_TIMEOUT)
+
+
+class ViewBuffer:
+    """Просмотры процесса, еще не отправленные в кеш"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Tally()
+        self.size = 0
+        self.started = time.monotonic()
+
+    def add(self, post_id):
+        now = time.time()
+        with self.lock:
+            self.hits[post_id, int(now // 3600)] += 1
+            self.size += 1
+            if (
+                self.size < settings.NEWS_VIEWS_PUSH_SIZE
+                and time.monotonic() - self.started < settings.NEWS_VIEWS_PUSH_INTERVAL
+            ):
+                return
+            hits = self._take()
+        push(hits)
+
+    def _take(self):
+        hits, self.hits, self.size, self.started = self.hits, Tally(), 0, time.monotonic()
+        return hits
+
+    def take(self):
+        """Забирает накопленные просмотры, не отправляя их"""
+        with self.lock:
+            return self._take()
+
+    def drain(self):
+        push(self.take())
+
+
+buffer = ViewBuffer()
+atexit.register(buffer.drain)
+
+
+def record(post_id):
+    buffer.add(post_id)
+
+
+def count_views(post_id):
+    """Декоратор представления публикации: считает ответы 200 и 304 на GET
+
+    post_id(request, *args, **kwargs) возвращает id публикации. Ставится
+    над кешем страниц, чтобы считались и ответы из кеша.
+    """
+    def counted(request, response, args, kwargs):
+        if request.method == 'GET' and response.status_code in (200, 304):
+            record(post_id(request, *args, **kwargs))
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                return counted(request, await view(request, *args, **kwargs), args, kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return counted(request, view(request, *args, **kwargs), args, kwargs)
+        return wrapper
+    return decorator
+
+
+@retry_on_db_lock()
+def _save(totals):
+    hours = {index: _hour(index) for _, index in totals}
+    post_ids = {post_id for post_id, _ in totals}
+    with transaction.atomic():
+        existing = {
+            (post_id, hour): views
+            for post_id, hour, views in PostView.objects.filter(
+                post_id__in=post_ids, hour__in=hours.values(),
+            ).values_list('post_id', 'hour', 'views')
+        }
+        # Просмотры удаленных публикаций отбрасываются
+        alive = set(Post.objects.filter(id__in=post_ids).order_by().values_list('id', flat=True))
+        PostView.objects.bulk_create(
+            [
+                PostView(post_id=post_id, hour=hours[index], views=existing.get((post_id, hours[index]), 0) + views)
+                for (post_id, index), views in totals.items()
+                if post_id in alive
+            ],
+            update_conflicts=True,
+            unique_fields=['post', 'hour'],
+            update_fields=['views'],
+        )
+
+
+def flush():
+    """Переносит пачки из кеша в часовые корзины и пересчитывает рейтинги
+
+    Возвращает число перенесенных просмотров. Одновременно должен работать
+    один сброс (см. tasks.flush_post_views).
+    """
+    last = cache.get(SEQ_KEY, 0)
+    flushed = cache.get(FLUSHED_KEY, 0)
+    if flushed > last:
+        # Счетчик пачек вытеснен из кеша и начался заново
+        flushed = 0
+    batches = cache.get_many([_batch_key(seq) for seq in range(max(flushed - GRACE, 0) + 1, last + 1)])
+
+    totals = Tally()
+    for batch in batches.values():
+        for post_id, hour, views in batch:
+            totals[post_id, hour] += views
+    if totals:
+        _save(totals)
+    cache.delete_many(list(batches))
+    cache.set(FLUSHED_KEY, last, None)
+
+    PostView.objects.filter(hour__lt=timezone.now() - timedelta(days=settings.NEWS_VIEWS_RETENTION_DAYS)).delete()
+    tops = {_ranking_key(window): top for window, top in rankings().items()}
+    previous = cache.get_many(list(tops))
+    cache.set_many(tops, RANKING_TIMEOUT)
+    if previous != tops:
+        # Рейтинг выводится на закешированной главной: новая версия сбрасывает ее и ETag
+        invalidate_rankings()
+    return sum(totals.values())
+
+
+def rankings(limit=None):
+    """Самые читаемые публикации окон: {окно: [{'id', 'title', 'views'}]} по убыванию просмотров"""
+    now = timezone.now()
+    tops = {}
+    for window, length in WINDOWS.items():
+        since = (now - length).replace(minute=0, second=0, microsecond=0)
+        tops[window] = list(
+            PostView.objects.filter(hour__gte=since)
+            .values('post_id')
+            .annotate(total=Sum('views'))
+            .order_by('-total', '-post_id')
+            .values_list('post_id', 'total')[:limit or settings.NEWS_MOST_READ_LIMIT]
+        )
+    post_ids = {post_id for top in tops.values() for post_id, _ in top}
+    titles = dict(Post.objects.filter(id__in=post_ids).order_by().values_list('id', 'title'))
+    return {
+        window: [{'id': post_id, 'title': titles[post_id], 'views': views} for post_id, views in top if post_id in titles]
+        for window, top in tops.items()
+    }
+
+
+def most_read(window):
+    """Готовый рейтинг окна из кеша или пустой список до ближайшего сброса
+
+    Запрос страницы рейтинг не считает: его пересчитывает только flush.
+    """
+    return cache.get(_ranking_key(window)) or []
@@ -0,0 +1,309 @@
+# news/pagination.py
+"""Курсорная (keyset) пагинация.
+
+Вместо OFFSET страница задается ключом (pub_date, id) соседней записи,
+поэтому запрос к любой странице использует индекс и стоит одинаково.
+Курсоры непрозрачны для клиента: это base64 от JSON с ключом, направлением
+и номером страницы (номер используется только для отображения).
+Общее количество записей считается только по запросу и для перехода на
+последнюю страницу: она неполная, как и при обычной нумерации.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from functools import cached_property
+
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+LAST = 'l'
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает курсор, возвращает None для пустого или поврежденного"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class PageLink:
+    def __init__(self, number, cursor, current=False):
+        self.number = number
+        self.cursor = cursor
+        self.current = current
+
+
+class CursorPage:
+    """Страница курсорной пагинации, совместимая по интерфейсу с шаблонами"""
+
+    def __init__(self, paginator, object_list, number, next_cursor=None, previous_cursor=None,
+                 page_links=None):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.page_links = page_links or []
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def last_cursor(self):
+        return self.paginator.last_cursor
+
+
+class CursorPaginator:
+    """Пагинация queryset по убыванию (pub_date, id)
+
+    window - сколько соседних страниц показывать в полосе ссылок с каждой
+    стороны; для них выбираются только ключи, без самих объектов.
+    Количество записей можно передать готовым (count), например из
+    денормализованного счетчика, или посчитать запросом (with_count).
+    """
+
+    date_field = 'pub_date'
+
+    def __init__(self, queryset, per_page, window=2, with_count=False, count=None):
+        self.queryset = queryset.order_by(f'-{self.date_field}', '-id')
+        self.per_page = per_page
+        self.window = window
+        self.with_count = with_count
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is not None:
+            return self._count
+        if not self.with_count:
+            return None
+        return self.queryset.count()
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    @property
+    def last_cursor(self):
+        return encode_cursor({'d': LAST})
+
+    def _key(self, obj):
+        return getattr(obj, self.date_field), obj.id
+
+    def _cursor(self, key, direction, number):
+        pub_date, pk = key
+        return encode_cursor({'k': [pub_date.isoformat(), pk], 'd': direction, 'n': number})
+
+    def _after(self, key):
+        pub_date, pk = key
+        return self.queryset.filter(
+            Q(**{f'{self.date_field}__lt': pub_date}) | Q(**{self.date_field: pub_date, 'id__lt': pk})
+        )
+
+    def _before(self, key):
+        pub_date, pk = key
+        return self.queryset.filter(
+            Q(**{f'{self.date_field}__gt': pub_date}) | Q(**{self.date_field: pub_date, 'id__gt': pk})
+        ).order_by(self.date_field, 'id')
+
+    def _keys_query(self, queryset, limit):
+        return queryset.values_list(self.date_field, 'id')[:limit]
+
+    def _parse(self, cursor):
+        data = decode_cursor(cursor) or {}
+        direction = data.get('d')
+        key = None
+        if 'k' in data:
+            try:
+                key = (datetime.fromisoformat(data['k'][0]), int(data['k'][1]))
+            except (TypeError, ValueError, IndexError):
+                direction = None
+        number = data.get('n') if isinstance(data.get('n'), int) else None
+        if direction in (NEXT, PREVIOUS) and not key:
+            direction = None
+        return direction, key, number
+
+    def _objects_query(self, direction, key):
+        if direction == NEXT:
+            return self._after(key)[:self.per_page]
+        if direction == PREVIOUS:
+            # На одну запись больше, чтобы понять, не дошли ли до начала списка
+            return self._before(key)[:self.per_page + 1]
+        if direction == LAST:
+            return self.queryset.order_by(self.date_field, 'id')[:self.per_page]
+        return self.queryset[:self.per_page]
+
+    def _arrange(self, direction, objects, number):
+        """Приводит выборку к порядку страницы; None - нужно показать первую страницу"""
+        if direction == NEXT:
+            return objects, number
+        if direction == PREVIOUS:
+            if len(objects) <= self.per_page:
+                return None, 1
+            return objects[:self.per_page][::-1], number
+        if direction == LAST:
+            # Последняя страница неполная, чтобы границы совпадали со страницами от начала списка
+            size = self.count - (self.num_pages - 1) * self.per_page
+            return objects[:size][::-1], self.num_pages
+        return objects, 1
+
+    def _set_count(self, count):
+        self._count = count
+        self.__dict__.pop('count', None)
+        self.__dict__.pop('num_pages', None)
+
+    def get_page(self, cursor):
+        direction, key, number = self._parse(cursor)
+        if direction == LAST and self.count is None:
+            # Без количества нельзя выровнять последнюю страницу и узнать ее номер
+            self._set_count(self.queryset.count())
+        objects, number = self._arrange(direction, list(self._objects_query(direction, key)), number)
+        if objects is None:
+            objects = list(self.queryset[:self.per_page])
+        if not objects:
+            return CursorPage(self, [], number or 1)
+
+        limit = self.per_page * self.window
+        ahead = list(self._keys_query(self._after(self._key(objects[-1])), limit))
+        behind = [] if number == 1 else list(self._keys_query(self._before(self._key(objects[0])), limit))
+        return self._build_page(objects, number, ahead, behind)
+
+    async def aget_page(self, cursor):
+        """Асинхронный вариант get_page на async ORM"""
+        direction, key, number = self._parse(cursor)
+        if self._count is None and (self.with_count or direction == LAST):
+            self._set_count(await self.queryset.acount())
+        objects = [obj async for obj in self._objects_query(direction, key)]
+        objects, number = self._arrange(direction, objects, number)
+        if objects is None:
+            objects = [obj async for obj in self.queryset[:self.per_page]]
+        if not objects:
+            return CursorPage(self, [], number or 1)
+
+        limit = self.per_page * self.window
+        ahead = [row async for row in self._keys_query(self._after(self._key(objects[-1])), limit)]
+        behind = [] if number == 1 else [
+            row async for row in self._keys_query(self._before(self._key(objects[0])), limit)
+        ]
+        return self._build_page(objects, number, ahead, behind)
+
+    def _build_page(self, objects, number, ahead, behind):
+        first_key, last_key = self._key(objects[0]), self._key(objects[-1])
+        links = []
+        if number is not None:
+            # Ключ, после которого начинается каждая из предыдущих страниц
+            for step in range(self.window, 0, -1):
+                if number - step < 1 or len(behind) <= self.per_page * (step - 1):
+                    continue
+                start_key = first_key if step == 1 else behind[self.per_page * (step - 1) - 1]
+                links.append(PageLink(number - step, self._cursor(start_key, PREVIOUS, number - step)))
+            links.append(PageLink(number, None, current=True))
+            for step in range(1, self.window + 1):
+                if len(ahead) <= self.per_page * (step - 1):
+                    break
+                start_key = last_key if step == 1 else ahead[self.per_page * (step - 1) - 1]
+                links.append(PageLink(number + step, self._cursor(start_key, NEXT, number + step)))
+
+        next_number = number + 1 if number is not None else None
+        previous_number = number - 1 if number is not None else None
+        return CursorPage(
+            self,
+            objects,
+            number,
+            next_cursor=self._cursor(last_key, NEXT, next_number) if ahead else None,
+            previous_cursor=self._cursor(first_key, PREVIOUS, previous_number) if behind else None,
+            page_links=links,
+        )
+
+
+class RankedPaginator:
+    """Пагинация ограниченного списка id, отсортированного по релевантности
+
+    Курсор хранит смещение в списке; объекты загружаются только для
+    текущей страницы функцией fetch(ids) -> {id: объект}.
+    """
+
+    def __init__(self, ids, per_page, fetch, window=2):
+        self.ids = ids
+        self.per_page = per_page
+        self.fetch = fetch
+        self.window = window
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.count // self.per_page))
+
+    @property
+    def last_cursor(self):
+        return self._cursor(self.num_pages)
+
+    def _cursor(self, number):
+        return encode_cursor({'o': (number - 1) * self.per_page, 'n': number})
+
+    def _page_ids(self, cursor):
+        data = decode_cursor(cursor) or {}
+        number = data.get('n')
+        if not isinstance(number, int) or not 1 <= number <= self.num_pages:
+            number = 1
+        offset = (number - 1) * self.per_page
+        return number, self.ids[offset:offset + self.per_page]
+
+    def get_page(self, cursor):
+        number, page_ids = self._page_ids(cursor)
+        return self._build_page(number, page_ids, self.fetch(page_ids))
+
+    async def aget_page(self, cursor):
+        """Асинхронный вариант: fetch должен быть корутиной, например QuerySet.ain_bulk"""
+        number, page_ids = self._page_ids(cursor)
+        return self._build_page(number, page_ids, await self.fetch(page_ids))
+
+    def _build_page(self, number, page_ids, objects):
+        object_list = [objects[pk] for pk in page_ids if pk in objects]
+
+        first = max(1, number - self.window)
+        last = min(self.num_pages, number + self.window)
+        links = [
+            PageLink(page, None if page == number else self._cursor(page), current=page == number)
+            for page in range(first, last + 1)
+        ]
+        return CursorPage(
+            self,
+            object_list,
+            number,
+            next_cursor=self._cursor(number + 1) if number < self.num_pages else None,
+            previous_cursor=self._cursor(number - 1) if number > 1 else None,
+            page_links=links,
+        )
@@ -0,0 +1,92 @@
+# news/query_plans.py
+"""Проверка планов запросов горячих путей через EXPLAIN QUERY PLAN.
+
+Каждый запрос из hot_queries() разбирается на строки плана SQLite. Полный
+просмотр таблицы считается проблемой, если таблица не перечислена
+в allowed_scans: например, список всех категорий читается целиком намеренно.
+Просмотр по индексу (SCAN ... USING INDEX) допустим только в запросах
+с LIMIT: так выполняется сортировка по индексу с остановкой после N строк.
+Сортировка через временное B-дерево выводится как предупреждение.
+"""
+import re
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Category, Post, PostCategory, Subscription
+
+_SCAN_RE = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)')
+
+
+class HotQuery:
+    def __init__(self, name, queryset, allowed_scans=()):
+        self.name = name
+        self.queryset = queryset
+        self.allowed_scans = set(allowed_scans)
+
+
+class PlanReport:
+    def __init__(self, query, plan):
+        self.query = query
+        self.plan = plan
+        self.full_scans = []
+        self.temp_sorts = []
+        limited = query.queryset.query.high_mark is not None
+        for line in plan:
+            match = _SCAN_RE.search(line)
+            if match and match.group(1) not in query.allowed_scans:
+                if 'INDEX' not in match.group(2) or not limited:
+                    self.full_scans.append(match.group(1))
+            if 'USE TEMP B-TREE' in line:
+                self.temp_sorts.append(line.split('USE TEMP B-TREE', 1)[1].strip())
+
+    @property
+    def ok(self):
+        return not self.full_scans
+
+
+def hot_queries():
+    """Запросы публичных страниц и задач рассылки"""
+    from .views import post_cards
+
+    now = timezone.now()
+    week_ago = now - timedelta(days=7)
+    post = Post.objects.order_by('-pub_date', '-id').values('pub_date', 'id').first() or {'pub_date': now, 'id': 0}
+    after = Q(pub_date__lt=post['pub_date']) | Q(pub_date=post['pub_date'], id__lt=post['id'])
+    category_ids = list(Category.objects.values_list('id', flat=True)[:3]) or [0]
+
+    return [
+        HotQuery('news_list', post_cards().order_by('-pub_date', '-id')[:10]),
+        HotQuery('news_list_next_page', post_cards().filter(after).order_by('-pub_date', '-id')[:10]),
+        HotQuery('news_by_type', Post.objects.filter(post_type='news').order_by('-pub_date')[:10]),
+        HotQuery('news_detail', Post.objects.filter(pk=post['id'])),
+        HotQuery('category_list', Category.objects.all(), allowed_scans=['news_category']),
+        HotQuery(
+            'notification_subscribers',
+            Subscription.objects.filter(
+                category_id__in=PostCategory.objects.filter(post_id=post['id']).values('category_id')
+            ).values_list('user_id', flat=True).distinct(),
+        ),
+        HotQuery(
+            'digest_categories',
+            PostCategory.objects.filter(post__pub_date__gte=week_ago, post__pub_date__lt=now)
+            .values_list('category_id', flat=True).distinct(),
+        ),
+        HotQuery(
+            'digest_blocks',
+            PostCategory.objects.filter(
+                category_id__in=category_ids, post__pub_date__gte=week_ago, post__pub_date__lt=now,
+            ).order_by('category_id', '-post__pub_date').values_list('category_id', 'post_id', 'post__title'),
+        ),
+        HotQuery(
+            'digest_subscribers',
+            Subscription.objects.filter(category_id__in=category_ids, user_id__gt=0)
+            .order_by('user_id').values_list('user_id', flat=True).distinct(),
+        ),
+    ]
+
+
+def check(queries=None):
+    """Возвращает PlanReport для каждого запроса"""
+    return [PlanReport(query, query.queryset.explain().splitlines()) for query in queries or hot_queries()]
@@ -0,0 +1,326 @@
+# news/related.py
+"""Похожие публикации по TF-IDF.
+
+Полная пересборка (команда rebuild_related_posts) читает публикации
+пачками и строит разреженную матрицу TF-IDF (scipy.sparse, float32) по
+заголовку и тексту: в каждой строке остаются TERMS_PER_POST самых весомых
+слов, строки нормированы. Ближайшие публикации ищутся тоже пачками строк:
+произведение пачки на транспонированную матрицу дает косинусную близость,
+argpartition выбирает NEWS_RELATED_COUNT лучших. Результат хранится в
+RelatedPost, страница публикации читает его одним запросом по индексу.
+
+Словарь, idf и матрица сохраняются в файл NEWS_RELATED_INDEX. После
+создания или изменения публикации задача update_related_posts пересчитывает
+только затронутые строки: список самой публикации, тех, кто ссылался на
+нее, и ближайших к ней, в чей список она может попасть. Публикации,
+измененные после пересборки, векторизуются заново из базы; новые слова
+попадают в словарь при следующей полной пересборке (задача
+rebuild_related_posts, раз в сутки по расписанию Celery beat).
+
+Нужны numpy и scipy (есть в requirements.txt); без них похожие публикации
+не считаются и блок на странице не выводится.
+"""
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_versions, post_version
+from .db import retry_on_db_lock
+from .models import Post, RelatedPost
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # numpy и scipy не обязательны
+    np = sparse = None
+
+# Слова из букв длиной от 3 до 30 символов; слова заголовка весят больше
+TOKEN_RE = re.compile(r'\b[^\W\d_]{3,30}\b')
+TITLE_WEIGHT = 3
+TERMS_PER_POST = 64
+# Слова реже MIN_DF публикаций не связывают публикации, чаще MAX_DF - почти во всех
+MIN_DF = 2
+MAX_DF = 0.5
+MIN_SCORE = 0.05
+BATCH_SIZE = 2000
+# Сколько ближайших к измененной публикации проверяется на попадание ее в их списки
+CANDIDATES_FACTOR = 10
+
+_pending = threading.local()
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def available():
+    return np is not None
+
+
+def _terms(title, content):
+    counts = Counter(TOKEN_RE.findall(content.lower()))
+    for token in TOKEN_RE.findall(title.lower()):
+        counts[token] += TITLE_WEIGHT
+    return counts
+
+
+def _weight(matrix, idf):
+    """Сублинейный tf * idf, TERMS_PER_POST самых весомых слов строки, нормировка L2"""
+    matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+    counts = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(matrix.shape[0]), counts)
+    if len(counts) and counts.max() > TERMS_PER_POST:
+        # lexsort: по строке, внутри строки по убыванию веса; позиция в строке - ранг слова
+        order = np.lexsort((-matrix.data, rows))
+        rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+        keep = np.sort(order[rank < TERMS_PER_POST])
+        matrix = sparse.csr_matrix(
+            (matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape, dtype=np.float32,
+        )
+        rows = rows[keep]
+    norms = np.sqrt(np.bincount(rows, weights=matrix.data.astype(np.float64) ** 2, minlength=matrix.shape[0]))
+    norms[norms == 0] = 1
+    matrix.data /= norms[rows].astype(np.float32)
+    return matrix
+
+
+class Index:
+    """Словарь, idf и векторы публикаций на момент пересборки"""
+
+    def __init__(self, ids, matrix, terms, idf, built_at):
+        self.ids = ids
+        self.matrix = matrix
+        self.matrix_t = matrix.T.tocsr()
+        self.terms = terms
+        self.idf = idf
+        self.built_at = built_at
+        self.vocabulary = {term: column for column, term in enumerate(terms.tolist())}
+
+    def vectorize(self, docs):
+        """Матрица нормированных векторов для пар (заголовок, текст)"""
+        rows, columns, values = array('q'), array('q'), array('f')
+        for row, (title, content) in enumerate(docs):
+            for term, count in _terms(title, content).items():
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    values.append(count)
+        matrix = sparse.csr_matrix(
+            (np.frombuffer(values, np.float32), (np.frombuffer(rows, np.int64), np.frombuffer(columns, np.int64))),
+            shape=(len(docs), len(self.terms)),
+            dtype=np.float32,
+        )
+        return _weight(matrix, self.idf)
+
+    def save(self, path):
+        # Запись во временный файл и rename: воркеры не прочитают файл наполовину
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(
+                file, ids=self.ids, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                shape=np.array(self.matrix.shape), terms=self.terms, idf=self.idf,
+                built_at=np.array(self.built_at.timestamp()),
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as stored:
+            matrix = sparse.csr_matrix(
+                (stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape']),
+            )
+            return cls(
+                stored['ids'], matrix, stored['terms'], stored['idf'],
+                datetime.fromtimestamp(float(stored['built_at']), tz=dt_timezone.utc),
+            )
+
+
+def build_index(batch_size=BATCH_SIZE):
+    """Читает все публикации пачками и строит Index"""
+    built_at = timezone.now()
+    ids, indptr, term_ids, counts = array('q'), array('q', [0]), array('q'), array('f')
+    vocabulary = {}
+    posts = Post.objects.order_by('id').values_list('id', 'title', 'content')
+    for post_id, title, content in posts.iterator(chunk_size=batch_size):
+        terms = _terms(title, content)
+        ids.append(post_id)
+        term_ids.extend([vocabulary.setdefault(term, len(vocabulary)) for term in terms])
+        counts.extend(terms.values())
+        indptr.append(len(term_ids))
+
+    total = len(ids)
+    term_ids = np.frombuffer(term_ids, np.int64)
+    df = np.bincount(term_ids, minlength=len(vocabulary))
+    keep = (df >= MIN_DF) & (df <= max(MAX_DF * total, MIN_DF))
+    columns = np.full(len(vocabulary), -1, np.int64)
+    columns[keep] = np.arange(int(keep.sum()))
+    terms = np.array([term for term, kept in zip(vocabulary, keep) if kept], dtype=str)
+    idf = (np.log((1 + total) / (1 + df[keep])) + 1).astype(np.float32)
+
+    rows = np.repeat(np.arange(total), np.diff(np.frombuffer(indptr, np.int64)))
+    columns = columns[term_ids]
+    known = columns >= 0
+    matrix = sparse.csr_matrix(
+        (np.frombuffer(counts, np.float32)[known], (rows[known], columns[known])),
+        shape=(total, len(terms)),
+        dtype=np.float32,
+    )
+    return Index(np.frombuffer(ids, np.int64).copy(), _weight(matrix, idf), terms, idf, built_at)
+
+
+def load_index():
+    """Index из NEWS_RELATED_INDEX (кешируется в процессе до изменения файла) или None"""
+    path = settings.NEWS_RELATED_INDEX
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _load_lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != modified:
+            _loaded.clear()
+            loaded = _loaded[path] = (modified, Index.load(path))
+        return loaded[1]
+
+
+def _top(scores, columns, k):
+    """Индексы k наибольших scores по убыванию"""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k)[:k]
+        scores, columns = scores[best], columns[best]
+    order = np.argsort(-scores, kind='stable')
+    return columns[order], scores[order]
+
+
+def _nearest(queries, corpus_t, corpus_ids, exclude_ids, k, skip=None):
+    """Для каждой строки queries - (id, близость) k ближайших из корпуса
+
+    corpus_t - транспонированная матрица корпуса, skip - маска строк
+    корпуса, которые не участвуют (устаревшие векторы).
+    """
+    scores = (queries @ corpus_t).tocsr()
+    result = []
+    for row, exclude in enumerate(exclude_ids):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        columns, values = scores.indices[start:end], scores.data[start:end]
+        mask = (values >= MIN_SCORE) & (corpus_ids[columns] != exclude)
+        if skip is not None:
+            mask &= ~skip[columns]
+        columns, values = _top(values[mask], columns[mask], k)
+        result.append((corpus_ids[columns], values))
+    return result
+
+
+def _merge(*parts, k):
+    ids = np.concatenate([part[0] for part in parts])
+    scores = np.concatenate([part[1] for part in parts])
+    ids, scores = _top(scores, ids, k)
+    return ids, scores
+
+
+@retry_on_db_lock()
+def _replace(lists):
+    """Заменяет списки похожих: {post_id: (ids, scores)}"""
+    candidates = {int(related_id) for ids, _ in lists.values() for related_id in ids}
+    # В файле индекса могут быть публикации, удаленные после пересборки
+    alive = set(Post.objects.filter(id__in=candidates).order_by().values_list('id', flat=True))
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=list(lists)).delete()
+        RelatedPost.objects.bulk_create([
+            RelatedPost(post_id=post_id, related_id=int(related_id), score=float(score))
+            for post_id, (ids, scores) in lists.items()
+            for related_id, score in zip(ids, scores)
+            if int(related_id) in alive
+        ])
+
+
+def rebuild(batch_size=BATCH_SIZE, k=None):
+    """Полная пересборка: индекс в файл и списки похожих всех публикаций
+
+    Возвращает (число публикаций, число слов в словаре).
+    """
+    k = k or settings.NEWS_RELATED_COUNT
+    index = build_index(batch_size)
+    index.save(settings.NEWS_RELATED_INDEX)
+    for start in range(0, len(index.ids), batch_size):
+        ids = index.ids[start:start + batch_size]
+        nearest = _nearest(index.matrix[start:start + batch_size], index.matrix_t, index.ids, ids, k)
+        _replace({int(post_id): found for post_id, found in zip(ids, nearest)})
+    return len(index.ids), len(index.terms)
+
+
+def update(post_ids, k=None):
+    """Пересчитывает списки измененных публикаций и затронутых ими; возвращает их число"""
+    index = load_index()
+    if index is None:
+        return 0
+    k = k or settings.NEWS_RELATED_COUNT
+
+    # Публикации, измененные после пересборки: их векторы в файле устарели или отсутствуют
+    fresh = list(
+        Post.objects.filter(Q(updated_at__gte=index.built_at) | Q(id__in=post_ids))
+        .order_by('id')
+        .values_list('id', 'title', 'content')
+    )
+    fresh_ids = np.array([post_id for post_id, _, _ in fresh], dtype=np.int64)
+    fresh_matrix = index.vectorize([(title, content) for _, title, content in fresh])
+    fresh_t = fresh_matrix.T.tocsr()
+    stale = np.isin(index.ids, fresh_ids)
+
+    def nearest(queries, query_ids, limit):
+        in_index = _nearest(queries, index.matrix_t, index.ids, query_ids, limit, skip=stale)
+        in_fresh = _nearest(queries, fresh_t, fresh_ids, query_ids, limit)
+        return [_merge(a, b, k=limit) for a, b in zip(in_index, in_fresh)]
+
+    targets = np.array(sorted(set(post_ids) & set(fresh_ids.tolist())), dtype=np.int64)
+    if not len(targets):
+        return 0
+    found = nearest(fresh_matrix[np.searchsorted(fresh_ids, targets)], targets, k * CANDIDATES_FACTOR)
+    lists = {int(post_id): (ids[:k], scores[:k]) for post_id, (ids, scores) in zip(targets, found)}
+
+    # Затронутые: ссылавшиеся на измененные публикации и ближайшие к ним
+    affected = set(RelatedPost.objects.filter(related_id__in=targets.tolist()).values_list('post_id', flat=True))
+    affected.update(int(post_id) for ids, _ in found for post_id in ids)
+    affected = np.array(sorted(affected - set(lists)), dtype=np.int64)
+    if len(affected):
+        from_fresh = np.isin(affected, fresh_ids)
+        from_index = affected[~from_fresh & np.isin(affected, index.ids)]
+        positions = np.searchsorted(index.ids, from_index)
+        query_ids = np.concatenate([affected[from_fresh], from_index])
+        queries = sparse.vstack([
+            fresh_matrix[np.searchsorted(fresh_ids, affected[from_fresh])],
+            index.matrix[positions],
+        ]).tocsr()
+        lists.update(zip(query_ids.tolist(), nearest(queries, query_ids, k)))
+
+    _replace(lists)
+    bump_versions([post_version(post_id) for post_id in lists])
+    return len(lists)
+
+
+def _flush():
+    post_ids, _pending.post_ids = getattr(_pending, 'post_ids', set()), set()
+    if post_ids:
+        from .tasks import update_related_posts
+        try:
+            update_related_posts.delay(sorted(post_ids))
+        except Exception:
+            # Брокер недоступен: публикация уже сохранена, списки пересчитает ежесуточная пересборка
+            pass
+
+
+def schedule(post_ids):
+    """Ставит пересчет похожих после фиксации транзакции, одной задачей на транзакцию"""
+    if not available():
+        return
+    if not hasattr(_pending, 'post_ids'):
+        _pending.post_ids = set()
+    _pending.post_ids.update(post_ids)
+    transaction.on_commit(_flush)
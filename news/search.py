@@ -0,0 +1,133 @@
+# news/search.py
+"""Полнотекстовый поиск по публикациям.
+
+Бэкенд выбирается настройкой NEWS_SEARCH_BACKEND. По умолчанию используется
+индекс SQLite FTS5 (таблица news_post_fts, rowid совпадает с id публикации),
+который поддерживается сигналами сохранения и удаления Post и пересобирается
+командой rebuild_search_index.
+"""
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+class BaseSearchBackend(ABC):
+    """Интерфейс бэкенда полнотекстового поиска"""
+
+    def index_posts(self, posts):
+        """Добавляет или обновляет публикации в индексе"""
+
+    def remove_posts(self, post_ids):
+        """Удаляет публикации из индекса"""
+
+    def rebuild(self, batch_size=2000):
+        """Полностью пересобирает индекс, возвращает количество публикаций"""
+        return 0
+
+    @abstractmethod
+    def search(self, query, limit, posts=None):
+        """Возвращает id публикаций, отсортированные по релевантности
+
+        posts - QuerySet публикаций (фильтры автора и даты): limit
+        применяется к результатам уже после этого ограничения.
+        """
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Поиск через icontains для баз без полнотекстового индекса"""
+
+    def search(self, query, limit, posts=None):
+        from .models import Post
+
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return []
+
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(content__icontains=token)
+        return list(
+            (Post.objects.all() if posts is None else posts).filter(condition)
+            .order_by('-pub_date', '-id')
+            .values_list('id', flat=True)[:limit]
+        )
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Индекс SQLite FTS5 по заголовку и содержанию"""
+
+    table = 'news_post_fts'
+
+    @staticmethod
+    def build_match_query(query):
+        # Каждое слово ищется как префикс, слова объединяются через AND
+        tokens = _TOKEN_RE.findall(query)
+        return ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+
+    def index_posts(self, posts):
+        rows = [(post.id, post.title, post.content) for post in posts]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table}(rowid, title, content) VALUES (%s, %s, %s)', rows)
+
+    def remove_posts(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(post_id,) for post_id in post_ids])
+
+    def rebuild(self, batch_size=2000):
+        from .models import Post
+
+        total = 0
+        last_id = 0
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table}')
+                # Пачки по диапазонам id, чтобы не держать всю таблицу в памяти
+                while True:
+                    rows = list(
+                        Post.objects.filter(id__gt=last_id)
+                        .order_by('id')
+                        .values_list('id', 'title', 'content')[:batch_size]
+                    )
+                    if not rows:
+                        break
+                    cursor.executemany(f'INSERT INTO {self.table}(rowid, title, content) VALUES (%s, %s, %s)', rows)
+                    total += len(rows)
+                    last_id = rows[-1][0]
+                cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')")
+        return total
+
+    def search(self, query, limit, posts=None):
+        match = self.build_match_query(query)
+        if not match:
+            return []
+        condition, params = '', [match]
+        if posts is not None:
+            subquery, subquery_params = posts.order_by().values('id').query.sql_with_params()
+            condition = f' AND rowid IN ({subquery})'
+            params.extend(subquery_params)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s{condition} ORDER BY rank LIMIT %s',
+                [*params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """Возвращает настроенный бэкенд поиска"""
+    return _load_backend(getattr(settings, 'NEWS_SEARCH_BACKEND', 'news.search.SQLiteFTSBackend'))
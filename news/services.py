@@ -0,0 +1,79 @@
+# news/services.py
+"""Публикация и изменение постов.
+
+publish вставляет публикации и их связи с категориями двумя bulk_create в
+одной транзакции и отправляет сигнал posts_bulk_created (счетчики, поиск,
+кеш, ленты). Рассылка и пересчет похожих публикаций ставятся только после
+фиксации транзакции, поэтому воркер всегда видит категории публикации.
+Рассылки публикаций одного автора за короткое время объединяются в одну
+(см. tasks.send_author_notifications). Этим путем публикуют форма
+автора, админка и пакетная публикация publish_posts.
+"""
+from django.db import transaction
+
+from . import related
+from .db import retry_on_db_lock
+from .models import PendingNotification, Post, PostCategory
+from .signals import posts_bulk_created
+from .tasks import schedule_author_notifications
+
+
+def _category_ids(categories):
+    return {getattr(category, 'pk', category) for category in categories}
+
+
+@retry_on_db_lock()
+def publish(drafts, author=None, notify=True):
+    """Публикует пары (несохраненный Post, категории), возвращает сохраненные Post
+
+    Категории - объекты Category или их id. Если указан author, он
+    становится автором всех публикаций.
+    """
+    drafts = [(post, _category_ids(categories)) for post, categories in drafts]
+    for post, _ in drafts:
+        # Повтор после блокировки базы не должен вставлять id из откатившейся попытки
+        post.pk = None
+        post._state.adding = True
+        if author is not None:
+            post.author = author
+
+    with transaction.atomic():
+        posts = Post.objects.bulk_create([post for post, _ in drafts])
+        links = PostCategory.objects.bulk_create([
+            PostCategory(post_id=post.id, category_id=category_id)
+            for post, category_ids in drafts
+            for category_id in sorted(category_ids)
+        ])
+        posts_bulk_created.send(
+            sender=Post, posts=posts, category_ids=[link.category_id for link in links], regenerate_feeds=True,
+        )
+        # Импорт (importer) похожие не пересчитывает: их обновит rebuild_related_posts
+        related.schedule([post.id for post in posts])
+
+        if notify:
+            # Очередь уведомлений в базе: воркер увидит ее при любом кеше
+            PendingNotification.objects.bulk_create([
+                PendingNotification(post_id=post.id) for post in posts if post.author_id is not None
+            ])
+            for author_id in sorted({post.author_id for post in posts if post.author_id is not None}):
+                transaction.on_commit(lambda author_id=author_id: schedule_author_notifications(author_id))
+    return posts
+
+
+@retry_on_db_lock()
+def update_post(post, categories):
+    """Сохраняет публикацию и приводит ее категории к заданным
+
+    Связи добавляются и удаляются по одной, чтобы сработали сигналы
+    счетчиков, кеша и лент (form.save_m2m для связи через PostCategory
+    их обходит).
+    """
+    category_ids = _category_ids(categories)
+    with transaction.atomic():
+        post.save()
+        current = set(PostCategory.objects.filter(post=post).values_list('category_id', flat=True))
+        if current - category_ids:
+            PostCategory.objects.filter(post=post, category_id__in=current - category_ids).delete()
+        for category_id in sorted(category_ids - current):
+            PostCategory.objects.create(post=post, category_id=category_id)
+    return post
@@ -1,32 +1,174 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.core.mail import send_mail
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
 from django.conf import settings
 from django.contrib.auth.models import User
 
+from . import censor, counters, feeds, metrics, related, welcome
+from .db import configure_sqlite
+from .cache import invalidate_lists, invalidate_post
+from .groups import invalidate_group_names
+from .models import CensoredWord, Category, Post, PostCategory, Subscription
+from .search import get_backend as get_search_backend
+
+# Отправляется путями массовой вставки (bulk_create не вызывает post_save)
+# внутри транзакции пачки: posts - созданные Post с id, category_ids -
+# категории созданных PostCategory (с повторами, по одному на связь),
+# regenerate_feeds - пересобрать ленты сразу (публикация автором), а не
+# только сбросить их (импорт)
+posts_bulk_created = Signal()
+
 
 @receiver(post_save, sender=User)
-def send_welcome_email(sender, instance, created, **kwargs):
-    """Отправляет приветственное письмо при регистрации нового пользователя"""
-
-    if created:  # Отправляем только при создании нового пользователя
-        subject = 'Добро пожаловать на Новостной портал!'
-        message = f'''
-Здравствуйте, {instance.username}!
-
-Добро пожаловать на наш Новостной портал!
-
-Теперь вы можете:
-• Читать новости и статьи
-• Подписываться на интересующие категории
-• Получать уведомления о новых публикациях
-• Комментировать материалы (если станете автором)
-
-Для начала работы посетите наш сайт:
-http://127.0.0.1:8000/
-
-С уважением,
-Команда Новостного портала
-'''
-        from .tasks import send_welcome_email_async
-        send_welcome_email_async.delay(instance.email, instance.username)
\ No newline at end of file
+def send_welcome_email(sender, instance, created, raw=False, **kwargs):
+    """Ставит приветственное письмо новому пользователю после фиксации транзакции"""
+    if created and not raw:
+        welcome.schedule([instance.id])
+
+
+@receiver(post_save, sender=CensoredWord)
+@receiver(post_delete, sender=CensoredWord)
+def invalidate_censor_words(sender, **kwargs):
+    """Пересобирает словарь фильтра censor после изменения списка слов"""
+    censor.invalidate()
+
+
+@receiver(setting_changed)
+def invalidate_censor_settings(sender, setting, **kwargs):
+    if setting in ('CENSORED_WORDS', 'CACHES'):
+        censor.invalidate()
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    """Обновляет публикацию в полнотекстовом индексе"""
+    if not raw:
+        get_search_backend().index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    """Удаляет публикацию из полнотекстового индекса"""
+    get_search_backend().remove_posts([instance.id])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кеш групп пользователя после изменения членства"""
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            invalidate_group_names(instance)
+    elif action == 'pre_clear':
+        # После очистки со стороны группы pk_set пуст, поэтому собираем пользователей заранее
+        invalidate_group_names(user_ids=list(instance.user_set.values_list('pk', flat=True)))
+    elif pk_set:
+        invalidate_group_names(user_ids=pk_set)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.increment(counters.POSTS_TOTAL)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.increment(counters.POSTS_TOTAL, -1)
+
+
+@receiver(post_save, sender=PostCategory)
+def count_post_category(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post_counts([instance.category_id])
+
+
+@receiver(post_delete, sender=PostCategory)
+def uncount_post_category(sender, instance, **kwargs):
+    counters.change_post_counts([instance.category_id], -1)
+
+
+@receiver(post_save, sender=Subscription)
+def count_subscription(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_subscriber_counts([instance.category_id])
+
+
+@receiver(post_delete, sender=Subscription)
+def uncount_subscription(sender, instance, **kwargs):
+    counters.change_subscriber_counts([instance.category_id], -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_cache(sender, instance, raw=False, **kwargs):
+    """Сбрасывает закешированные страницы и фрагменты публикации"""
+    if not raw:
+        invalidate_post(instance.id)
+
+
+@receiver(post_save, sender=PostCategory)
+@receiver(post_delete, sender=PostCategory)
+def invalidate_post_category_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_post(instance.post_id)
+
+
+@receiver(post_save, sender=Post)
+def regenerate_post_feeds(sender, instance, raw=False, **kwargs):
+    """Пересобирает общую ленту и ленты категорий публикации"""
+    if not raw:
+        feeds.schedule(feeds.post_scopes(instance.id))
+
+
+@receiver(post_save, sender=Post)
+def update_related_posts(sender, instance, raw=False, **kwargs):
+    """Пересчитывает похожие публикации после фиксации транзакции"""
+    if not raw:
+        related.schedule([instance.id])
+
+
+@receiver(post_delete, sender=Post)
+def regenerate_feeds_after_delete(sender, instance, **kwargs):
+    # Ленты категорий удаленной публикации обработает каскадное удаление PostCategory
+    feeds.schedule([feeds.ALL])
+
+
+@receiver(post_save, sender=PostCategory)
+@receiver(post_delete, sender=PostCategory)
+def regenerate_post_category_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feeds.schedule([feeds.ALL, feeds.category_scope(instance.category_id)])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def regenerate_category_feed(sender, instance, raw=False, **kwargs):
+    """Название категории входит в заголовок ее ленты"""
+    if not raw:
+        feeds.schedule([feeds.category_scope(instance.id)])
+
+
+@receiver(posts_bulk_created)
+def handle_posts_bulk_created(sender, posts, category_ids, regenerate_feeds=False, **kwargs):
+    """Счетчики, поисковый индекс, кеш списков и ленты для массово добавленных публикаций"""
+    counters.increment(counters.POSTS_TOTAL, len(posts))
+    counters.change_post_counts(category_ids)
+    get_search_backend().index_posts(posts)
+    invalidate_lists()
+    scopes = [feeds.ALL, *(feeds.category_scope(category_id) for category_id in set(category_ids))]
+    (feeds.schedule if regenerate_feeds else feeds.invalidate)(scopes)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    """Включает WAL и остальные PRAGMA для нового соединения SQLite"""
+    configure_sqlite(connection)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """Подключает подсчет SQL-запросов для метрик запроса"""
+    metrics.install_query_timer(connection)
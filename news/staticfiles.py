@@ -0,0 +1,201 @@
+# news/staticfiles.py
+"""Статика с хешами в именах и заранее сжатыми вариантами.
+
+CompressedManifestStaticFilesStorage при collectstatic добавляет в имена
+файлов хеш содержимого (css/styles.css -> css/styles.3f2a...css) и рядом
+с каждым текстовым файлом кладет .gz и, если установлен пакет brotli, .br.
+PrecompressedStaticMiddleware отдает файлы из STATIC_ROOT: по заголовку
+Accept-Encoding выбирается готовый вариант, поэтому сжатие не стоит
+ничего во время запроса. Файлы с хешем в имени браузер кеширует на год с
+immutable и больше не запрашивает, остальные перепроверяются по ETag.
+"""
+import gzip
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli указан в requirements.txt; без него отдаются только .gz
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+# Сжатый вариант сохраняется, только если он заметно меньше оригинала
+MIN_RATIO = 0.95
+# Варианты в порядке предпочтения: (значение Content-Encoding, расширение файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def compress(data):
+    """Сжатые варианты данных: {расширение: байты}, только выгодные"""
+    variants = {'.gz': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: body for suffix, body in variants.items() if len(body) < len(data) * MIN_RATIO}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Манифест хешей и готовые .gz/.br; отсутствующие файлы не ломают страницы"""
+
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # Файла нет в STATIC_ROOT (не запускали collectstatic или ссылка на
+            # несуществующий файл): отдаем имя без хеша вместо ошибки 500
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(paths):
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            # Копия с хешем обычно совпадает с оригиналом (кроме CSS с переписанными url()),
+            # одинаковое содержимое сжимается один раз
+            compressed = {}
+            for target in {name, self.hashed_files.get(self.hash_key(self.clean_name(name)), name)}:
+                if not self.exists(target):
+                    continue
+                with self.open(target) as file:
+                    data = file.read()
+                if data not in compressed:
+                    compressed[data] = compress(data)
+                for suffix, body in compressed[data].items():
+                    if self.exists(target + suffix):
+                        self.delete(target + suffix)
+                    self._save(target + suffix, ContentFile(body))
+                if compressed[data]:
+                    yield target, target, True
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding с ненулевым q"""
+    encodings = set()
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if token:
+            encodings.add(token.strip().lower())
+    return encodings
+
+
+class StaticFile:
+    """Файл STATIC_ROOT со сжатыми вариантами; маленькие файлы держатся в памяти"""
+
+    def __init__(self, path, content_type, immutable):
+        self.content_type = content_type
+        self.immutable = immutable
+        self.variants = {}
+        for encoding, suffix in (*ENCODINGS, (None, '')):
+            variant_path = path + suffix
+            try:
+                stat = os.stat(variant_path)
+            except OSError:
+                continue
+            body = None
+            if stat.st_size <= settings.NEWS_STATIC_MEMORY_LIMIT:
+                with open(variant_path, 'rb') as file:
+                    body = file.read()
+            self.variants[encoding] = (variant_path, body, stat.st_size, f'"{stat.st_size:x}-{int(stat.st_mtime):x}"')
+
+    def choose(self, accept_encoding):
+        encodings = accepted_encodings(accept_encoding)
+        for encoding, _ in ENCODINGS:
+            if encoding in encodings and encoding in self.variants:
+                return encoding
+        return None
+
+
+class PrecompressedStaticMiddleware:
+    """Отдает файлы STATIC_ROOT с готовым сжатием и долгим кешированием
+
+    Ставится сразу после SecurityMiddleware, чтобы статика не проходила
+    сессии и аутентификацию. Найденные файлы запоминаются в памяти
+    процесса: после collectstatic нужен перезапуск, как и для манифеста.
+    Файлы, которых нет в STATIC_ROOT, передаются дальше. В DEBUG middleware
+    ничего не отдает: runserver берет файлы из исходных каталогов, и
+    собранная когда-то копия в STATIC_ROOT не подменяет их правки.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/') if '://' not in settings.STATIC_URL else None
+        self.files = {}
+        self.hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def lookup(self, name):
+        entry = self.files.get(name)
+        if entry is None:
+            try:
+                path = safe_join(settings.STATIC_ROOT, name)
+            except (SuspiciousFileOperation, ValueError):
+                return None
+            if not os.path.isfile(path):
+                return None
+            content_type, _ = mimetypes.guess_type(name)
+            content_type = content_type or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+                content_type += '; charset=utf-8'
+            entry = self.files[name] = StaticFile(path, content_type, name in self.hashed)
+        return entry
+
+    def serve(self, request):
+        if (
+            settings.DEBUG or not self.prefix or not settings.STATIC_ROOT or request.method not in ('GET', 'HEAD')
+            or not request.path_info.startswith(self.prefix)
+        ):
+            return None
+        name = request.path_info[len(self.prefix):]
+        entry = self.lookup(name) if name and not name.endswith(('.gz', '.br')) else None
+        if entry is None:
+            return None
+
+        encoding = entry.choose(request.headers.get('Accept-Encoding', ''))
+        path, body, size, etag = entry.variants[encoding]
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        elif body is not None:
+            response = HttpResponse(b'' if request.method == 'HEAD' else body, content_type=entry.content_type)
+            response['Content-Length'] = size
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=entry.content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(entry.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Cache-Control'] = (
+            IMMUTABLE if entry.immutable else f'public, max-age={settings.NEWS_STATIC_MAX_AGE}'
+        )
+        return response
@@ -1,31 +1,79 @@
-from celery import shared_task
-from django.core.mail import send_mail
+import hashlib
+import json
+import uuid
+from itertools import groupby, islice
+from operator import itemgetter
+
+from celery import group, shared_task
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
 from django.conf import settings
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
-from .models import Category, Post
-from celery import Celery
-from celery.schedules import crontab
+from . import outbox, pageviews, related
+from .models import Category, DigestRun, PendingNotification, Post, PostCategory, Subscription
 
 
-@shared_task
-def send_new_post_notification(post_id):
-    """Асинхронная отправка уведомлений о новой статье подписчикам"""
-    try:
-        post = Post.objects.get(id=post_id)
+def _chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не больше size"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def id_ranges(ids, ranges=()):
+    """Сворачивает id в отрезки [первый, последний] подряд идущих значений
+
+    ranges - уже свернутые отрезки, к которым добавляются ids. Публикации
+    одной вставки обычно идут подряд, поэтому отрезков столько же, сколько
+    вставок, а не публикаций.
+    """
+    merged = []
+    for first_id, last_id in sorted([*([post_id, post_id] for post_id in ids), *map(list, ranges)]):
+        if merged and first_id <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last_id)
+        else:
+            merged.append([first_id, last_id])
+    return merged
+
+
+def _in_ranges(ranges, field='post_id'):
+    condition = Q(pk__in=[])
+    for first_id, last_id in ranges:
+        condition |= Q(**{f'{field}__gte': first_id, f'{field}__lte': last_id})
+    return condition
+
+
+def _post_url(post_id):
+    return settings.NEWS_SITE_URL.rstrip('/') + reverse('news_detail', args=[post_id])
 
-        # Получаем все категории статьи
-        categories = post.categories.all()
 
-        for category in categories:
-            # Получаем всех подписчиков категории
-            subscribers = category.subscribers.all()
+def _queue_emails(messages):
+    """Ставит письма в outbox и запускает диспетчер после фиксации транзакции"""
+    count = outbox.enqueue(messages)
+    if count:
+        transaction.on_commit(dispatch_outbox.delay)
+    return count
 
-            for subscriber in subscribers:
-                if subscriber.email:
-                    subject = f'Новая статья: {post.title}'
-                    message = f'''
-В категории "{category.name}" опубликована новая статья:
+
+def _post_subscriptions(post_id):
+    """Подписки на любую из категорий поста"""
+    return Subscription.objects.filter(
+        category_id__in=PostCategory.objects.filter(post_id=post_id).values('category_id')
+    ).exclude(user__email='')
+
+
+def _build_post_notification(post, category_names):
+    """Формирует тему и текст уведомления о новой статье"""
+    categories = ', '.join(f'"{name}"' for name in category_names)
+    subject = f'Новая статья: {post.title}'
+    message = f'''
+В категориях {categories} опубликована новая статья:
 
 Заголовок: {post.title}
 Автор: {post.author.username if post.author else "Неизвестен"} 
@@ -33,76 +81,441 @@ def send_new_post_notification(post_id):
 
 {post.content[:200]}...
 
-Перейти к статье: http://127.0.0.1:8000/news/{post.id}/
+Перейти к статье: {_post_url(post.id)}
 
-Вы получили это письмо, потому что подписаны на категорию "{category.name}".
+Вы получили это письмо, потому что подписаны на категории {categories}.
 '''
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[subscriber.email],
-                    )
+    return subject, message
 
-        return f"Уведомления отправлены для статьи: {post.title}"
 
+@shared_task
+def send_new_post_notification(post_id):
+    """Асинхронная отправка уведомлений о новой статье подписчикам
+
+    Находит уникальных получателей одним запросом и раздает их пачками
+    в подзадачи send_post_notification_chunk, чтобы рассылка шла
+    параллельно на всех воркерах.
+    """
+    try:
+        post = Post.objects.only('id', 'title').get(id=post_id)
     except Post.DoesNotExist:
         return "Статья не найдена"
 
+    recipients = (
+        _post_subscriptions(post_id)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    chunk_size = getattr(settings, 'NEWS_NOTIFICATION_CHUNK_SIZE', 100)
+    chunks = list(_chunked(recipients.iterator(), chunk_size))
+
+    if chunks:
+        group(send_post_notification_chunk.s(post_id, user_ids) for user_ids in chunks).apply_async()
+
+    return f"Уведомления поставлены в очередь для статьи: {post.title} (пачек: {len(chunks)})"
+
+
+@shared_task
+def send_post_notification_chunk(post_id, user_ids):
+    """Ставит в outbox уведомления пачке подписчиков"""
+    try:
+        post = Post.objects.select_related('author').get(id=post_id)
+    except Post.DoesNotExist:
+        return 0
+
+    # Один пользователь получает одно письмо, даже если подписан на несколько категорий поста
+    recipients = {}
+    rows = (
+        _post_subscriptions(post_id)
+        .filter(user_id__in=user_ids)
+        .order_by('user_id', 'category__name')
+        .values_list('user_id', 'user__email', 'category__name')
+    )
+    for user_id, email, category_name in rows:
+        recipients.setdefault((user_id, email), []).append(category_name)
+
+    messages = []
+    for (user_id, email), category_names in recipients.items():
+        subject, message = _build_post_notification(post, category_names)
+        messages.append(outbox.message(f'post:{post_id}:{user_id}', email, subject, message))
+    return _queue_emails(messages)
 
-app = Celery('newsite')
+
+def _digest_category_blocks(category_ids, period_start, period_end):
+    """Рендерит блок со списком новых статей для каждой категории один раз"""
+    rows = (
+        PostCategory.objects
+        .filter(
+            category_id__in=category_ids,
+            post__pub_date__gte=period_start,
+            post__pub_date__lt=period_end,
+        )
+        .order_by('category_id', '-post__pub_date')
+        .values_list('category_id', 'category__name', 'post_id', 'post__title')
+    )
+
+    blocks = {}
+    for category_id, category_rows in groupby(rows, key=itemgetter(0)):
+        category_rows = list(category_rows)
+        posts_list = ''.join(
+            f"• {title} - {_post_url(post_id)}\n"
+            for _, _, post_id, title in category_rows
+        )
+        category_name = category_rows[0][1]
+        blocks[category_id] = (
+            category_name,
+            f'''Категория "{category_name}" (новых статей: {len(category_rows)}):
+
+{posts_list}''',
+        )
+    return blocks
 
 
 @shared_task
 def send_weekly_digest():
-    """Еженедельная рассылка новых статей подписчикам"""
+    """Еженедельная рассылка новых статей подписчикам
 
-    # Определяем период - последние 7 дней
-    week_ago = timezone.now() - timedelta(days=7)
+    Каждый пользователь получает одно письмо по всем своим категориям.
+    Получатели обходятся серверным итератором и раздаются пачками в
+    подзадачи send_weekly_digest_chunk. После каждой пачки в DigestRun
+    сохраняется контрольная точка, поэтому прерванный запуск при повторном
+    вызове продолжается с того же места. Запуски, прерванные раньше чем
+    сутки назад, сначала дорассылаются за свой период, чтобы оставшиеся
+    получатели не потеряли тот выпуск.
+    """
+    now = timezone.now()
 
-    # Получаем все категории
-    categories = Category.objects.all()
+    resumed = 0
+    stale = DigestRun.objects.filter(finished_at__isnull=True, started_at__lt=now - timedelta(days=1))
+    for run in stale.order_by('started_at'):
+        _queue_digest(run)
+        resumed += 1
 
-    email_count = 0
+    # Возобновляем недавний незавершенный запуск или начинаем новый за последние 7 дней
+    run = DigestRun.objects.filter(
+        finished_at__isnull=True,
+        started_at__gte=now - timedelta(days=1),
+    ).first()
+    if run is None:
+        run = DigestRun.objects.create(period_start=now - timedelta(days=7), period_end=now)
 
-    for category in categories:
-        # Получаем новые статьи за неделю в этой категории
-        new_posts = Post.objects.filter(
-            categories=category,
-            pub_date__gte=week_ago
-        ).order_by('-pub_date')
+    chunk_count = _queue_digest(run)
+    result = f"Еженедельная рассылка поставлена в очередь. Пачек: {chunk_count}"
+    if resumed:
+        result += f", дорассылка прерванных запусков: {resumed}"
+    return result
 
-        if new_posts.exists():
-            # Получаем всех подписчиков категории
-            subscribers = category.subscribers.all()
 
-            for subscriber in subscribers:
-                if subscriber.email:
-                    subject = f'Еженедельная рассылка: новые статьи в категории "{category.name}"'
+def _queue_digest(run):
+    """Раздает получателей запуска пачками от контрольной точки и закрывает его"""
+    category_ids = list(
+        PostCategory.objects
+        .filter(post__pub_date__gte=run.period_start, post__pub_date__lt=run.period_end)
+        .values_list('category_id', flat=True)
+        .distinct()
+    )
 
-                    # Формируем список статей
-                    posts_list = ""
-                    for post in new_posts:
-                        posts_list += f"• {post.title} - http://127.0.0.1:8000/news/{post.id}/\n"
+    chunk_count = 0
+    if category_ids:
+        user_ids = (
+            Subscription.objects
+            .filter(category_id__in=category_ids, user_id__gt=run.last_user_id)
+            .exclude(user__email='')
+            .order_by('user_id')
+            .values_list('user_id', flat=True)
+            .distinct()
+        )
+        chunk_size = getattr(settings, 'NEWS_DIGEST_CHUNK_SIZE', 500)
 
-                    message = f'''
-Добрый день!
+        for chunk in _chunked(user_ids.iterator(chunk_size=chunk_size), chunk_size):
+            send_weekly_digest_chunk.delay(run.id, chunk)
+            DigestRun.objects.filter(pk=run.pk).update(last_user_id=chunk[-1])
+            chunk_count += 1
 
-За последнюю неделю в категории "{category.name}" опубликованы новые статьи:
+    DigestRun.objects.filter(pk=run.pk).update(finished_at=timezone.now())
+    return chunk_count
 
-{posts_list}
 
-Всего новых статей: {new_posts.count()}
+@shared_task
+def send_weekly_digest_chunk(run_id, user_ids):
+    """Ставит в outbox дайджест пачке пользователей"""
+    try:
+        run = DigestRun.objects.get(pk=run_id)
+    except DigestRun.DoesNotExist:
+        return 0
+
+    subscriptions = list(
+        Subscription.objects
+        .filter(
+            user_id__in=user_ids,
+            category__postcategory__post__pub_date__gte=run.period_start,
+            category__postcategory__post__pub_date__lt=run.period_end,
+        )
+        .exclude(user__email='')
+        .order_by('user_id', 'category__name')
+        .values_list('user_id', 'user__email', 'category_id')
+        .distinct()
+    )
+    blocks = _digest_category_blocks(
+        {category_id for _, _, category_id in subscriptions},
+        run.period_start,
+        run.period_end,
+    )
+
+    messages = []
+    for (user_id, email), rows in groupby(subscriptions, key=itemgetter(0, 1)):
+        user_blocks = [blocks[category_id] for _, _, category_id in rows if category_id in blocks]
+        if not user_blocks:
+            continue
+
+        if len(user_blocks) == 1:
+            subject = f'Еженедельная рассылка: новые статьи в категории "{user_blocks[0][0]}"'
+        else:
+            subject = 'Еженедельная рассылка: новые статьи в ваших категориях'
+
+        categories_text = '\n'.join(block for _, block in user_blocks)
+        message = f'''
+Добрый день!
+
+За последнюю неделю в ваших категориях опубликованы новые статьи:
 
+{categories_text}
 Приятного чтения!
 Команда новостного портала
 '''
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[subscriber.email],
-                    )
-                    email_count += 1
-
-    return f"Еженедельная рассылка отправлена. Писем: {email_count}"
\ No newline at end of file
+        messages.append(outbox.message(f'digest:{run.id}:{user_id}', email, subject, message))
+
+    # Считаются только новые письма: повтор пачки не создает дублей и не увеличивает счетчик
+    sent = _queue_emails(messages)
+    DigestRun.objects.filter(pk=run.pk).update(emails_sent=F('emails_sent') + sent)
+    return sent
+
+
+def _bulk_links(ranges, author_id=None):
+    """Связи публикаций из отрезков id, при author_id - только публикаций автора"""
+    links = PostCategory.objects.filter(_in_ranges(ranges))
+    if author_id is not None:
+        links = links.filter(post__author_id=author_id)
+    return links
+
+
+def _bulk_category_blocks(category_ids, ranges, author_id=None, limit=5):
+    """Блоки письма о массовой публикации: количество и последние заголовки по категориям"""
+    links = _bulk_links(ranges, author_id)
+    counts = dict(
+        links.filter(category_id__in=category_ids)
+        .values('category_id')
+        .annotate(total=Count('id'))
+        .values_list('category_id', 'total')
+    )
+    names = dict(Category.objects.filter(id__in=counts).values_list('id', 'name'))
+
+    blocks = {}
+    for category_id, total in counts.items():
+        titles = (
+            links.filter(category_id=category_id)
+            .order_by('-post__pub_date')
+            .values_list('post_id', 'post__title')[:limit]
+        )
+        posts_list = ''.join(f"• {title} - {_post_url(post_id)}\n" for post_id, title in titles)
+        more = f'...и еще {total - limit}\n' if total > limit else ''
+        blocks[category_id] = (
+            names[category_id],
+            f'''Категория "{names[category_id]}" (новых статей: {total}):
+
+{posts_list}{more}''',
+        )
+    return blocks
+
+
+@shared_task
+def send_bulk_post_notification(ranges, author_id=None):
+    """Одна рассылка о публикациях, добавленных массовым импортом или пачкой автора
+
+    Публикации задаются отрезками id [первый, последний] (см. id_ranges) -
+    ровно теми, что добавил импорт, без чужих публикаций между ними, - и
+    автором, если он указан. Каждый подписчик получает одно письмо по всем
+    своим категориям вместо письма на каждую публикацию.
+    """
+    category_ids = list(
+        _bulk_links(ranges, author_id)
+        .values_list('category_id', flat=True)
+        .distinct()
+    )
+    if not category_ids:
+        return "Нет новых публикаций в категориях"
+
+    recipients = (
+        Subscription.objects
+        .filter(category_id__in=category_ids)
+        .exclude(user__email='')
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    chunk_size = getattr(settings, 'NEWS_NOTIFICATION_CHUNK_SIZE', 100)
+    chunks = list(_chunked(recipients.iterator(), chunk_size))
+    if chunks:
+        group(
+            send_bulk_post_notification_chunk.s(ranges, user_ids, author_id) for user_ids in chunks
+        ).apply_async()
+    return f"Уведомления о публикациях {ranges[0][0]}-{ranges[-1][1]} поставлены в очередь (пачек: {len(chunks)})"
+
+
+@shared_task
+def send_bulk_post_notification_chunk(ranges, user_ids, author_id=None):
+    subscriptions = Subscription.objects.filter(
+        _in_ranges(ranges, 'category__postcategory__post_id'), user_id__in=user_ids,
+    )
+    if author_id is not None:
+        subscriptions = subscriptions.filter(category__postcategory__post__author_id=author_id)
+    subscriptions = list(
+        subscriptions
+        .exclude(user__email='')
+        .order_by('user_id', 'category__name')
+        .values_list('user_id', 'user__email', 'category_id')
+        .distinct()
+    )
+    blocks = _bulk_category_blocks({category_id for _, _, category_id in subscriptions}, ranges, author_id)
+    # Ключ рассылки: отрезки целиком, чтобы разные наборы с теми же границами не считались повтором
+    scope = hashlib.md5(json.dumps(ranges).encode()).hexdigest()[:16]
+    if author_id is not None:
+        scope = f'{author_id}:{scope}'
+
+    messages = []
+    for (user_id, email), rows in groupby(subscriptions, key=itemgetter(0, 1)):
+        user_blocks = [blocks[category_id] for _, _, category_id in rows if category_id in blocks]
+        if not user_blocks:
+            continue
+        categories_text = '\n'.join(block for _, block in user_blocks)
+        messages.append(outbox.message(
+            f'bulk:{scope}:{user_id}',
+            email,
+            'Новые статьи в ваших категориях',
+            f'''
+Добрый день!
+
+В ваших категориях опубликованы новые статьи:
+
+{categories_text}
+Команда новостного портала
+''',
+        ))
+    return _queue_emails(messages)
+
+
+def _author_window_key(author_id):
+    return f'notify:author:{author_id}'
+
+
+def schedule_author_notifications(author_id):
+    """Откладывает рассылку о публикациях автора на окно
+
+    Сами публикации ждут в PendingNotification (publish пишет их в той же
+    транзакции), а кеш только не дает ставить задачу на каждую публикацию:
+    первая публикация автора за NEWS_NOTIFICATION_COALESCE_WINDOW секунд
+    занимает ключ окна (cache.add) и откладывает рассылку на длину окна.
+    Если кеш у процессов свой, лишние задачи найдут пустую очередь.
+    Вызывается после фиксации транзакции публикации.
+    """
+    window = getattr(settings, 'NEWS_NOTIFICATION_COALESCE_WINDOW', 60)
+    if not window:
+        send_author_notifications.delay(author_id)
+    elif cache.add(_author_window_key(author_id), 1, window):
+        send_author_notifications.apply_async((author_id,), countdown=window)
+
+
+@shared_task
+def send_author_notifications(author_id):
+    """Рассылка ровно о тех публикациях автора, что ждут в PendingNotification
+
+    Строки забираются и удаляются в одной транзакции, поэтому публикация
+    попадает только в одну рассылку, а посты, созданные в обход publish
+    (импорт), не попадают ни в одну.
+    """
+    # Сначала освобождаем окно: публикация после этого откроет новое окно
+    cache.delete(_author_window_key(author_id))
+    with transaction.atomic():
+        post_ids = sorted(
+            PendingNotification.objects.select_for_update()
+            .filter(post__author_id=author_id)
+            .values_list('post_id', flat=True)
+        )
+        PendingNotification.objects.filter(post_id__in=post_ids).delete()
+
+    if not post_ids:
+        return "Нет новых публикаций автора"
+    if len(post_ids) == 1:
+        return send_new_post_notification(post_ids[0])
+    return send_bulk_post_notification(id_ranges(post_ids), author_id)
+
+
+def schedule_dispatch(countdown):
+    """Запускает диспетчер через countdown секунд, не чаще раза за это окно
+
+    Письма, поставленные за окно, уходят одним запуском, а брокер получает
+    одно сообщение вместо сообщения на каждое письмо.
+    """
+    if cache.add('outbox:dispatch-scheduled', 1, countdown):
+        try:
+            dispatch_outbox.apply_async(countdown=countdown)
+        except Exception:
+            # Брокер недоступен: письма уже в outbox, их заберет запуск по расписанию beat
+            cache.delete('outbox:dispatch-scheduled')
+
+
+@shared_task(ignore_result=True)
+def dispatch_outbox(limit=None):
+    """Отправляет письма из outbox; одновременно работает один диспетчер
+
+    Единственность держит аренда в базе (outbox.run_exclusive), поэтому
+    ограничение скорости NEWS_OUTBOX_RATE действует на все воркеры сразу.
+    Письма, поставленные, пока диспетчер занят, заберет следующий запуск
+    по расписанию beat; если запуск остановился по сроку аренды, остаток
+    очереди сразу передается следующему.
+    """
+    stats = outbox.run_exclusive(outbox.Dispatcher(), limit)
+    if stats is None:
+        return 0
+    if stats['deadline_reached']:
+        schedule_dispatch(1)
+    return stats['sent']
+
+
+@shared_task(ignore_result=True)
+def flush_post_views():
+    """Переносит просмотры из кеша в базу и пересчитывает рейтинги; один сброс за раз"""
+    if not cache.add('pageviews:flush-lock', 1, 300):
+        return 0
+    try:
+        return pageviews.flush()
+    finally:
+        cache.delete('pageviews:flush-lock')
+
+
+@shared_task(ignore_result=True)
+def update_related_posts(post_ids):
+    """Пересчитывает похожие публикации для созданных и измененных публикаций"""
+    return related.update(post_ids)
+
+
+@shared_task(ignore_result=True)
+def rebuild_related_posts():
+    """Ежесуточная полная пересборка похожих публикаций; одна пересборка за раз
+
+    Заодно пересчитывает списки, обновление которых не удалось поставить в
+    очередь (например, брокер был недоступен).
+    """
+    if not related.available():
+        return 0
+    lock_key = 'related:rebuild-lock'
+    token = uuid.uuid4().hex
+    # Пересборка 500 000 публикаций идет около 15 минут, блокировка с запасом
+    if not cache.add(lock_key, token, 6 * 3600):
+        return 0
+    try:
+        return related.rebuild()[0]
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
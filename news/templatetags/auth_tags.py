@@ -1,10 +1,9 @@
 from django import template
-from django.contrib.auth.models import Group
+
+from news.groups import get_group_names
 
 register = template.Library()
 
 @register.filter(name='has_group')
 def has_group(user, group_name):
-    if user.is_authenticated:
-        return user.groups.filter(name=group_name).exists()
-    return False
\ No newline at end of file
+    return group_name in get_group_names(user)
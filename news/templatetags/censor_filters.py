@@ -1,14 +1,9 @@
 from django import template
 from django.utils.safestring import mark_safe
-from django.conf import settings
 
-register = template.Library()
+from news.censor import get_engine
 
-CENSORED_WORDS = [
-    'редиска',
-    'плохое',
-    'запрещенное',
-]
+register = template.Library()
 
 
 @register.filter(name='censor')
@@ -16,15 +11,4 @@ def censor(value):
     if not isinstance(value, str):
         return value
 
-    words = value.split()
-    result = []
-
-    for word in words:
-        lower_word = word.lower()
-        if any(censored in lower_word for censored in CENSORED_WORDS):
-            censored_word = '*' * len(word)
-            result.append(censored_word)
-        else:
-            result.append(word)
-
-    return mark_safe(' '.join(result))
\ No newline at end of file
+    return mark_safe(get_engine().censor(value))
@@ -0,0 +1,11 @@
+from django import template
+
+from news.pageviews import most_read as get_most_read
+
+register = template.Library()
+
+
+@register.simple_tag
+def most_read(window):
+    """Готовый рейтинг самых читаемых публикаций: {% most_read '24h' as top %}"""
+    return get_most_read(window)
@@ -1,3 +1,1222 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import random
+import smtplib
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from unittest import addModuleCleanup, mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from celery import current_app
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.http import Http404
+from django.templatetags.static import static
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+
+from . import (
+    async_views, benchmarks, censor, compression, counters, db, feeds, metrics, outbox, pageviews, query_plans,
+    related, staticfiles,
+)
+from .cache import LIST_VERSION, post_version
+from .importer import ImportDataError, PostImporter, read_rows
+from .models import (
+    Category, DigestRun, OutboxLease, OutboxMessage, PendingNotification, Post, PostCategory, PostView, RelatedPost,
+    Subscription,
+)
+from .pagination import CursorPaginator
+from .search import get_backend as get_search_backend
+from .services import publish
+from .tasks import (
+    _author_window_key, dispatch_outbox, flush_post_views, rebuild_related_posts, send_author_notifications,
+    send_bulk_post_notification, send_new_post_notification, send_weekly_digest, send_weekly_digest_chunk,
+    update_related_posts,
+)
+from .views import post_cards
+
+# Размеры данных, на которых проверяется, что число запросов не растет
+SIZES = (1, 5, 10)
+# Запросы одного запуска диспетчера outbox: аренда, claim, отметка отправленных, счетчик, пустой claim
+DISPATCH_BUDGET = 19
+
+
+def setUpModule():
+    # Задачи Celery выполняются сразу, в процессе теста
+    eager = current_app.conf.task_always_eager
+    current_app.conf.task_always_eager = True
+    addModuleCleanup(setattr, current_app.conf, 'task_always_eager', eager)
+    # Просмотры тестов не должны уйти при выходе процесса (atexit) в базу разработки
+    addModuleCleanup(pageviews.buffer.take)
+
+
+def make_users(count, prefix='user'):
+    # bulk_create не вызывает сигналы post_save, приветственные письма не отправляются
+    start = User.objects.count()
+    return User.objects.bulk_create([
+        User(username=f'{prefix}{start + i}', email=f'{prefix}{start + i}@example.com')
+        for i in range(count)
+    ])
+
+
+def make_author():
+    author = make_users(1, prefix='author')[0]
+    author.groups.add(Group.objects.get_or_create(name='authors')[0])
+    return author
+
+
+def make_categories(count=3):
+    return Category.objects.bulk_create([Category(name=f'Категория {i}') for i in range(count)])
+
+
+def make_posts(count, author, categories=()):
+    posts = Post.objects.bulk_create([
+        Post(title=f'Публикация {i}', content='Текст публикации ' * 20, author=author)
+        for i in range(count)
+    ])
+    links = PostCategory.objects.bulk_create([
+        PostCategory(post=post, category=category)
+        for post in posts
+        for category in categories
+    ])
+    counters.increment(counters.POSTS_TOTAL, len(posts))
+    counters.change_post_counts([link.category_id for link in links])
+    return posts
+
+
+def subscribe(users, categories):
+    subscriptions = Subscription.objects.bulk_create([
+        Subscription(user=user, category=category) for user in users for category in categories
+    ])
+    counters.change_subscriber_counts([subscription.category_id for subscription in subscriptions])
+
+
+class QueryBudgetTestCase(TestCase):
+    """Базовый класс для проверки максимального числа SQL-запросов
+
+    assertQueryBudget запускает сценарий на наборах данных разного размера
+    и проверяет, что запросов не больше бюджета и что их число не зависит
+    от количества строк (то есть шаблон или задача не делают запрос на строку).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+        self.categories = make_categories()
+
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        self.assertLessEqual(
+            executed,
+            budget,
+            f'Выполнено {executed} запросов при бюджете {budget}:\n'
+            + '\n'.join(query['sql'] for query in context.captured_queries),
+        )
+
+    def assertQueryBudget(self, budget, prepare, run):
+        """prepare(size) создает данные, run(state) выполняет проверяемый сценарий"""
+        counts = []
+        for size in SIZES:
+            state = prepare(size)
+            cache.clear()
+            with self.assertMaxQueries(budget) as context:
+                run(state)
+            counts.append(len(context.captured_queries))
+        # Первый прогон может включать разовые загрузки (словарь censor, запись сессии)
+        self.assertLessEqual(
+            max(counts[1:]), counts[0],
+            f'Число запросов растет вместе с данными: {dict(zip(SIZES, counts))}',
+        )
+
+
+class PublicViewQueryBudgetTests(QueryBudgetTestCase):
+
+    def prepare_posts(self, size):
+        Post.objects.all().delete()
+        return make_posts(size, self.author, self.categories[:2])
+
+    def test_news_list_anonymous(self):
+        self.assertQueryBudget(3, self.prepare_posts, lambda posts: self.client.get(reverse('news_list')))
+
+    def test_news_list_author(self):
+        self.client.force_login(self.author)
+        self.assertQueryBudget(10, self.prepare_posts, lambda posts: self.client.get(reverse('news_list')))
+
+    def test_news_list_anonymous_cached(self):
+        make_posts(5, self.author, self.categories[:2])
+        self.client.get(reverse('news_list'))
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('news_list'))
+
+    def test_news_detail(self):
+        self.assertQueryBudget(
+            3,
+            self.prepare_posts,
+            lambda posts: self.client.get(reverse('news_detail', args=[posts[0].id])),
+        )
+
+    def test_news_search_by_text(self):
+        def prepare(size):
+            posts = self.prepare_posts(size)
+            # bulk_create не обновляет поисковый индекс
+            get_search_backend().index_posts(posts)
+            return posts
+
+        self.assertQueryBudget(
+            2,
+            prepare,
+            lambda posts: self.client.get(reverse('news_search'), {'title': 'публикация'}),
+        )
+
+    def test_news_search_by_author(self):
+        self.assertQueryBudget(
+            2,
+            self.prepare_posts,
+            lambda posts: self.client.get(reverse('news_search'), {'author': 'author'}),
+        )
+
+    def test_category_list(self):
+        def prepare(size):
+            users = make_users(size)
+            subscribe(users, self.categories)
+            Category.objects.bulk_create([Category(name=f'Новая {size}-{i}') for i in range(size)])
+            self.client.force_login(users[0])
+
+        self.assertQueryBudget(4, prepare, lambda state: self.client.get(reverse('category_list')))
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+
+    def test_save_invalidates_pages(self):
+        post = make_posts(1, self.author)[0]
+        detail, listing = reverse('news_detail', args=[post.id]), reverse('news_list')
+        self.assertContains(self.client.get(detail), 'Публикация 0')
+        self.assertContains(self.client.get(listing), 'Публикация 0')
+        with self.assertNumQueries(0):
+            self.client.get(detail)
+
+        post.title = 'Новый заголовок'
+        post.save()
+        self.assertContains(self.client.get(detail), 'Новый заголовок')
+        self.assertContains(self.client.get(listing), 'Новый заголовок')
+
+        # Вытесненная версия не возвращается к номеру, под которым лежит старая страница
+        post.title = 'Третий заголовок'
+        post.save()
+        cache.delete_many([f'version:{post_version(post.id)}', f'version:{LIST_VERSION}'])
+        self.assertContains(self.client.get(detail), 'Третий заголовок')
+        self.assertContains(self.client.get(listing), 'Третий заголовок')
+
+    def test_not_modified_until_edit(self):
+        post = make_posts(1, self.author)[0]
+        detail = reverse('news_detail', args=[post.id])
+        etag = self.client.get(detail)['ETag']
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        post.title = 'Исправленный заголовок'
+        post.save()
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Исправленный заголовок')
+
+    def test_group_change_changes_etag(self):
+        Group.objects.get_or_create(name='common')
+        user = make_users(1)[0]
+        self.client.force_login(user)
+        listing = reverse('news_list')
+        etag = self.client.get(listing)['ETag']
+        self.assertEqual(self.client.get(listing, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse('become_author'))
+        response = self.client.get(listing, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TaskQueryBudgetTests(QueryBudgetTestCase):
+
+    def prepare_subscribers(self, size):
+        Subscription.objects.all().delete()
+        subscribe(make_users(size), self.categories)
+        return make_posts(1, self.author, self.categories[:2])[0]
+
+    def test_send_new_post_notification(self):
+        def run(post):
+            mail.outbox = []
+            # Письма уходят через outbox: диспетчер запускается после фиксации транзакции
+            with self.captureOnCommitCallbacks(execute=True):
+                send_new_post_notification(post.id)
+            self.assertEqual(len(mail.outbox), Subscription.objects.values('user').distinct().count())
+
+        self.assertQueryBudget(6 + DISPATCH_BUDGET, self.prepare_subscribers, run)
+
+    def test_send_weekly_digest(self):
+        def run(post):
+            mail.outbox = []
+            with self.captureOnCommitCallbacks(execute=True):
+                send_weekly_digest()
+            self.assertEqual(len(mail.outbox), Subscription.objects.values('user').distinct().count())
+
+        self.assertQueryBudget(13 + DISPATCH_BUDGET, self.prepare_subscribers, run)
+
+
+class NotificationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+        self.categories = make_categories()
+
+    @override_settings(NEWS_NOTIFICATION_CHUNK_SIZE=2)
+    def test_one_email_per_subscriber_across_chunks(self):
+        users = make_users(5)
+        subscribe(users, self.categories)
+        post = make_posts(1, self.author, self.categories[:2])[0]
+        PostCategory.objects.create(post=post, category=self.categories[2])
+        mail.outbox = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = send_new_post_notification(post.id)
+        self.assertIn('пачек: 3', result)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted(user.email for user in users))
+        # Все категории поста перечислены в единственном письме подписчика
+        for category in self.categories:
+            self.assertIn(category.name, mail.outbox[0].body)
+
+        # Повтор задачи не ставит писем повторно
+        with self.captureOnCommitCallbacks(execute=True):
+            send_new_post_notification(post.id)
+        self.assertEqual(len(mail.outbox), len(users))
+
+    @override_settings(NEWS_DIGEST_CHUNK_SIZE=2)
+    def test_digest_resumes_from_checkpoint(self):
+        users = make_users(5)
+        subscribe(users, self.categories)
+        make_posts(2, self.author, self.categories[:2])
+        now = timezone.now()
+        # Прерванный запуск: первые две пачки уже разосланы
+        run = DigestRun.objects.create(
+            period_start=now - timedelta(days=7), period_end=now + timedelta(seconds=1), last_user_id=users[3].id,
+        )
+        mail.outbox = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_weekly_digest()
+        self.assertEqual([message.to[0] for message in mail.outbox], [users[4].email])
+        run.refresh_from_db()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.last_user_id, run.emails_sent), (users[4].id, 1))
+        self.assertEqual(DigestRun.objects.count(), 1)
+
+        # Повтор пачки писем не ставит и счетчик не увеличивает
+        self.assertEqual(send_weekly_digest_chunk(run.id, [users[4].id]), 0)
+        run.refresh_from_db()
+        self.assertEqual(run.emails_sent, 1)
+
+    @override_settings(NEWS_DIGEST_CHUNK_SIZE=2)
+    def test_stale_run_finished_before_new_one(self):
+        users = make_users(3)
+        subscribe(users, self.categories[:1])
+        post, = make_posts(1, self.author, self.categories[:1])
+        Post.objects.filter(pk=post.pk).update(pub_date=timezone.now() - timedelta(days=10))
+        # Запуск прошлой недели прервался после первой пачки и больше суток не возобновлялся
+        started = timezone.now() - timedelta(days=8)
+        stale = DigestRun.objects.create(
+            period_start=started - timedelta(days=7), period_end=started, started_at=started,
+            last_user_id=users[1].id,
+        )
+        mail.outbox = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = send_weekly_digest()
+        self.assertIn('прерванных запусков: 1', result)
+        self.assertEqual([message.to[0] for message in mail.outbox], [users[2].email])
+        stale.refresh_from_db()
+        self.assertIsNotNone(stale.finished_at)
+        self.assertEqual((stale.last_user_id, stale.emails_sent), (users[2].id, 1))
+        self.assertFalse(DigestRun.objects.filter(finished_at__isnull=True).exists())
+
+
+class CensorTests(SimpleTestCase):
+
+    def test_engine_matches_legacy(self):
+        words = ['редиска', 'ред', 'плохое', 'плох', 'запрещенное', 'abc', 'abcd', 'x']
+        rng = random.Random(7)
+        alphabet = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяabcdxyz.,!-'
+        texts = [
+            'Эта РЕДИСКА   сказала\tплохое слово!',
+            'Неплохой день, запрещенноеслово и abcd.',
+            'xyz İstanbul ред-редиска',
+            '',
+            '   ',
+        ]
+        for _ in range(300):
+            texts.append(' '.join(
+                ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 10))).capitalize()
+                + (rng.choice(words) if rng.random() < 0.1 else '')
+                for _ in range(rng.randint(1, 20))
+            ))
+
+        engine = censor.CensorEngine(words)
+        for text in texts:
+            self.assertEqual(engine.censor(text), censor.legacy_censor(text, words), text)
+
+
+class BenchmarkCompareTests(TestCase):
+
+    def test_regression_over_threshold(self):
+        baseline = {'results': {'news_list': benchmarks.summarize([10, 10, 10]), 'removed': {'median': 5}}}
+        current = {'results': {
+            'news_list': benchmarks.summarize([13, 13, 13]),
+            'news_detail': benchmarks.summarize([1]),
+        }}
+        self.assertEqual([name for name, *_ in benchmarks.compare(current, baseline, 0.2)], ['news_list'])
+        self.assertEqual(benchmarks.compare(current, baseline, 0.5), [])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.author = make_author()
+
+    def test_server_timing_and_histograms(self):
+        make_posts(3, self.author)
+        response = self.client.get(reverse('news_list'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn('cache;desc="hit=0 miss=1"', response['Server-Timing'])
+        self.assertIn('hit=1', self.client.get(reverse('news_list'))['Server-Timing'])
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('news_request_duration_seconds_count{view="news_list"} 2', body)
+        self.assertIn('news_page_cache_hits_total{view="news_list"} 1', body)
+        self.assertNotIn('view="metrics"', body)
+
+    @override_settings(NEWS_METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_closed_to_outside_by_default(self):
+        outside = {'REMOTE_ADDR': '203.0.113.5'}
+        self.assertEqual(self.client.get(reverse('metrics'), **outside).status_code, 403)
+        with self.settings(NEWS_METRICS_ALLOWED_IPS=['203.0.113.0/24']):
+            self.assertEqual(self.client.get(reverse('metrics'), **outside).status_code, 200)
+
+        self.author.is_staff = True
+        self.author.save()
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('metrics'), **outside).status_code, 200)
+
+
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.author = make_author()
+        self.categories = make_categories(2)
+
+    def counts(self, category):
+        category.refresh_from_db()
+        return category.post_count, category.subscriber_count
+
+    def test_signals_and_reconcile(self):
+        category = self.categories[0]
+        post = Post.objects.create(title='Счетчик', content='Текст', author=self.author)
+        link = PostCategory.objects.create(post=post, category=category)
+        subscription = Subscription.objects.create(user=self.author, category=category)
+        self.assertEqual(self.counts(category), (1, 1))
+        self.assertEqual(counters.get_value(counters.POSTS_TOTAL), 1)
+        link.delete()
+        subscription.delete()
+        self.assertEqual(self.counts(category), (0, 0))
+
+        # Вставки в обход сигналов и ручная правка дают расхождение
+        posts = Post.objects.bulk_create([Post(title=f'Без сигнала {i}', content='Текст') for i in range(3)])
+        PostCategory.objects.bulk_create([PostCategory(post=post, category=category) for post in posts])
+        Category.objects.filter(pk=self.categories[1].pk).update(subscriber_count=5)
+
+        self.assertEqual(counters.reconcile(), {'post_count': 1, 'subscriber_count': 1, counters.POSTS_TOTAL: 1})
+        self.assertEqual(self.counts(category), (3, 0))
+        self.assertEqual(self.counts(self.categories[1]), (0, 0))
+        self.assertEqual(counters.get_value(counters.POSTS_TOTAL), 4)
+        self.assertEqual(counters.reconcile(), {'post_count': 0, 'subscriber_count': 0, counters.POSTS_TOTAL: 0})
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+
+    def search(self, query, **kwargs):
+        return set(get_search_backend().search(query, 10, **kwargs))
+
+    def test_index_follows_create_edit_delete(self):
+        post = Post.objects.create(title='Вулкан проснулся', content='Извержение', author=self.author)
+        self.assertEqual(self.search('вулкан'), {post.id})
+
+        post.title = 'Гейзер проснулся'
+        post.save()
+        self.assertEqual(self.search('вулкан'), set())
+        self.assertEqual(self.search('гейзер извержение'), {post.id})
+
+        post.delete()
+        self.assertEqual(self.search('гейзер'), set())
+
+    @override_settings(NEWS_SEARCH_MAX_RESULTS=2)
+    def test_filters_applied_before_limit(self):
+        other = make_users(1, prefix='writer')[0]
+        for author in (self.author, self.author, self.author, other):
+            Post.objects.create(title='Новость о погоде', content='Погода', author=author)
+        mine = set(Post.objects.filter(author=other).values_list('id', flat=True))
+
+        self.assertEqual(self.search('погода', posts=Post.objects.filter(author=other)), mine)
+        response = self.client.get(reverse('news_search'), {'title': 'погода', 'author': 'writer'})
+        self.assertEqual({post.id for post in response.context['page_obj']}, mine)
+
+
+class QueryPlanTests(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        make_posts(5, make_author(), make_categories(2))
+        failed = {report.query.name: report.plan for report in query_plans.check() if not report.ok}
+        self.assertEqual(failed, {})
+
+    def test_full_scan_detected(self):
+        report, = query_plans.check([query_plans.HotQuery('by_title', Post.objects.filter(title='x'))])
+        self.assertEqual(report.full_scans, ['news_post'])
+
+
+class SQLiteProfileTests(TestCase):
+
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], db.get_pragmas()['busy_timeout'])
+
+    def test_retry_on_lock_outside_transaction(self):
+        calls = []
+
+        @db.retry_on_db_lock(attempts=3, delay=0)
+        def write():
+            calls.append(connection.in_atomic_block)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        # TestCase держит тест в транзакции, повторы разрешены только вне ее
+        connection.in_atomic_block, in_atomic_block = False, connection.in_atomic_block
+        try:
+            self.assertEqual(write(), 'ok')
+        finally:
+            connection.in_atomic_block = in_atomic_block
+        self.assertEqual(len(calls), 3)
+
+    def test_no_retry_inside_transaction(self):
+        @db.retry_on_db_lock(attempts=3, delay=0)
+        def write():
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            write()
+
+
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        posts = make_posts(23, make_author())
+        # Новые публикации идут первыми: ожидаемый порядок по убыванию id
+        self.ids = [post.id for post in reversed(posts)]
+
+    def ids_of(self, page):
+        return [post.id for post in page]
+
+    def test_forward_and_back(self):
+        paginator = CursorPaginator(post_cards(), 10)
+        pages = [paginator.get_page(None)]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([self.ids_of(page) for page in pages], [self.ids[:10], self.ids[10:20], self.ids[20:]])
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual((self.ids_of(back), back.number), (self.ids[10:20], 2))
+        first = paginator.get_page(back.previous_cursor)
+        self.assertEqual((self.ids_of(first), first.number, first.has_previous()), (self.ids[:10], 1, False))
+
+    def test_last_page_aligned_without_count(self):
+        paginator = CursorPaginator(post_cards(), 10)
+        last = paginator.get_page(paginator.last_cursor)
+        self.assertEqual((self.ids_of(last), last.number, last.has_next()), (self.ids[20:], 3, False))
+        self.assertEqual([link.number for link in last.page_links], [1, 2, 3])
+
+        back = CursorPaginator(post_cards(), 10).get_page(last.previous_cursor)
+        self.assertEqual((self.ids_of(back), back.number), (self.ids[10:20], 2))
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+        self.categories = make_categories(2)
+
+    def async_request(self, path, data=None, user=None):
+        request = AsyncRequestFactory().get(path, data)
+        request.user = user or AnonymousUser()
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        return request
+
+    async def test_public_pages(self):
+        posts = await sync_to_async(make_posts)(12, self.author, self.categories)
+        await sync_to_async(get_search_backend().index_posts)(posts)
+
+        response = await async_views.news_list(self.async_request('/'))
+        self.assertContains(response, 'Публикация 11')
+        self.assertTrue(response.has_header('ETag'))
+
+        response = await async_views.news_detail(self.async_request(f'/{posts[0].id}/'), posts[0].id)
+        self.assertContains(response, posts[0].title)
+        with self.assertRaises(Http404):
+            await async_views.news_detail(self.async_request('/0/'), 0)
+
+        response = await async_views.news_search(self.async_request('/search/', {'title': 'публикация'}))
+        self.assertContains(response, 'Публикация 0')
+
+        await sync_to_async(subscribe)([self.author], self.categories[:1])
+        response = await async_views.category_list(self.async_request('/categories/', user=self.author))
+        self.assertContains(response, self.categories[0].name)
+
+    async def test_cursor_pages_match_sync(self):
+        await sync_to_async(make_posts)(25, self.author)
+        paginator = CursorPaginator(post_cards(), 10)
+        cursor = None
+        for _ in range(3):
+            page = await sync_to_async(paginator.get_page)(cursor)
+            async_page = await paginator.aget_page(cursor)
+            self.assertEqual([post.id for post in async_page], [post.id for post in page])
+            self.assertEqual(async_page.next_cursor, page.next_cursor)
+            cursor = page.next_cursor
+
+
+class FeedTests(QueryBudgetTestCase):
+
+    def test_feeds_served_from_cache(self):
+        make_posts(3, self.author, self.categories[:2])
+        url = reverse('category_feed', args=[self.categories[0].id, 'rss'])
+        response = self.client.get(url)
+        self.assertContains(response, 'Публикация 2')
+        self.assertEqual(response['Content-Type'], feeds.CONTENT_TYPES['rss'])
+
+        for fmt in feeds.FORMATS:
+            with self.assertMaxQueries(0):
+                self.client.get(reverse('category_feed', args=[self.categories[0].id, fmt]))
+        with self.assertMaxQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('category_feed', args=[0, 'json'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('feed', args=['xml'])).status_code, 404)
+
+    def test_only_affected_feeds_regenerated(self):
+        make_posts(1, self.author, self.categories[:2])
+        for scope in (feeds.ALL, *(feeds.category_scope(category.id) for category in self.categories)):
+            feeds.build(scope)
+        other_feed = feeds.get(feeds.category_scope(self.categories[1].id), 'json')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Свежая новость', content='Текст', author=self.author)
+            PostCategory.objects.create(post=post, category=self.categories[0])
+
+        self.assertIn('Свежая новость', feeds.get(feeds.ALL, 'json')['body'].decode())
+        self.assertIn('Свежая новость', feeds.get(feeds.category_scope(self.categories[0].id), 'atom')['body'].decode())
+        self.assertEqual(feeds.get(feeds.category_scope(self.categories[1].id), 'json'), other_feed)
+
+    def test_last_modified_never_goes_back(self):
+        posts = make_posts(2, self.author, self.categories[:1])
+        url = reverse('category_feed', args=[self.categories[0].id, 'rss'])
+        first = self.client.get(url)['Last-Modified']
+        # Пересборка без изменений не сдвигает отметку
+        cache.delete_many([f'feed:{feeds.category_scope(self.categories[0].id)}:{fmt}' for fmt in feeds.FORMATS])
+        self.assertEqual(self.client.get(url)['Last-Modified'], first)
+
+        # Удаление самой свежей публикации меняет ленту, Last-Modified растет
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[1].delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Публикация 1')
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[0].delete()
+        self.assertGreater(
+            parse_http_date(self.client.get(url)['Last-Modified']), parse_http_date(response['Last-Modified']),
+        )
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.author = make_author()
+        self.categories = make_categories(2)
+
+    def get_export(self, dataset, **params):
+        response = self.client.get(reverse('export_data', args=[dataset]), params)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_staff_only(self):
+        response, _ = self.get_export('posts')
+        self.assertEqual(response.status_code, 302)
+
+    def test_posts_since_and_gzip(self):
+        posts = make_posts(5, self.author, self.categories)
+        Post.objects.filter(pk=posts[0].pk).update(pub_date=timezone.now() - timedelta(days=30))
+        self.author.is_staff = True
+        self.author.save(update_fields=['is_staff'])
+        self.client.force_login(self.author)
+
+        with self.settings(NEWS_EXPORT_BATCH_SIZE=2):
+            response, body = self.get_export('posts', since=(timezone.now() - timedelta(days=1)).date().isoformat())
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(post.id for post in posts[1:]))
+        self.assertEqual(rows[0]['categories'], sorted(category.name for category in self.categories))
+
+        response, body = self.get_export('subscriptions', format='csv', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(gzip.decompress(body).decode().startswith('id,user_id,username'))
+        self.assertEqual(self.get_export('posts', since='вчера')[0].status_code, 400)
+
+
+class CompressionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+
+    def test_minify_html(self):
+        html = '<div>\n    <p>Текст\u00a0\u00a0с   пробелами</p>  <!-- комментарий -->\n</div>\n<pre>  код\n    отступ</pre>'
+        self.assertEqual(
+            compression.minify_html(html),
+            '<div>\n<p>Текст\u00a0\u00a0с пробелами</p>\n</div>\n<pre>  код\n    отступ</pre>',
+        )
+
+    def test_cached_page_compressed_once(self):
+        make_posts(12, self.author)
+        url = reverse('news_list')
+        plain = self.client.get(url).content
+        self.assertNotIn(b'\n    ', plain)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        # Ответ из кеша отдает сохраненный вариант, а не сжимает страницу заново
+        self.assertEqual(response.content, response.precompressed['gzip'])
+        self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_streaming_response_compressed(self):
+        make_posts(5, self.author)
+        self.author.is_staff = True
+        self.author.save(update_fields=['is_staff'])
+        self.client.force_login(self.author)
+        url = reverse('export_data', args=['posts'])
+
+        plain = b''.join(self.client.get(url).streaming_content)
+        with self.settings(NEWS_EXPORT_BATCH_SIZE=2):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+
+class PageViewTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        # Просмотры из других тестов остаются в буфере процесса
+        pageviews.buffer.take()
+
+    def view(self, post, times=1):
+        for _ in range(times):
+            self.assertEqual(self.client.get(reverse('news_detail', args=[post.id])).status_code, 200)
+
+    @override_settings(NEWS_VIEWS_VIA_CACHE=True)
+    def test_views_flushed_in_batches_and_ranked(self):
+        posts = make_posts(3, self.author, self.categories[:2])
+        with self.settings(NEWS_VIEWS_PUSH_SIZE=3):
+            self.view(posts[0], 1)
+            self.view(posts[1], 5)
+            self.view(posts[2])
+            # Страница из кеша не ходит в базу и за счетчиком
+            with self.assertNumQueries(0):
+                self.view(posts[2])
+        pageviews.buffer.drain()
+
+        # Корзины, публикации и upsert в транзакции, очистка старых корзин, два окна и заголовки
+        with self.assertMaxQueries(9):
+            self.assertEqual(flush_post_views.delay().get(), 8)
+        self.assertEqual(
+            dict(PostView.objects.values_list('post_id', 'views')),
+            {posts[0].id: 1, posts[1].id: 5, posts[2].id: 2},
+        )
+
+        # Следующий сброс добавляет к той же часовой корзине
+        self.view(posts[0], 6)
+        pageviews.buffer.drain()
+        flush_post_views.delay()
+        self.assertEqual(PostView.objects.get(post=posts[0]).views, 7)
+        self.assertEqual(flush_post_views.delay().get(), 0)
+
+        with self.assertNumQueries(0):
+            top = pageviews.most_read('24h')
+        self.assertEqual([(row['id'], row['views']) for row in top], [(posts[0].id, 7), (posts[1].id, 5), (posts[2].id, 2)])
+        response = self.client.get(reverse('news_list'))
+        self.assertContains(response, 'Самое читаемое')
+
+        # Новый рейтинг сбрасывает закешированную главную и ее ETag
+        self.view(posts[2], 10)
+        pageviews.buffer.drain()
+        flush_post_views.delay()
+        fresh = self.client.get(reverse('news_list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+        self.assertContains(fresh, '<small class="text-muted">12</small>')
+
+    @override_settings(NEWS_VIEWS_VIA_CACHE=False, NEWS_VIEWS_PUSH_SIZE=2)
+    def test_views_saved_directly_without_shared_cache(self):
+        posts = make_posts(2, self.author, self.categories[:1])
+        self.view(posts[0], 3)
+        self.view(posts[1])
+        pageviews.buffer.drain()
+        # Кеш воркера (LocMemCache другого процесса) пачек не видит, но они уже в базе
+        cache.clear()
+        self.assertEqual(
+            dict(PostView.objects.values_list('post_id', 'views')), {posts[0].id: 3, posts[1].id: 1},
+        )
+        self.assertEqual(flush_post_views.delay().get(), 0)
+        self.assertEqual([row['id'] for row in pageviews.most_read('24h')], [posts[0].id, posts[1].id])
+
+
+@skipUnless(related.available(), 'нужны numpy и scipy')
+class RelatedPostTests(TestCase):
+    TOPICS = {
+        'футбол': 'матч команда гол тренер стадион болельщики',
+        'экономика': 'рынок инфляция банк кредит валюта бюджет',
+        'космос': 'ракета орбита спутник космонавт станция запуск',
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+        self.categories = make_categories(1)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(NEWS_RELATED_INDEX=str(Path(directory.name) / 'index.npz')))
+        self.posts = {
+            topic: Post.objects.bulk_create([
+                Post(title=f'{topic.capitalize()}: выпуск {i}', content=f'{words} ' * (i + 1), author=self.author)
+                for i in range(3)
+            ])
+            for topic, words in self.TOPICS.items()
+        }
+
+    def related_ids(self, post):
+        return set(RelatedPost.objects.filter(post=post).values_list('related_id', flat=True))
+
+    def test_rebuild_and_incremental_update(self):
+        self.assertEqual(related.rebuild(batch_size=4)[0], 9)
+        for posts in self.posts.values():
+            for post in posts:
+                self.assertEqual(self.related_ids(post), {other.id for other in posts if other != post})
+
+        # Новая публикация попадает в списки своей темы, чужие темы не пересчитываются
+        untouched = {
+            row.pk: row.score for row in RelatedPost.objects.filter(post__in=self.posts['экономика'])
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            post, = publish([(Post(title='Футбол: итоги', content=self.TOPICS['футбол']), [self.categories[0]])], author=self.author)
+        self.assertEqual(self.related_ids(post), {other.id for other in self.posts['футбол']})
+        for other in self.posts['футбол']:
+            self.assertIn(post.id, self.related_ids(other))
+        self.assertEqual(
+            {row.pk: row.score for row in RelatedPost.objects.filter(post__in=self.posts['экономика'])}, untouched,
+        )
+
+        # Смена темы убирает публикацию из старых списков
+        post.title, post.content = 'Космос: итоги', self.TOPICS['космос']
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        self.assertEqual(self.related_ids(post), {other.id for other in self.posts['космос']})
+        for other in self.posts['футбол']:
+            self.assertNotIn(post.id, self.related_ids(other))
+
+        # Страница читает готовый список одним запросом
+        response = self.client.get(reverse('news_detail', args=[self.posts['космос'][0].id]))
+        self.assertContains(response, 'Похожие публикации')
+        self.assertContains(response, 'Космос: итоги')
+
+    def test_broker_outage_and_scheduled_rebuild(self):
+        self.assertEqual(rebuild_related_posts.delay().get(), 9)
+        # Недоступный брокер не ломает сохранение: списки догонит пересборка по расписанию
+        with mock.patch.object(update_related_posts, 'delay', side_effect=OSError('broker down')):
+            with self.captureOnCommitCallbacks(execute=True):
+                post, = publish([(Post(title='Футбол: итоги', content=self.TOPICS['футбол']), [])], author=self.author)
+        self.assertEqual(self.related_ids(post), set())
+
+        cache.set('related:rebuild-lock', 'other', 60)
+        self.assertEqual(rebuild_related_posts.delay().get(), 0)
+        cache.delete('related:rebuild-lock')
+        self.assertEqual(rebuild_related_posts.delay().get(), 10)
+        self.assertEqual(self.related_ids(post), {other.id for other in self.posts['футбол']})
+        self.assertIn('news.tasks.rebuild_related_posts', {
+            entry['task'] for entry in current_app.conf.beat_schedule.values()
+        })
+
+
+class ImportTests(QueryBudgetTestCase):
+
+    def test_import_batches_and_notification(self):
+        users = make_users(3)
+        subscribe(users, self.categories[:1])
+        rows = [
+            {'title': f'Импорт {i}', 'content': 'Текст', 'author': self.author.username,
+             'categories': [self.categories[0].name, 'Новая категория']}
+            for i in range(5)
+        ]
+        rows.append({'title': '', 'content': 'Без заголовка'})
+
+        def interleaved():
+            for number, row in enumerate(rows):
+                if number == 2:
+                    # Чужая публикация между пачками импорта не попадает в его рассылку
+                    other = Post.objects.create(title='Чужая', content='Текст', author=make_users(1)[0])
+                    PostCategory.objects.create(post=other, category=self.categories[0])
+                yield row
+
+        importer = PostImporter(batch_size=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = importer.run(interleaved())
+
+        self.assertEqual((stats['posts'], stats['links'], stats['skipped']), (5, 10, 1))
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 5)
+        self.assertEqual(counters.get_value(counters.POSTS_TOTAL), 6)
+        self.assertEqual(Category.objects.get(name='Новая категория').post_count, 5)
+        self.assertEqual(
+            set(get_search_backend().search('Импорт', 10)),
+            set(Post.objects.filter(author=self.author).values_list('id', flat=True)),
+        )
+        self.assertEqual(len(importer.ranges), 2)
+
+        mail.outbox.clear()
+        with self.settings(NEWS_SITE_URL='https://news.example.com/'), self.assertMaxQueries(8 + DISPATCH_BUDGET), \
+                self.captureOnCommitCallbacks(execute=True):
+            send_bulk_post_notification.delay(importer.ranges)
+        self.assertEqual(len(mail.outbox), len(users))
+        self.assertIn('новых статей: 5', mail.outbox[0].body)
+        self.assertNotIn('Чужая', mail.outbox[0].body)
+        self.assertIn('https://news.example.com/news/', mail.outbox[0].body)
+
+    def test_invalid_rows_skipped_with_line_numbers(self):
+        lines = [
+            {'title': 'Верная', 'content': 'Текст', 'categories': [self.categories[0].name]},
+            {'title': 'Невозможная дата', 'content': 'Текст', 'pub_date': '2024-13-45T10:00:00'},
+            {'title': 'Строка вместо списка', 'content': 'Текст', 'categories': self.categories[0].name},
+            {'title': ['не строка'], 'content': 'Текст'},
+            {'title': 'Тип', 'content': 'Текст', 'post_type': ['news']},
+        ]
+        file = io.StringIO('\n'.join(json.dumps(line, ensure_ascii=False) for line in lines) + '\n')
+        importer = PostImporter(batch_size=2)
+        stats = importer.run(read_rows(file, 'jsonl'))
+
+        self.assertEqual((stats['posts'], stats['links'], stats['skipped']), (1, 1, 4))
+        self.assertEqual([line for line, _ in importer.errors], [2, 3, 4, 5])
+        self.assertIn('pub_date', importer.errors[0][1])
+        self.assertIn('categories', importer.errors[1][1])
+        self.assertFalse(Category.objects.filter(name__in=['К', 'а']).exists())
+
+        # Строка JSONL не объект - ошибка формата с номером строки
+        with self.assertRaisesMessage(ImportDataError, 'Строка 2'):
+            list(read_rows(io.StringIO('{"title": "a"}\n[1, 2]\n'), 'jsonl'))
+        # Словари не из read_rows тоже проверяются
+        rows = ['строка', {'title': 'x', 'content': 'y', 'categories': 'xy'}]
+        self.assertEqual(PostImporter().run(rows)['skipped'], 2)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Отклоняет первые failures писем, остальные складывает в mail.outbox"""
+    failures = 0
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            FlakyEmailBackend.failures -= 1
+            raise smtplib.SMTPServerDisconnected('Соединение разорвано')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='news.tests.FlakyEmailBackend')
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        FlakyEmailBackend.failures = 0
+        mail.outbox = []
+
+    def messages(self, count):
+        return [outbox.message(f'test:{i}', f'user{i}@example.com', 'Тема', 'Текст') for i in range(count)]
+
+    def test_idempotent_enqueue_and_dispatch(self):
+        self.assertEqual(outbox.enqueue(self.messages(2)), 2)
+        # Возвращается число новых писем, известные ключи не считаются
+        self.assertEqual(outbox.enqueue(self.messages(2)), 0)
+        self.assertEqual(outbox.enqueue(self.messages(3) + self.messages(3)), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+        OutboxMessage.objects.filter(key='test:2').delete()
+
+        self.assertEqual(outbox.Dispatcher(pool_size=2, rate=0).run()['sent'], 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['user0@example.com', 'user1@example.com'])
+
+        # Повторно запущенный производитель и диспетчер ничего не отправляют второй раз
+        outbox.enqueue(self.messages(2))
+        self.assertEqual(outbox.Dispatcher(rate=0).run()['sent'], 0)
+        stats = outbox.stats()
+        self.assertEqual((stats['sent'], stats['pending'], stats['sent_total']), (2, 0, 2))
+        self.assertIn('news_outbox_messages{status="sent"} 2', metrics.outbox_metrics())
+
+    def test_dispatch_lock_and_deadline(self):
+        outbox.enqueue(self.messages(2))
+        # После deadline новые пачки не забираются
+        self.assertEqual(outbox.Dispatcher(rate=0).run(deadline=time.monotonic())['sent'], 0)
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.PENDING).count(), 2)
+
+        # Аренда в базе, а не в кеше: процесс со своим кешем не запустит второй диспетчер
+        lease = OutboxLease.objects.create(
+            name=outbox.DISPATCH_LEASE, token='other', expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        cache.clear()
+        self.assertEqual(dispatch_outbox(), 0)
+        self.assertEqual(OutboxLease.objects.get().token, 'other')
+
+        # Истекшую аренду упавшего диспетчера забирает следующий и снимает после работы
+        OutboxLease.objects.filter(pk=lease.pk).update(expires_at=timezone.now())
+        self.assertEqual(dispatch_outbox(), 2)
+        self.assertFalse(OutboxLease.objects.exists())
+
+        token = outbox.acquire_lease(60)
+        self.assertIsNone(outbox.acquire_lease(60))
+        self.assertIsNone(outbox.run_exclusive(outbox.Dispatcher(rate=0)))
+        # Снять аренду может только ее владелец
+        outbox.release_lease('other')
+        self.assertTrue(OutboxLease.objects.exists())
+        outbox.release_lease(token)
+        self.assertFalse(OutboxLease.objects.exists())
+
+    def test_retry_with_backoff(self):
+        outbox.enqueue(self.messages(1))
+        FlakyEmailBackend.failures = 1
+        self.assertEqual(outbox.Dispatcher(pool_size=1, rate=0).run()['retried'], 1)
+
+        row = OutboxMessage.objects.get()
+        self.assertEqual((row.status, row.attempts), (OutboxMessage.PENDING, 1))
+        self.assertIn('SMTPServerDisconnected', row.last_error)
+        self.assertGreater(row.next_attempt_at, timezone.now() + timedelta(seconds=outbox.retry_delay(1) - 5))
+        self.assertEqual(outbox.Dispatcher(rate=0).run()['sent'], 0)
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        FlakyEmailBackend.failures = 1
+        self.assertEqual(outbox.Dispatcher(rate=0, max_attempts=2).run()['failed'], 1)
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.FAILED)
+        self.assertEqual(mail.outbox, [])
+
+
+class WelcomeEmailTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_batched_after_commit(self):
+        mail.outbox = []
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for i in range(3):
+                    User.objects.create(username=f'new{i}', email=f'new{i}@example.com')
+            try:
+                with transaction.atomic():
+                    User.objects.create(username='rolled_back', email='rolled_back@example.com')
+                    raise OperationalError
+            except OperationalError:
+                pass
+            self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'new{i}@example.com' for i in range(3)])
+        self.assertIn('new0', mail.outbox[0].body)
+        self.assertEqual(OutboxMessage.objects.filter(key__startswith='welcome:').count(), 3)
+
+
+@override_settings(NEWS_SESSION_GROUP_CACHE=True)
+class GroupCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_author()
+
+    def can_create(self):
+        return self.client.get(reverse('news_create')).status_code == 200
+
+    def test_revoked_group_not_trusted_after_eviction(self):
+        self.client.force_login(self.author)
+        self.assertTrue(self.can_create())
+        # Группы взяты из сессии: запроса к auth_group нет
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(self.can_create())
+        self.assertFalse(any('auth_group' in query['sql'] for query in context.captured_queries))
+
+        # Отзыв без сигнала (другой процесс со своим кешем) и вытеснение версии
+        User.groups.through.objects.filter(user=self.author).delete()
+        cache.clear()
+        self.assertFalse(self.can_create())
+
+    def test_revoked_group_invalidates_session(self):
+        self.client.force_login(self.author)
+        self.assertTrue(self.can_create())
+        self.author.groups.clear()
+        self.assertFalse(self.can_create())
+
+
+class PublishTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.subscribers = make_users(2)
+        subscribe(self.subscribers, self.categories[:1])
+        self.client.force_login(self.author)
+        mail.outbox = []
+
+    def publish_batch(self, posts):
+        return self.client.post(reverse('publish_posts'), json.dumps({'posts': posts}), content_type='application/json')
+
+    def test_form_view_notifies_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('news_create'), {
+                'title': 'Новость', 'content': 'Текст', 'post_type': 'news',
+                'categories': [self.categories[0].id, self.categories[1].id],
+            })
+            self.assertEqual(mail.outbox, [])
+
+        post = Post.objects.get(title='Новость')
+        self.assertEqual(set(post.categories.values_list('id', flat=True)), {c.id for c in self.categories[:2]})
+        self.assertEqual(Category.objects.get(pk=self.categories[0].pk).post_count, 1)
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+
+    def test_batch_is_atomic_and_notifications_coalesced(self):
+        item = {'title': 'Пакет', 'content': 'Текст', 'post_type': 'article', 'categories': [self.categories[0].id]}
+        response = self.publish_batch([item, {**item, 'title': ''}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.json()['errors'])
+        self.assertFalse(Post.objects.exists())
+
+        # Окно автора уже занято: публикации только копятся до отложенной рассылки
+        cache.set(_author_window_key(self.author.id), 0, 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertMaxQueries(13):
+                response = self.publish_batch([item, item])
+        self.assertEqual(response.status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publish_batch([item])
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(PendingNotification.objects.count(), 3)
+
+        # Пост автора в обход publish (импорт) в рассылку окна не попадает
+        Post.objects.create(title='Импорт', content='Текст', post_type='news', author=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            send_author_notifications.delay(self.author.id)
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+        self.assertIn('новых статей: 3', mail.outbox[0].body)
+        self.assertNotIn('Импорт', mail.outbox[0].body)
+        self.assertFalse(PendingNotification.objects.exists())
+
+        # Следующее окно (в тестах задачи выполняются сразу) сообщает только о новой публикации
+        mail.outbox = []
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publish_batch([{**item, 'title': 'Позже'}])
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+        self.assertIn('Позже', mail.outbox[0].subject)
+
+    def test_worker_with_own_cache_sends_pending_notifications(self):
+        item = {'title': 'Пакет', 'content': 'Текст', 'post_type': 'article', 'categories': [self.categories[0].id]}
+        cache.set(_author_window_key(self.author.id), 0, 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publish_batch([item, item])
+        # Кеш воркера (LocMemCache другого процесса) ничего не знает о публикациях
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            send_author_notifications.delay(self.author.id)
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+        self.assertIn('новых статей: 2', mail.outbox[0].body)
+
+        mail.outbox = []
+        self.assertEqual(send_author_notifications(self.author.id), "Нет новых публикаций автора")
+        self.assertEqual(mail.outbox, [])
+
+
+class StaticFilesTests(TestCase):
+    def test_precompressed_hashed_static(self):
+        css = b'body { color: #333; margin: 0 auto; }\n' * 200
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, DEBUG=False):
+            Path(root, 'css').mkdir()
+            Path(root, 'css', 'site.css').write_bytes(css)
+            storage = staticfiles.CompressedManifestStaticFilesStorage()
+            list(storage.post_process({'css/site.css': (storage, 'css/site.css')}))
+            hashed = storage.stored_name('css/site.css')
+            self.assertNotEqual(hashed, 'css/site.css')
+            self.assertTrue(Path(root, hashed + '.gz').exists())
+            # Ссылка на файл, которого нет, не ломает шаблон
+            self.assertEqual(static('js/missing.js'), '/static/js/missing.js')
+
+            response = self.client.get('/static/' + hashed, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response['Cache-Control'], staticfiles.IMMUTABLE)
+            self.assertEqual(gzip.decompress(response.content), css)
+
+            response = self.client.get('/static/css/site.css')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+            self.assertEqual(response.content, css)
+            response = self.client.get('/static/css/site.css', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_debug_passes_static_through(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, DEBUG=True):
+            Path(root, 'css').mkdir()
+            Path(root, 'css', 'site.css').write_bytes(b'body { color: red; }\n')
+            # Устаревшая копия из STATIC_ROOT не отдается вместо исходного файла
+            response = self.client.get('/static/css/site.css')
+            self.assertEqual(response.status_code, 404)
+            self.assertFalse(response.has_header('ETag'))
+
+            self.assertEqual(self.client.get('/static/css/site.css.gz').status_code, 404)
+            self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
@@ -1,16 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Публичные страницы для чтения: под ASGI - асинхронные версии
+public_views = async_views if settings.NEWS_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Основные страницы
-    path('', views.news_list, name='news_list'),  # /news/
-    path('<int:news_id>/', views.news_detail, name='news_detail'),  # /news/1/
-    path('search/', views.news_search, name='news_search'),  # /news/search/
+    path('', public_views.news_list, name='news_list'),  # /news/
+    path('<int:news_id>/', public_views.news_detail, name='news_detail'),  # /news/1/
+    path('search/', public_views.news_search, name='news_search'),  # /news/search/
 
     # Дублирующие пути для совместимости (добавленные из второго фрагмента)
-    path('news/', views.news_list, name='news_list'),  # /news/news/
-    path('news/<int:news_id>/', views.news_detail, name='news_detail'),  # /news/news/1/
-    path('news/search/', views.news_search, name='news_search'),  # /news/news/search/
+    path('news/', public_views.news_list, name='news_list'),  # /news/news/
+    path('news/<int:news_id>/', public_views.news_detail, name='news_detail'),  # /news/news/1/
+    path('news/search/', public_views.news_search, name='news_search'),  # /news/news/search/
 
     # CRUD для новостей
     path('create/', views.news_create, name='news_create'),  # /news/create/
@@ -22,12 +26,22 @@ urlpatterns = [
     path('articles/<int:pk>/edit/', views.post_edit, name='article_edit'),  # /news/articles/1/edit/
     path('articles/<int:pk>/delete/', views.post_delete, name='article_delete'),  # /news/articles/1/delete/
 
+    # Пакетная публикация (JSON)
+    path('publish/', views.publish_posts, name='publish_posts'),
+
     # Профиль
     path('profile/edit/', views.profile_edit, name='profile_edit'),  # /news/profile/edit/
     path('become-author/', views.become_author, name='become_author'),  # /news/become-author/
 
-    path('categories/', views.category_list, name='category_list'),
+    path('categories/', public_views.category_list, name='category_list'),
     path('categories/<int:category_id>/subscribe/', views.subscribe_category, name='subscribe_category'),
     path('categories/<int:category_id>/unsubscribe/', views.unsubscribe_category, name='unsubscribe_category'),
 
+    # Выгрузка для аналитики (только персонал)
+    path('export/<slug:dataset>/', views.export_data, name='export_data'),
+
+    # Ленты RSS, Atom и JSON Feed
+    path('feed/<slug:fmt>/', views.post_feed, name='feed'),
+    path('categories/<int:category_id>/feed/<slug:fmt>/', views.post_feed, name='category_feed'),
+
 ]
\ No newline at end of file
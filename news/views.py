@@ -1,15 +1,30 @@
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
 from django.views.generic import View
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import Post, Category, Subscription, PostCategory
-from .forms import PostForm, NewsSearchForm, UserEditForm
+from .models import Post, Category, Subscription, PostCategory, RelatedPost
+from . import counters, export, feeds, services
+from .cache import (
+    LIST_VERSION, RANKING_VERSION, anonymous_page_cache, list_etag, list_last_modified, post_etag, post_last_modified,
+    post_version,
+)
+from .forms import PostForm, NewsSearchForm, PublishPostForm, UserEditForm
+from .groups import get_group_names
+from .pageviews import count_views
+from .pagination import CursorPaginator, RankedPaginator
+from .search import get_backend as get_search_backend
 from django.views import View
 from django.shortcuts import redirect, render, get_object_or_404
 from allauth.socialaccount.providers.yandex.views import YandexOAuth2Adapter
@@ -17,9 +32,23 @@ from allauth.socialaccount.providers.oauth2.views import OAuth2LoginView
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 
 
+# Поля, которые выводятся в карточках списков публикаций
+POST_CARD_FIELDS = ('id', 'title', 'content', 'pub_date', 'post_type', 'author__id', 'author__username')
+
+
+def post_cards():
+    """Публикации для списков: автор подтягивается тем же запросом"""
+    return Post.objects.select_related('author').only(*POST_CARD_FIELDS)
+
+
+def related_posts(post_id):
+    """Готовые похожие публикации (news/related.py): один запрос по индексу пары"""
+    return RelatedPost.objects.filter(post_id=post_id).order_by('-score').values('related_id', 'related__title')
+
+
 def is_author(user):
     """Проверяет, находится ли пользователь в группе authors"""
-    return user.groups.filter(name='authors').exists()
+    return 'authors' in get_group_names(user)
 
 
 def send_new_post_notification(post):
@@ -63,38 +92,99 @@ def send_new_post_notification(post):
         print(f"DEBUG: Ошибка при отправке уведомлений: {str(e)}")
 
 
+@cache_control(no_cache=True)
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
+@anonymous_page_cache(lambda request: [LIST_VERSION, RANKING_VERSION])
 def news_list(request):
-    news_items = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(news_items, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'news/news_list.html', {'page_obj': page_obj})
+    # Общее количество читается из счетчика, а не через COUNT(*)
+    paginator = CursorPaginator(post_cards(), 10, count=counters.get_value(counters.POSTS_TOTAL))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'news/news_list.html', {
+        'page_obj': page_obj,
+        'cache_timeout': settings.NEWS_CACHE_TIMEOUT,
+    })
 
 
+@count_views(lambda request, news_id: news_id)
+@cache_control(no_cache=True)
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+@anonymous_page_cache(lambda request, news_id: [post_version(news_id)])
 def news_detail(request, news_id):
     news = get_object_or_404(Post, id=news_id)  # Используем id, а не pk
-    return render(request, 'news/news_detail.html', {'news': news})
+    return render(request, 'news/news_detail.html', {
+        'news': news,
+        'related_posts': list(related_posts(news_id)),
+        'cache_timeout': settings.NEWS_CACHE_TIMEOUT,
+    })
+
+
+def post_feed(request, fmt, category_id=None):
+    """Готовая лента из кеша: одно чтение кеша на запрос, поддерживает условный GET и готовое сжатие"""
+    if fmt not in feeds.FORMATS:
+        raise Http404('Неизвестный формат ленты')
+    scope = feeds.ALL if category_id is None else feeds.category_scope(category_id)
+    entry = feeds.get(scope, fmt)
+    if entry is None:
+        raise Http404('Категория не найдена')
+
+    last_modified = int(entry['last_modified'].timestamp())
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry['body'], content_type=entry['content_type'])
+        if 'encoded' in entry:
+            response.precompressed = entry['encoded']
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+@staff_member_required
+def export_data(request, dataset):
+    """Потоковая выгрузка для аналитики: ?format=ndjson|csv&since=2024-01-01&gzip=1"""
+    fmt = request.GET.get('format', 'ndjson')
+    if dataset not in export.DATASETS or fmt not in export.FORMATS:
+        raise Http404('Неизвестная выгрузка')
+    try:
+        since = export.parse_since(request.GET.get('since'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    response = StreamingHttpResponse(
+        export.stream(dataset, fmt, since, compress),
+        content_type='application/gzip' if compress else export.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export.filename(dataset, fmt, compress)}"'
+    return response
 
 
 def news_search(request):
     form = NewsSearchForm(request.GET or None)
-    news_items = Post.objects.all().order_by('-pub_date')
+    news_items = post_cards().order_by('-pub_date')
+    ranked_ids = None
 
     if form.is_valid():
         title = form.cleaned_data.get('title')
         author = form.cleaned_data.get('author')
         date_after = form.cleaned_data.get('date_after')
 
-        if title:
-            news_items = news_items.filter(title__icontains=title)
         if author:
             news_items = news_items.filter(author__username__icontains=author)
         if date_after:
             news_items = news_items.filter(pub_date__gte=date_after)
+        if title:
+            # Полнотекстовый поиск по заголовку и содержанию, результаты по релевантности
+            # Фильтры автора и даты применяются в самом запросе, до ограничения числа результатов
+            ranked_ids = get_search_backend().search(
+                title, limit=settings.NEWS_SEARCH_MAX_RESULTS, posts=news_items if author or date_after else None,
+            )
 
-    paginator = Paginator(news_items, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if ranked_ids is not None:
+        paginator = RankedPaginator(ranked_ids, 10, fetch=post_cards().in_bulk)
+    else:
+        paginator = CursorPaginator(news_items, 10, with_count=settings.NEWS_PAGINATOR_EXACT_COUNT)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'news/news_search.html', {
         'form': form,
@@ -137,20 +227,10 @@ def post_create(request, post_type):
         form = PostForm(request.POST)
 
         if form.is_valid():
-            # Сохраняем пост
             post = form.save(commit=False)
-            post.author = request.user
             post.post_type = post_type
-            post.save()
-
-            # Создаем связи с категориями
-            selected_categories = form.cleaned_data['categories']
-            for category in selected_categories:
-                PostCategory.objects.create(post=post, category=category)
-
-            # ✅ ЗАПУСКАЕМ АСИНХРОННУЮ РАССЫЛКУ ЧЕРЕЗ CELERY
-            from .tasks import send_new_post_notification
-            send_new_post_notification.delay(post.id)
+            # Пост и категории сохраняются одной транзакцией, рассылка ставится после фиксации
+            services.publish([(post, form.cleaned_data['categories'])], author=request.user)
 
             messages.success(request, 'Публикация успешно создана!')
             return redirect('news_list')
@@ -161,6 +241,41 @@ def post_create(request, post_type):
     title = 'Создание новости' if post_type == 'news' else 'Создание статьи'
     return render(request, 'news/post_form.html', {'form': form, 'title': title})
 
+@login_required
+@require_POST
+def publish_posts(request):
+    """Пакетная публикация для авторов: JSON {"posts": [{title, content, post_type, categories}]}
+
+    Все публикации пакета сохраняются одной транзакцией или ни одна;
+    подписчики получают одну рассылку на пакет.
+    """
+    if not is_author(request.user):
+        return JsonResponse({'error': 'Только авторы могут создавать публикации'}, status=403)
+    try:
+        items = json.loads(request.body)['posts']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ожидается JSON с полем posts'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'posts должен быть непустым списком'}, status=400)
+    if len(items) > settings.NEWS_PUBLISH_MAX_POSTS:
+        return JsonResponse({'error': f'Не больше {settings.NEWS_PUBLISH_MAX_POSTS} публикаций за раз'}, status=400)
+
+    choices = [(str(pk), name) for pk, name in Category.objects.values_list('id', 'name')]
+    forms = [
+        PublishPostForm(item if isinstance(item, dict) else {}, category_choices=choices)
+        for item in items
+    ]
+    errors = {index: form.errors.get_json_data() for index, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    posts = services.publish(
+        [(form.save(commit=False), form.cleaned_data['categories']) for form in forms],
+        author=request.user,
+    )
+    return JsonResponse({'ids': [post.id for post in posts]}, status=201)
+
+
 @login_required
 def post_edit(request, pk):
     post = get_object_or_404(Post, pk=pk)
@@ -173,7 +288,7 @@ def post_edit(request, pk):
     if request.method == 'POST':
         form = PostForm(request.POST, instance=post)
         if form.is_valid():
-            form.save()
+            services.update_post(form.save(commit=False), form.cleaned_data['categories'])
             messages.success(request, 'Публикация успешно обновлена!')
             return redirect('news_list')
     else:
@@ -0,0 +1,74 @@
+# news/welcome.py
+"""Приветственные письма новым пользователям.
+
+Сигнал post_save пользователя только запоминает id, а письма ставятся в
+outbox после фиксации транзакции одной вставкой на транзакцию: массовое
+создание пользователей (импорт, пачка социальных регистраций) дает один
+INSERT, а откатившаяся регистрация - ни одного письма. Диспетчер outbox
+запускается с задержкой NEWS_WELCOME_BATCH_WINDOW, поэтому регистрации за
+это окно уходят одной пачкой через постоянные SMTP-соединения, и запрос
+регистрации не ждет брокер.
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import outbox
+
+_pending = threading.local()
+
+SUBJECT = 'Добро пожаловать на Новостной портал!'
+
+
+def _body(username):
+    return f'''
+Здравствуйте, {username}!
+
+Добро пожаловать на наш Новостной портал!
+
+Теперь вы можете:
+• Читать новости и статьи
+• Подписываться на интересующие категории
+• Получать уведомления о новых публикациях
+• Комментировать материалы (если станете автором)
+
+Для начала работы посетите наш сайт:
+{settings.NEWS_SITE_URL.rstrip('/')}/
+
+С уважением,
+Команда Новостного портала
+'''
+
+
+def queue(user_ids):
+    """Ставит письма в outbox сразу, возвращает их количество
+
+    Пользователи из откатившихся транзакций и без email пропускаются.
+    """
+    users = User.objects.filter(id__in=user_ids).exclude(email='').values_list('id', 'username', 'email')
+    count = outbox.enqueue(outbox.message(f'welcome:{user_id}', email, SUBJECT, _body(username))
+                           for user_id, username, email in users)
+    if count:
+        from .tasks import schedule_dispatch
+        schedule_dispatch(getattr(settings, 'NEWS_WELCOME_BATCH_WINDOW', 5))
+    return count
+
+
+def _flush():
+    user_ids, _pending.user_ids = getattr(_pending, 'user_ids', set()), set()
+    if user_ids:
+        queue(sorted(user_ids))
+
+
+def schedule(user_ids):
+    """Ставит письма после фиксации транзакции, одной вставкой на транзакцию
+
+    Как и в feeds.schedule, колбэки транзакции разбирают общий набор:
+    первый ставит письма всем накопленным пользователям.
+    """
+    if not hasattr(_pending, 'user_ids'):
+        _pending.user_ids = set()
+    _pending.user_ids.update(user_ids)
+    transaction.on_commit(_flush)
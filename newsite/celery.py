@@ -13,6 +13,21 @@ app.conf.beat_schedule = {
         'task': 'news.tasks.send_weekly_digest',
         'schedule': crontab(hour=8, minute=0, day_of_week=1),  # Каждый понедельник в 8:00
     },
+    # Повторы и письма, поставленные, пока диспетчер был занят
+    'dispatch-outbox': {
+        'task': 'news.tasks.dispatch_outbox',
+        'schedule': 30.0,
+    },
+    # Просмотры публикаций из кеша в базу и рейтинг самых читаемых
+    'flush-post-views': {
+        'task': 'news.tasks.flush_post_views',
+        'schedule': 60.0,
+    },
+    # Полная пересборка похожих публикаций: новые слова в словаре и пропущенные обновления
+    'rebuild-related-posts': {
+        'task': 'news.tasks.rebuild_related_posts',
+        'schedule': crontab(hour=3, minute=30),
+    },
 }
 
 app.autodiscover_tasks()
\ No newline at end of file
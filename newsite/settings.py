@@ -47,7 +47,10 @@ SOCIALACCOUNT_PROVIDERS = {
 SOCIALACCOUNT_URL_PREFIX = 'social/'
 
 MIDDLEWARE = [
+    'news.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'news.staticfiles.PrecompressedStaticMiddleware',
+    'news.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,13 +58,15 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'news.middleware.UserGroupsMiddleware',
 ]
 
 ROOT_URLCONF = 'newsite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Стандартный бэкенд с замером времени рендеринга для Server-Timing
+        'BACKEND': 'news.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -81,10 +86,49 @@ WSGI_APPLICATION = 'newsite.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Соединение переиспользуется между запросами, перед повторным
+        # использованием проверяется его работоспособность
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Транзакции сразу берут блокировку записи, иначе повышение
+            # блокировки чтения до записи в WAL падает без ожидания busy_timeout
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Кеш: локальная память по умолчанию, Redis при заданном REDIS_CACHE_URL
+# или файловый кеш при заданном CACHE_DIR
+if os.getenv('REDIS_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_CACHE_URL'),
+            'KEY_PREFIX': 'news',
+        }
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+            'KEY_PREFIX': 'news',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'news',
+            'KEY_PREFIX': 'news',
+        }
+    }
+
+# Время жизни закешированных страниц и фрагментов публикаций (секунды)
+NEWS_CACHE_TIMEOUT = 600
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -112,7 +156,13 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Для production
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))  # Для production
+
+# collectstatic добавляет хеш содержимого в имена файлов и готовит .gz/.br (news/staticfiles.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'news.staticfiles.CompressedManifestStaticFilesStorage'},
+}
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -187,9 +237,11 @@ GROUP_PERMISSIONS = {
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.yandex.ru'
-EMAIL_PORT = 465
-EMAIL_USE_SSL = True
+# Для проверки рассылок локально: EMAIL_HOST=127.0.0.1 EMAIL_PORT=1025 EMAIL_USE_SSL=0 (см. команду smtp_sink)
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.yandex.ru')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 465))
+EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', '1') == '1'
+EMAIL_TIMEOUT = 30
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
@@ -209,4 +261,97 @@ CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'Europe/Moscow'
\ No newline at end of file
+CELERY_TIMEZONE = 'Europe/Moscow'
+
+# Размер пачки получателей в одной подзадаче рассылки уведомлений
+NEWS_NOTIFICATION_CHUNK_SIZE = 100
+
+# Размер пачки пользователей в одной подзадаче еженедельной рассылки
+NEWS_DIGEST_CHUNK_SIZE = 500
+
+# Фильтр censor: словарь news.censor.DEFAULT_CENSORED_WORDS (или CENSORED_WORDS)
+# дополняется словами из модели CensoredWord; версия словаря в кеше
+# проверяется не чаще раза в CENSOR_RELOAD_INTERVAL секунд
+CENSOR_RELOAD_INTERVAL = 30
+
+# Полнотекстовый поиск: news.search.SQLiteFTSBackend (FTS5) или
+# news.search.DatabaseSearchBackend для баз без полнотекстового индекса
+NEWS_SEARCH_BACKEND = 'news.search.SQLiteFTSBackend'
+NEWS_SEARCH_MAX_RESULTS = 1000
+
+# Считать ли точное количество публикаций при пагинации (COUNT по всей таблице)
+NEWS_PAGINATOR_EXACT_COUNT = False
+
+# Хранить группы пользователя в сессии между запросами (news.middleware.UserGroupsMiddleware).
+# Отзыв группы доходит до всех процессов только через общий кеш, поэтому с
+# LocMemCache группы каждый запрос читаются из базы
+NEWS_SESSION_GROUP_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# Заголовок Server-Timing с временем SQL, шаблонов и попаданиями в кеш
+NEWS_SERVER_TIMING = True
+# /metrics открыт сотрудникам; если задан токен - запросам с заголовком
+# Authorization: Bearer <токен>, иначе - адресам и сетям из NEWS_METRICS_ALLOWED_IPS
+NEWS_METRICS_TOKEN = os.getenv('NEWS_METRICS_TOKEN', '')
+NEWS_METRICS_ALLOWED_IPS = [
+    network.strip() for network in os.getenv('NEWS_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if network.strip()
+]
+
+# PRAGMA для каждого нового соединения SQLite (см. news.db.DEFAULT_PRAGMAS)
+NEWS_SQLITE_PRAGMAS = {}
+# Повторы операций записи при "database is locked"
+NEWS_DB_LOCK_RETRIES = 3
+NEWS_DB_LOCK_RETRY_DELAY = 0.05
+
+# Асинхронные версии публичных страниц (news.async_views); newsite/asgi.py включает их по умолчанию
+NEWS_ASYNC_VIEWS = os.getenv('NEWS_ASYNC_VIEWS', '') == '1'
+
+# Адрес сайта для абсолютных ссылок в лентах и письмах
+NEWS_SITE_URL = os.getenv('SITE_URL', 'http://127.0.0.1:8000')
+# Количество публикаций в лентах RSS, Atom и JSON Feed (news.feeds)
+NEWS_FEED_SIZE = 20
+
+# Размер пачки строк при потоковой выгрузке (news.export)
+NEWS_EXPORT_BATCH_SIZE = 2000
+
+# Очередь писем (news.outbox): потоков с постоянным SMTP-соединением,
+# писем в секунду на все воркеры (0 - без ограничения), писем за один claim,
+# попыток до статуса failed, базовая задержка повтора (удваивается) и аренда в секундах
+NEWS_OUTBOX_POOL_SIZE = 4
+NEWS_OUTBOX_RATE = 10
+NEWS_OUTBOX_BATCH_SIZE = 100
+NEWS_OUTBOX_MAX_ATTEMPTS = 5
+NEWS_OUTBOX_RETRY_DELAY = 30
+NEWS_OUTBOX_LEASE = 300
+# Окно (в секундах), за которое приветственные письма собираются в одну отправку (news.welcome)
+NEWS_WELCOME_BATCH_WINDOW = 5
+
+# Рассылки о публикациях одного автора за это окно (в секундах) объединяются в одну
+NEWS_NOTIFICATION_COALESCE_WINDOW = 60
+# Максимум публикаций в одном запросе пакетной публикации (/publish/)
+NEWS_PUBLISH_MAX_POSTS = 50
+
+# Статика без хеша в имени кешируется браузером на столько секунд (с хешем - на год);
+# файлы до NEWS_STATIC_MEMORY_LIMIT байт PrecompressedStaticMiddleware держит в памяти
+NEWS_STATIC_MAX_AGE = 3600
+NEWS_STATIC_MEMORY_LIMIT = 512 * 1024
+
+# Минификация HTML и сжатие ответов br/gzip (news/compression.py); ответы меньше
+# NEWS_COMPRESSION_MIN_SIZE байт отдаются без сжатия
+NEWS_HTML_MINIFY = True
+NEWS_COMPRESSION_MIN_SIZE = 200
+
+# Просмотры публикаций (news/pageviews.py): буфер процесса уходит в кеш каждые
+# NEWS_VIEWS_PUSH_SIZE просмотров или NEWS_VIEWS_PUSH_INTERVAL секунд, часовые
+# корзины хранятся NEWS_VIEWS_RETENTION_DAYS дней; в виджете NEWS_MOST_READ_LIMIT публикаций
+NEWS_VIEWS_PUSH_SIZE = 100
+NEWS_VIEWS_PUSH_INTERVAL = 10
+NEWS_VIEWS_RETENTION_DAYS = 30
+# Пачки просмотров доходят до воркера только через общий кеш; с LocMemCache
+# веб-процесс сам складывает каждую пачку в PostView (news.pageviews.push)
+NEWS_VIEWS_VIA_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+NEWS_MOST_READ_LIMIT = 5
+
+# Похожие публикации (news/related.py, нужны numpy и scipy): сколько выводить на
+# странице публикации и где хранить словарь и матрицу TF-IDF между пересборками
+NEWS_RELATED_COUNT = 5
+NEWS_RELATED_INDEX = os.getenv('NEWS_RELATED_INDEX', os.path.join(BASE_DIR, 'related_index.npz'))
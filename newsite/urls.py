@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
+from news.metrics import metrics_view
 from news.views import ImmediateYandexView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('accounts/yandex/immediate/', ImmediateYandexView.as_view(), name='yandex_immediate'),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('news.urls')),
 ]
\ No newline at end of file